@@ -1,55 +1,233 @@
-from ast import Return
-import math
+import numpy as np
+
+# Número de puntos de la malla facial de MediaPipe
+NUM_PUNTOS_MALLA = 468
+# Índices de la malla usados en el análisis
+PUNTO_ROSTRO_IZQUIERDO = 93
+PUNTO_ROSTRO_DERECHO = 323
+PUNTOS_OJO_IZQUIERDO = (159, 145) # Párpado superior, párpado inferior
+PUNTOS_OJO_DERECHO = (374, 386) # Párpado inferior, párpado superior
+# Seis puntos por ojo para la relación de aspecto del ojo (EAR), en el orden p1..p6:
+# comisura externa, dos del párpado superior, comisura interna, dos del párpado inferior.
+PUNTOS_EAR_IZQUIERDO = (33, 160, 158, 133, 153, 144)
+PUNTOS_EAR_DERECHO = (263, 387, 385, 362, 380, 373)
+# EAR por debajo del cual el ojo se considera cerrado si el conductor no está calibrado
+UMBRAL_EAR = 0.2
+
+# Puntos del EAR de ambos ojos, (2, 6)
+_INDICES_EAR = np.array([PUNTOS_EAR_IZQUIERDO, PUNTOS_EAR_DERECHO])
 
 class AnalisisFacial:
-     
-    longitudes=None
+    """
+    Calcula la apertura de los ojos a partir de los puntos de la malla facial.
+
+    Se crea una sola instancia y se le pasa en cada frame un arreglo (468, 2) con las
+    coordenadas x, y en píxeles, o un lote (N, 468, 2) para analizar varios frames a la vez.
+    """
+
     listaPuntosFaciales=None
-    longitudOjoIzquierdo=None
-    longitudOjoDerecho=None
  
     emocion=None
 
-    def __init__(self,listaPuntosFaciales) :  
+    def __init__(self,listaPuntosFaciales=None) :  
        self.listaPuntosFaciales=listaPuntosFaciales
 
-    def getLongitudes(self):
-        xpuntaRostro1,yPuntaRostro1=self.listaPuntosFaciales[93][1:]
-        xpuntaRostro2,yPuntaRostro2=self.listaPuntosFaciales[323][1:]
-        self.longitudRostro=math.hypot(xpuntaRostro1-xpuntaRostro2,yPuntaRostro1-yPuntaRostro2)
-        #print(f"Longitud Rostro {longitudRostro}")
-        #Trabajamos con proporciones 240 es el 100%
-        porcentaje=self.longitudRostro/240
-        #print(f"Porcentaje {int(porcentaje*100)}% Decimal {int(porcentaje*100)}")
-        #print(f"Tamaño rostro proporcional {self.longitudRostro/porcentaje}")
-        #Segun el identificador tomamos coordenadas en x,y ([n:] desde la posicion n en adelante)
-
-        x1OjoIzquierdo,y1OjoIzquierdo=self.listaPuntosFaciales[159][1:]
-        x2OjoIzquierdo,y2OjoIzquierdo=self.listaPuntosFaciales[145][1:]
-        #Devuelve la norma de un vector es decir distancia entre dos puntos
-        self.longitudOjoIzquierdo=abs(math.hypot(x2OjoIzquierdo-x1OjoIzquierdo,y2OjoIzquierdo-y1OjoIzquierdo)/porcentaje)
-        #print(f"Longitud Ojo Izquierdo:{self.longitudOjoIzquierdo}")
-        x1OjoDerecho,y1OjoDerecho=self.listaPuntosFaciales[374][1:]
-        x2OjoDerecho,y2OjoDerecho=self.listaPuntosFaciales[386][1:]
-        #Devuelve la norma de un vector es decir distancia entre dos puntos
-        self.longitudOjoDerecho=abs(math.hypot(x2OjoDerecho-x1OjoDerecho,y2OjoDerecho-y1OjoDerecho)/porcentaje)
-        #print(f"Longitud Ojo Derecho:{self.longitudOjoDerecho}")
-        
-        if self.longitudOjoIzquierdo<=12:
-            escalaLongitudOjoIzquierdo="ojoI_cerrado" 
-        elif  self.longitudOjoIzquierdo>10:  
-             escalaLongitudOjoIzquierdo="ojoI_abierto"    
-
-        if self.longitudOjoDerecho<=12:
-            escalaLongitudOjoDerecho="ojoD_cerrado"  
-        elif self.longitudOjoDerecho>10:  
-             escalaLongitudOjoDerecho="ojoD_abierto"
-      
-        return self.analisisSueño(escalaLongitudOjoDerecho,escalaLongitudOjoIzquierdo)
-
-    def analisisSueño(self,escalaLongitudOjoDerecho,escalaLongitudOjoIzquierdo):
-        if (escalaLongitudOjoDerecho=="ojoD_cerrado"):
-            return "yes"
-        if (escalaLongitudOjoIzquierdo=="ojoI_cerrado"):
-            return "yes"    
-        return "no"
\ No newline at end of file
+    @staticmethod
+    def aArreglo(puntos):
+        """
+        Convierte los puntos al formato (..., 468, 2).
+        Acepta también la lista antigua de [id, x, y] por punto.
+        """
+        arreglo=np.asarray(puntos,dtype=np.float32)
+        if arreglo.shape[-1]==3:
+            arreglo=arreglo[...,1:]
+        return arreglo
+
+    def calcularEAR(self,puntos):
+        """
+        Calcula la relación de aspecto de cada ojo:
+        EAR = (|p2-p6| + |p3-p5|) / (2 |p1-p4|).
+        No depende de la distancia a la cámara porque se divide por el ancho del propio ojo.
+
+        Args:
+            puntos (np.ndarray): Arreglo (468, 2) o lote (N, 468, 2) de coordenadas en píxeles.
+
+        Returns:
+            tuple: (earIzquierdo, earDerecho), escalares o arreglos (N,).
+        """
+        puntos=self.aArreglo(puntos)
+        ojos=puntos[...,_INDICES_EAR,:] # (..., 2, 6, 2)
+        vertical=(np.linalg.norm(ojos[...,1,:]-ojos[...,5,:],axis=-1)
+                  +np.linalg.norm(ojos[...,2,:]-ojos[...,4,:],axis=-1))
+        horizontal=np.linalg.norm(ojos[...,0,:]-ojos[...,3,:],axis=-1)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            ear=vertical/(2*horizontal)
+        return ear[...,0],ear[...,1]
+
+    def calcularAnchoRostro(self,puntos):
+        """
+        Ancho del rostro en píxeles (entre PUNTO_ROSTRO_IZQUIERDO y PUNTO_ROSTRO_DERECHO).
+        """
+        puntos=self.aArreglo(puntos)
+        diferencia=puntos[...,PUNTO_ROSTRO_IZQUIERDO,:]-puntos[...,PUNTO_ROSTRO_DERECHO,:]
+        return np.sqrt(np.einsum('...i,...i->...',diferencia,diferencia))
+
+
+class IndicadoresOjos:
+    """
+    EAR suavizado y PERCLOS (proporción del tiempo con los ojos cerrados) en una ventana deslizante.
+
+    Ambos se actualizan en O(1) por frame con buffers de tamaño fijo y sumas acumuladas:
+    el EAR es la media de los últimos `frames_suavizado` valores y el PERCLOS se lleva en
+    casillas de `resolucion_perclos` segundos que se vacían a medida que salen de la ventana.
+    """
+    ear=None # Último EAR suavizado
+    perclos=0.0
+    ojos_cerrados=None # Estado del último frame medido; None sin rostro
+
+    def __init__(self,umbral_ear=UMBRAL_EAR,frames_suavizado=3,ventana_perclos=60.0,resolucion_perclos=1.0):
+        """
+        Args:
+            umbral_ear (float): EAR por debajo del cual los ojos se consideran cerrados.
+            frames_suavizado (int): Frames promediados para el EAR.
+            ventana_perclos (float): Duración de la ventana del PERCLOS en segundos.
+            resolucion_perclos (float): Tamaño en segundos de cada casilla de la ventana.
+        """
+        self.umbral_ear=umbral_ear
+        self._ears=[0.0]*max(1,frames_suavizado)
+        self._posicion_ear=0
+        self._cantidad_ear=0
+        self._suma_ear=0.0
+        self.resolucion_perclos=resolucion_perclos
+        casillas=max(1,int(round(ventana_perclos/resolucion_perclos)))
+        self._cerrados=[0]*casillas
+        self._totales=[0]*casillas
+        self._suma_cerrados=0
+        self._suma_totales=0
+        self._casilla=None # Número absoluto de la casilla del último frame
+        self.ear=None
+        self.perclos=0.0
+        self.ojos_cerrados=None
+
+    def actualizar(self,ear,tiempo):
+        """
+        Registra el EAR de un frame.
+
+        Args:
+            ear (float or None): EAR del frame, o None si no hubo rostro (solo avanza la ventana).
+            tiempo (float): Marca de tiempo del frame en segundos.
+
+        Returns:
+            tuple: (ear_suavizado, ojos_cerrados, perclos)
+        """
+        self._avanzar(tiempo)
+        if ear is None:
+            self.ojos_cerrados=None
+            return None,False,self.perclos
+
+        if self._cantidad_ear==len(self._ears):
+            self._suma_ear-=self._ears[self._posicion_ear]
+        else:
+            self._cantidad_ear+=1
+        self._ears[self._posicion_ear]=ear
+        self._suma_ear+=ear
+        self._posicion_ear=(self._posicion_ear+1)%len(self._ears)
+        self.ear=self._suma_ear/self._cantidad_ear
+
+        self.ojos_cerrados=self.ear<self.umbral_ear
+        self._contar(self.ojos_cerrados)
+        return self.ear,self.ojos_cerrados,self.perclos
+
+    def repetir(self,tiempo):
+        """
+        Registra un frame que no se midió (el planificador reutiliza el último resultado): cuenta
+        para el PERCLOS con el último estado de los ojos, sin tocar el EAR suavizado. Si el
+        último frame medido no tenía rostro solo avanza la ventana.
+
+        Returns:
+            float: PERCLOS.
+        """
+        self._avanzar(tiempo)
+        if self.ojos_cerrados is not None:
+            self._contar(self.ojos_cerrados)
+        return self.perclos
+
+    def _contar(self,cerrados):
+        indice=self._casilla%len(self._totales)
+        self._cerrados[indice]+=cerrados
+        self._totales[indice]+=1
+        self._suma_cerrados+=cerrados
+        self._suma_totales+=1
+        self.perclos=self._suma_cerrados/self._suma_totales
+
+    def _avanzar(self,tiempo):
+        casilla=int(tiempo//self.resolucion_perclos)
+        if self._casilla is None:
+            self._casilla=casilla
+            return
+        # Vaciar las casillas que salen de la ventana (a lo sumo una vuelta completa)
+        pasos=min(casilla-self._casilla,len(self._totales))
+        for paso in range(1,pasos+1):
+            indice=(self._casilla+paso)%len(self._totales)
+            self._suma_cerrados-=self._cerrados[indice]
+            self._suma_totales-=self._totales[indice]
+            self._cerrados[indice]=0
+            self._totales[indice]=0
+        if casilla>self._casilla:
+            self._casilla=casilla
+            self.perclos=self._suma_cerrados/self._suma_totales if self._suma_totales else 0.0
+
+
+class TemporizadorSomnolencia:
+    """
+    Lleva la cuenta del tiempo que los ojos permanecen cerrados y decide cuándo
+    activar o desactivar la alerta de somnolencia.
+    """
+    umbral_tiempo=1.0
+    inicio_cerrado=None # Marca de tiempo de cuando se cerraron los ojos por primera vez
+    alerta_activa=False # Estado actual de la alerta de somnolencia
+
+    def __init__(self,umbral_tiempo=1.0):
+        """
+        Args:
+            umbral_tiempo (float): Segundos que los ojos deben estar cerrados para activar la alerta.
+        """
+        self.umbral_tiempo=umbral_tiempo
+        self.inicio_cerrado=None
+        self.alerta_activa=False
+
+    def actualizar(self,ojos_cerrados,tiempo):
+        """
+        Registra el estado de los ojos en un frame.
+
+        Args:
+            ojos_cerrados (bool): Si en este frame se detectaron los ojos cerrados.
+            tiempo (float): Marca de tiempo (segundos) del frame.
+
+        Returns:
+            tuple: (cambio, duracion_cerrado). cambio es '1' si la alerta se acaba de activar,
+                   '0' si se acaba de desactivar y None si no cambió.
+        """
+        if not ojos_cerrados:
+            return self.reiniciar(),0.0
+
+        if self.inicio_cerrado is None:
+            self.inicio_cerrado=tiempo
+        duracion_cerrado=tiempo-self.inicio_cerrado
+        if duracion_cerrado>=self.umbral_tiempo and not self.alerta_activa:
+            self.alerta_activa=True
+            return '1',duracion_cerrado
+        return None,duracion_cerrado
+
+    def reiniciar(self):
+        """
+        Reinicia el temporizador (ojos abiertos o sin rostro).
+
+        Returns:
+            str or None: '0' si había una alerta activa que se desactivó, None en otro caso.
+        """
+        self.inicio_cerrado=None
+        if self.alerta_activa:
+            self.alerta_activa=False
+            return '0'
+        return None
@@ -0,0 +1,193 @@
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from analisis_facial import (NUM_PUNTOS_MALLA, PUNTO_ROSTRO_DERECHO, PUNTO_ROSTRO_IZQUIERDO, PUNTOS_EAR_DERECHO,
+                             PUNTOS_EAR_IZQUIERDO, PUNTOS_OJO_DERECHO, PUNTOS_OJO_IZQUIERDO)
+from calibracion import EAR_BASE_MAXIMO, EAR_BASE_MINIMO
+
+# Backends disponibles para BACKEND_LANDMARKS en main.py
+BACKENDS = ("facemesh", "ojos_opencv", "sintetico")
+
+# Contorno de cada ojo (p1..p6) y el ancho del rostro, para dibujar los backends que solo
+# estiman esos puntos
+CONEXIONES_OJOS = tuple(
+    (ojo[i], ojo[(i + 1) % 6]) for ojo in (PUNTOS_EAR_IZQUIERDO, PUNTOS_EAR_DERECHO) for i in range(6)
+) + ((PUNTO_ROSTRO_IZQUIERDO, PUNTO_ROSTRO_DERECHO),)
+
+
+class BackendLandmarks(ABC):
+    """
+    Interfaz de los detectores de puntos faciales. Es abstracta: un backend que no implementa
+    detectar() falla al crearlo y no en el primer frame.
+
+    detectar() recibe un frame RGB y devuelve (puntos, confianza): un arreglo (468, 2) en
+    píxeles del frame con la numeración de la malla de MediaPipe (al menos los puntos de los
+    ojos y del ancho del rostro que usa AnalisisFacial) y una confianza entre 0 y 1, o
+    (None, 0.0) si no hay rostro.
+    """
+    nombre = ""
+    conexiones = CONEXIONES_OJOS # Pares de puntos para dibujar con dibujarMalla
+    escala = 1.0 # Reducción de la imagen antes de detectar; la ajusta ControladorEscala
+    confianza = 0.0 # Confianza de la última detección
+    # EAR con los ojos abiertos que la calibración acepta como válido con este backend
+    rango_ear_abierto = (EAR_BASE_MINIMO, EAR_BASE_MAXIMO)
+
+    @abstractmethod
+    def detectar(self, frame_rgb, destino=None):
+        """
+        Busca el rostro en un frame RGB.
+
+        Args:
+            frame_rgb (np.ndarray): Frame RGB.
+            destino (np.ndarray, opcional): Arreglo (468, 2) preasignado donde escribir los puntos.
+
+        Returns:
+            tuple: (puntos, confianza), o (None, 0.0) si no hay rostro.
+        """
+
+    def procesar(self, frame_rgb, destino=None):
+        """
+        Como detectar() pero devuelve solo los puntos; la confianza queda en self.confianza.
+        """
+        puntos, self.confianza = self.detectar(frame_rgb, destino)
+        return puntos
+
+    def calentar(self, ancho=640, alto=480):
+        """
+        Prepara el backend antes del primer frame real. Por defecto no hace nada.
+        """
+
+    def reiniciar(self):
+        """
+        Olvida el estado que el backend arrastra de un frame al siguiente (seguimiento del
+        rostro), para empezar otro video o segmento como recién creado. Por defecto no hace nada.
+        """
+
+
+def puntosDesdeOjos(caja_rostro, ojos, destino=None):
+    """
+    Arma un arreglo (468, 2) a partir del recuadro del rostro y de la posición y apertura de
+    cada ojo, para los backends que no calculan la malla completa.
+
+    Los seis puntos del EAR de cada ojo se ubican de modo que su EAR sea exactamente el pedido,
+    los párpados de PUNTOS_OJO_* quedan en el centro de cada párpado y el resto de los puntos
+    se reparte sobre el óvalo del rostro.
+
+    Args:
+        caja_rostro (tuple): (x, y, ancho, alto) del rostro en píxeles.
+        ojos (tuple): ((centro_x, centro_y, ancho, ear), ...) para el ojo izquierdo y el derecho.
+        destino (np.ndarray, opcional): Arreglo (468, 2) preasignado.
+    """
+    if destino is None:
+        destino = np.empty((NUM_PUNTOS_MALLA, 2), dtype=np.float32)
+    x, y, ancho, alto = caja_rostro
+    angulos = np.linspace(0, 2 * np.pi, NUM_PUNTOS_MALLA, endpoint=False)
+    destino[:, 0] = x + ancho / 2 + np.cos(angulos) * ancho / 2
+    destino[:, 1] = y + alto / 2 + np.sin(angulos) * alto / 2
+    destino[PUNTO_ROSTRO_IZQUIERDO] = (x, y + alto * 0.45)
+    destino[PUNTO_ROSTRO_DERECHO] = (x + ancho, y + alto * 0.45)
+
+    for indices, (superior, inferior), (centro_x, centro_y, ancho_ojo, ear) in (
+            (PUNTOS_EAR_IZQUIERDO, PUNTOS_OJO_IZQUIERDO, ojos[0]),
+            (PUNTOS_EAR_DERECHO, PUNTOS_OJO_DERECHO[::-1], ojos[1])):
+        medio = ancho_ojo / 2
+        parpado = ear * ancho_ojo / 2 # EAR = (2 * 2 * parpado) / (2 * ancho_ojo)
+        p1, p2, p3, p4, p5, p6 = indices
+        destino[p1] = (centro_x - medio, centro_y)
+        destino[p4] = (centro_x + medio, centro_y)
+        destino[p2] = (centro_x - medio / 3, centro_y - parpado)
+        destino[p3] = (centro_x + medio / 3, centro_y - parpado)
+        destino[p6] = (centro_x - medio / 3, centro_y + parpado)
+        destino[p5] = (centro_x + medio / 3, centro_y + parpado)
+        destino[superior] = (centro_x, centro_y - parpado)
+        destino[inferior] = (centro_x, centro_y + parpado)
+    return destino
+
+
+class MallaSintetica(BackendLandmarks):
+    """
+    Backend de prueba que no mira la imagen: devuelve un rostro frontal cuyos ojos siguen un
+    guion de parpadeos y cierres largos. El tiempo se cuenta en frames (frame / fps), así que
+    la secuencia es siempre la misma. Sirve para pruebas y benchmarks sin cámara ni MediaPipe.
+    """
+    nombre = "sintetico"
+
+    def __init__(self, fps=30.0, cierres=((10.0, 12.5),), sin_rostro=(), periodo_parpadeo=4.0,
+                 duracion_parpadeo=0.15, ear_abierto=0.3, ear_cerrado=0.06, ruido=0.0, semilla=0):
+        """
+        Args:
+            fps (float): Frames por segundo con los que se cuenta el tiempo.
+            cierres (tuple): Intervalos (inicio, fin) en segundos con los ojos cerrados.
+            sin_rostro (tuple): Intervalos (inicio, fin) en segundos sin rostro.
+            periodo_parpadeo (float): Segundos entre parpadeos (0 para no parpadear).
+            duracion_parpadeo (float): Duración de cada parpadeo en segundos.
+            ear_abierto (float): EAR con los ojos abiertos.
+            ear_cerrado (float): EAR con los ojos cerrados.
+            ruido (float): Desvío del ruido agregado al EAR.
+            semilla (int): Semilla del ruido.
+        """
+        self.fps = fps
+        self.cierres = tuple(cierres)
+        self.sin_rostro = tuple(sin_rostro)
+        self.periodo_parpadeo = periodo_parpadeo
+        self.duracion_parpadeo = duracion_parpadeo
+        self.ear_abierto = ear_abierto
+        self.ear_cerrado = ear_cerrado
+        self.ruido = ruido
+        self.semilla = semilla
+        self._azar = np.random.default_rng(semilla)
+        self.frame = 0
+
+    def reiniciar(self):
+        """
+        Vuelve el guion (y el ruido) al principio.
+        """
+        self._azar = np.random.default_rng(self.semilla)
+        self.frame = 0
+
+    def earEn(self, tiempo):
+        """
+        EAR del guion en el segundo `tiempo`, o None si en ese momento no hay rostro.
+        """
+        if any(inicio <= tiempo < fin for inicio, fin in self.sin_rostro):
+            return None
+        cerrado = any(inicio <= tiempo < fin for inicio, fin in self.cierres)
+        if not cerrado and self.periodo_parpadeo > 0:
+            cerrado = tiempo % self.periodo_parpadeo < self.duracion_parpadeo
+        ear = self.ear_cerrado if cerrado else self.ear_abierto
+        if self.ruido:
+            ear += self._azar.normal(0, self.ruido)
+        return ear
+
+    def detectar(self, frame_rgb, destino=None):
+        tiempo = self.frame / self.fps
+        self.frame += 1
+        ear = self.earEn(tiempo)
+        if ear is None:
+            return None, 0.0
+        alto, ancho = frame_rgb.shape[:2]
+        lado = min(ancho, alto) * 0.5
+        x, y = (ancho - lado) / 2, (alto - lado) / 2
+        ojos = ((x + lado * 0.3, y + lado * 0.4, lado * 0.2, ear), (x + lado * 0.7, y + lado * 0.4, lado * 0.2, ear))
+        return puntosDesdeOjos((x, y, lado, lado * 1.2), ojos, destino), 1.0
+
+
+def crearBackend(nombre, **opciones):
+    """
+    Crea el backend de puntos faciales indicado.
+
+    Args:
+        nombre (str): "facemesh" (MediaPipe, el más preciso), "ojos_opencv" (cascadas Haar de
+                      OpenCV, para equipos con poca CPU) o "sintetico" (pruebas).
+        **opciones: Argumentos del constructor del backend.
+    """
+    if nombre == "facemesh":
+        from malla_facial import MallaFacial
+        return MallaFacial(**opciones)
+    if nombre == "ojos_opencv":
+        from detector_ojos import DetectorOjosOpenCV
+        return DetectorOjosOpenCV(**opciones)
+    if nombre == "sintetico":
+        return MallaSintetica(**opciones)
+    raise ValueError(f"Backend de puntos faciales desconocido: '{nombre}'. Opciones: {', '.join(BACKENDS)}")
@@ -0,0 +1,186 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+from analisis_facial import AnalisisFacial
+from grabacion_landmarks import FRAME_INFERIDO, leerGrabacion
+from registro_sesion import leerSesion
+
+
+def metricasGrabacion(ruta, frames_suavizado=3):
+    """
+    Lee el EAR por frame de una grabación de puntos (.lmk) o de un historial de sesión (.bin).
+
+    Para una grabación se calcula el EAR promedio de ambos ojos y se suaviza con la misma media
+    móvil que IndicadoresOjos (solo sobre frames con rostro). Solo se usan los frames inferidos:
+    en vivo la alerta solo se decide en ellos.
+
+    Returns:
+        tuple: (tiempo, ear) como arreglos (N,); ear es NaN en los frames sin rostro.
+    """
+    if ruta.endswith(".lmk"):
+        grabacion = leerGrabacion(ruta)
+        grabacion = grabacion[grabacion["tipo"] == FRAME_INFERIDO]
+        tiempo = np.asarray(grabacion["tiempo"], dtype=np.float64)
+        ear = np.full(len(grabacion), np.nan)
+        con_rostro = np.flatnonzero(grabacion["rostro"])
+        izquierdo, derecho = AnalisisFacial().calcularEAR(grabacion["puntos"][con_rostro])
+        crudo = (izquierdo.astype(np.float64) + derecho) / 2
+        acumulado = np.concatenate(([0.0], np.cumsum(crudo)))
+        indices = np.arange(1, len(crudo) + 1)
+        desde = np.maximum(indices - frames_suavizado, 0)
+        ear[con_rostro] = (acumulado[indices] - acumulado[desde]) / (indices - desde)
+        return tiempo, ear
+    sesion = leerSesion(ruta)
+    ear = np.asarray(sesion["ear"], dtype=np.float64)
+    ear[sesion["rostro"] == 0] = np.nan
+    return np.asarray(sesion["tiempo"], dtype=np.float64), ear
+
+
+def barrerUmbrales(tiempo, ear, intervalos, umbrales_ear, umbrales_tiempo, tolerancia=2.0, bloque=16):
+    """
+    Evalúa a la vez todas las combinaciones (umbral de EAR, umbral de tiempo) contra intervalos
+    de somnolencia etiquetados, con la misma lógica que TemporizadorSomnolencia: la alerta se
+    activa en el primer frame en que los ojos llevan `umbral_tiempo` segundos cerrados seguidos,
+    y un frame sin rostro reinicia la cuenta.
+
+    Para cada umbral de EAR se buscan los tramos de ojos cerrados (todos los umbrales de un
+    bloque en una sola operación 2D) y para cada tramo se calcula con searchsorted el momento
+    de alerta de todos los umbrales de tiempo juntos.
+
+    Args:
+        tiempo (np.ndarray): Marcas de tiempo (N,) en segundos, crecientes.
+        ear (np.ndarray): EAR suavizado (N,), NaN sin rostro.
+        intervalos (list): Pares (inicio, fin) en segundos desde el primer frame donde el
+                           conductor estaba somnoliento.
+        umbrales_ear (np.ndarray): Umbrales de EAR a probar (A,).
+        umbrales_tiempo (np.ndarray): Umbrales de tiempo a probar (B,).
+        tolerancia (float): Segundos después del fin de un intervalo en que una alerta todavía
+                            cuenta como detección y no como falsa alarma.
+        bloque (int): Umbrales de EAR procesados juntos (limita la memoria: bloque x N).
+
+    Returns:
+        dict: Arreglos (A, B): "detectadas", "falsas_por_hora", "latencia_media" y
+              "latencia_maxima" (NaN si no detectó ninguna), más "total_intervalos" y "horas".
+    """
+    tiempo = np.asarray(tiempo, dtype=np.float64)
+    relativo = tiempo - tiempo[0]
+    umbrales_ear = np.asarray(umbrales_ear, dtype=np.float64)
+    umbrales_tiempo = np.asarray(umbrales_tiempo, dtype=np.float64)
+    intervalos = np.asarray(sorted(intervalos), dtype=np.float64).reshape(-1, 2)
+    inicios_etiqueta, fines_etiqueta = intervalos[:, 0], intervalos[:, 1] + tolerancia
+    horas = max(relativo[-1] / 3600, 1e-9)
+    A, B, L = len(umbrales_ear), len(umbrales_tiempo), len(intervalos)
+
+    detectadas = np.zeros((A, B), dtype=np.int64)
+    falsas = np.zeros((A, B), dtype=np.int64)
+    latencia_media = np.full((A, B), np.nan)
+    latencia_maxima = np.full((A, B), np.nan)
+
+    for desde in range(0, A, bloque):
+        umbrales = umbrales_ear[desde:desde + bloque]
+        # Tramos de ojos cerrados de todos los umbrales del bloque (NaN < u es False: sin rostro corta el tramo)
+        cerrados = ear[None, :] < umbrales[:, None]
+        bordes = np.diff(np.pad(cerrados, ((0, 0), (1, 1))).astype(np.int8), axis=1)
+        fila_tramo, inicio_tramo = np.nonzero(bordes == 1)
+        _, fin_tramo = np.nonzero(bordes == -1) # Exclusivo; mismo orden que los inicios
+        # Los tramos más cortos que el menor umbral de tiempo (parpadeos, ruido) no disparan nada
+        duracion = relativo[fin_tramo - 1] - relativo[inicio_tramo]
+        largos = duracion >= umbrales_tiempo.min()
+        fila_tramo, inicio_tramo, duracion = fila_tramo[largos], inicio_tramo[largos], duracion[largos]
+        if len(fila_tramo) == 0:
+            continue
+
+        # Momento de alerta de cada tramo para cada umbral de tiempo que alcanza: primer frame
+        # del tramo con relativo >= inicio + umbral_tiempo
+        tramo, columna = np.nonzero(duracion[:, None] >= umbrales_tiempo[None, :])
+        fila = fila_tramo[tramo] + desde
+        momento = relativo[np.searchsorted(relativo, relativo[inicio_tramo[tramo]] + umbrales_tiempo[columna],
+                                           side="left")]
+
+        # Cada alerta cae dentro de un intervalo etiquetado (detección) o no (falsa alarma)
+        etiqueta = np.searchsorted(inicios_etiqueta, momento, side="right") - 1
+        dentro = (etiqueta >= 0) & (momento <= fines_etiqueta[np.maximum(etiqueta, 0)])
+        np.add.at(falsas, (fila[~dentro], columna[~dentro]), 1)
+
+        # Latencia: primera alerta dentro de cada intervalo, por combinación
+        primera = np.full((len(umbrales), L, B), np.inf)
+        np.minimum.at(primera, (fila[dentro] - desde, etiqueta[dentro], columna[dentro]), momento[dentro])
+        latencias = primera - inicios_etiqueta[None, :, None]
+        detectado = np.isfinite(latencias)
+        cuenta = detectado.sum(axis=1)
+        detectadas[desde:desde + len(umbrales)] = cuenta
+        with np.errstate(invalid="ignore"):
+            suma = np.where(detectado, latencias, 0.0).sum(axis=1)
+            latencia_media[desde:desde + len(umbrales)] = np.where(cuenta > 0, suma / np.maximum(cuenta, 1), np.nan)
+            latencia_maxima[desde:desde + len(umbrales)] = np.where(
+                cuenta > 0, np.where(detectado, latencias, -np.inf).max(axis=1), np.nan)
+
+    return {"detectadas": detectadas, "falsas_por_hora": falsas / horas, "latencia_media": latencia_media,
+            "latencia_maxima": latencia_maxima, "total_intervalos": L, "horas": horas}
+
+
+def mejoresCombinaciones(resultado, umbrales_ear, umbrales_tiempo, cantidad=10):
+    """
+    Ordena las combinaciones por intervalos detectados (más), falsas alarmas por hora (menos)
+    y latencia media (menos).
+
+    Returns:
+        list: Diccionarios con los umbrales y sus métricas.
+    """
+    detectadas = resultado["detectadas"].ravel()
+    falsas = resultado["falsas_por_hora"].ravel()
+    latencia = np.nan_to_num(resultado["latencia_media"].ravel(), nan=np.inf)
+    orden = np.lexsort((latencia, falsas, -detectadas))[:cantidad]
+    filas, columnas = np.unravel_index(orden, resultado["detectadas"].shape)
+    return [{"umbral_ear": float(umbrales_ear[f]), "umbral_tiempo": float(umbrales_tiempo[c]),
+             "detectadas": int(resultado["detectadas"][f, c]),
+             "falsas_por_hora": float(resultado["falsas_por_hora"][f, c]),
+             "latencia_media": float(resultado["latencia_media"][f, c]),
+             "latencia_maxima": float(resultado["latencia_maxima"][f, c])}
+            for f, c in zip(filas, columnas)]
+
+
+def _rango(texto):
+    """
+    Convierte "inicio:fin:paso" en un arreglo (fin incluido).
+    """
+    inicio, fin, paso = (float(valor) for valor in texto.split(":"))
+    return np.arange(inicio, fin + paso / 2, paso)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evalúa una grilla de umbrales de EAR y de tiempo sobre una sesión grabada.")
+    parser.add_argument("grabacion", help="Grabación de puntos (.lmk) o historial de sesión (.bin)")
+    parser.add_argument("etiquetas", help='JSON con los intervalos de somnolencia en segundos: {"intervalos": [[inicio, fin], ...]}')
+    parser.add_argument("--umbrales-ear", type=_rango, default="0.10:0.30:0.0025", help="inicio:fin:paso")
+    parser.add_argument("--umbrales-tiempo", type=_rango, default="0.2:3.0:0.05", help="inicio:fin:paso (segundos)")
+    parser.add_argument("--tolerancia", type=float, default=2.0, help="Segundos tras un intervalo que aún cuentan como detección")
+    parser.add_argument("--mostrar", type=int, default=10, help="Cantidad de combinaciones a listar")
+    parser.add_argument("--salida", default=None, help="Guardar la grilla completa en un .npz")
+    argumentos = parser.parse_args()
+
+    with open(argumentos.etiquetas, encoding="utf-8") as archivo:
+        intervalos = json.load(archivo)["intervalos"]
+    tiempo, ear = metricasGrabacion(argumentos.grabacion)
+
+    inicio = time.perf_counter()
+    resultado = barrerUmbrales(tiempo, ear, intervalos, argumentos.umbrales_ear, argumentos.umbrales_tiempo,
+                               tolerancia=argumentos.tolerancia)
+    transcurrido = time.perf_counter() - inicio
+    combinaciones = resultado["detectadas"].size
+    print(f"{combinaciones} combinaciones sobre {len(tiempo)} frames ({resultado['horas']:.2f} h) "
+          f"en {transcurrido:.2f} s")
+    print(f"{'EAR':>7} {'tiempo':>7} {'detect.':>9} {'falsas/h':>9} {'lat. media':>11} {'lat. máx':>9}")
+    for fila in mejoresCombinaciones(resultado, argumentos.umbrales_ear, argumentos.umbrales_tiempo, argumentos.mostrar):
+        print(f"{fila['umbral_ear']:7.4f} {fila['umbral_tiempo']:7.2f} "
+              f"{fila['detectadas']:>4}/{resultado['total_intervalos']:<4} {fila['falsas_por_hora']:9.2f} "
+              f"{fila['latencia_media']:10.2f}s {fila['latencia_maxima']:8.2f}s")
+
+    if argumentos.salida:
+        np.savez_compressed(argumentos.salida, umbrales_ear=argumentos.umbrales_ear,
+                            umbrales_tiempo=argumentos.umbrales_tiempo,
+                            **{clave: valor for clave, valor in resultado.items() if isinstance(valor, np.ndarray)})
+        print(f"Grilla guardada en {argumentos.salida}")
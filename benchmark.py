@@ -0,0 +1,265 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+import cv2 # Opencv
+import numpy as np
+
+from analisis_facial import AnalisisFacial, IndicadoresOjos, NUM_PUNTOS_MALLA
+from backends_landmarks import BACKENDS, crearBackend, puntosDesdeOjos
+from malla_facial import landmarksAArreglo
+
+
+def resumir(tiempos_ns):
+    """
+    Resume una serie de latencias medidas en nanosegundos.
+
+    Returns:
+        dict: Muestras, percentiles p50/p95/p99 y media en milisegundos, y operaciones por segundo.
+    """
+    tiempos_ms = np.asarray(tiempos_ns, dtype=np.float64) / 1e6
+    if tiempos_ms.size == 0:
+        return {"muestras": 0}
+    p50, p95, p99 = np.percentile(tiempos_ms, [50, 95, 99])
+    media = float(tiempos_ms.mean())
+    return {
+        "muestras": int(tiempos_ms.size),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "media_ms": media,
+        "por_segundo": 1000.0 / media if media > 0 else 0.0,
+    }
+
+
+def medir(funcion, repeticiones, calentamiento=5):
+    """
+    Ejecuta `funcion` varias veces y devuelve la latencia de cada llamada en nanosegundos.
+    """
+    for _ in range(calentamiento):
+        funcion()
+    tiempos = np.empty(repeticiones, dtype=np.int64)
+    for i in range(repeticiones):
+        inicio = time.perf_counter_ns()
+        funcion()
+        tiempos[i] = time.perf_counter_ns() - inicio
+    return tiempos
+
+
+def generarClipSintetico(ruta, frames=150, ancho=1280, alto=720, fps=30):
+    """
+    Escribe un clip MJPG con ruido y un óvalo en movimiento para medir la decodificación
+    cuando no se pasan videos grabados.
+    """
+    generador = np.random.default_rng(0)
+    escritor = cv2.VideoWriter(ruta, cv2.VideoWriter_fourcc(*"MJPG"), fps, (ancho, alto))
+    for i in range(frames):
+        frame = generador.integers(0, 255, (alto, ancho, 3), dtype=np.uint8)
+        centro = (ancho // 2 + int(100 * np.sin(i / 10)), alto // 2)
+        cv2.ellipse(frame, centro, (ancho // 8, alto // 4), 0, 0, 360, (180, 160, 140), -1)
+        escritor.write(frame)
+    escritor.release()
+    return ruta
+
+
+def landmarksSinteticos(lote, ancho=1280, alto=720, semilla=0):
+    """
+    Genera un lote (N, 468, 2) de puntos en píxeles con aperturas de ojos variadas.
+    """
+    generador = np.random.default_rng(semilla)
+    puntos = np.empty((lote, NUM_PUNTOS_MALLA, 2), dtype=np.float32)
+    # Rostro de 240 px de ancho y EAR entre ojos cerrados (0.05) y bien abiertos (0.35)
+    caja = (ancho / 2 - 120, alto / 2 - 150, 240, 300)
+    for frame, ear in zip(puntos, generador.uniform(0.05, 0.35, lote)):
+        puntosDesdeOjos(caja, ((ancho / 2 - 50, alto / 2 - 20, 60, ear), (ancho / 2 + 50, alto / 2 - 20, 60, ear)), frame)
+    return puntos
+
+
+def _rostroMediaPipeSintetico(puntos, ancho, alto):
+    """
+    Imita un elemento de multi_face_landmarks (objetos con .x y .y normalizados).
+    """
+    return SimpleNamespace(landmark=[SimpleNamespace(x=float(x) / ancho, y=float(y) / alto) for x, y in puntos])
+
+
+def _crearBackends(nombres):
+    """
+    Crea los backends de puntos faciales pedidos, omitiendo los que no están disponibles en
+    este equipo.
+
+    Returns:
+        dict: Backend por nombre.
+    """
+    backends = {}
+    for nombre in nombres:
+        try:
+            backends[nombre] = crearBackend(nombre)
+        except Exception as e:
+            print(f"Backend '{nombre}' no disponible, se omite su etapa de inferencia: {e}", file=sys.stderr)
+    return backends
+
+
+def benchmarkVideo(ruta, repeticiones, backends):
+    """
+    Mide las etapas que dependen del video: decodificación, espejo, conversión de color e
+    inferencia con cada backend de puntos faciales (una etapa con el nombre de cada uno).
+    """
+    resultados = {}
+    captura = cv2.VideoCapture(ruta)
+    frames = []
+    tiempos_decodificacion = []
+    while len(frames) < repeticiones:
+        inicio = time.perf_counter_ns()
+        estado, frame = captura.read()
+        fin = time.perf_counter_ns()
+        if not estado:
+            break
+        tiempos_decodificacion.append(fin - inicio)
+        frames.append(frame)
+    captura.release()
+    if not frames:
+        print(f"No se pudo leer ningún frame de {ruta}.", file=sys.stderr)
+        return resultados
+
+    resultados["decodificacion"] = resumir(tiempos_decodificacion)
+    indice = itertools.count()
+    resultados["espejo"] = resumir(medir(lambda: cv2.flip(frames[next(indice) % len(frames)], 1), repeticiones))
+    resultados["conversion_color"] = resumir(
+        medir(lambda: cv2.cvtColor(frames[next(indice) % len(frames)], cv2.COLOR_BGR2RGB), repeticiones))
+
+    frames_rgb = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for frame in frames]
+    destino = np.empty((NUM_PUNTOS_MALLA, 2), dtype=np.float32)
+    for nombre, backend in backends.items():
+        resultados[nombre] = resumir(
+            medir(lambda: backend.detectar(frames_rgb[next(indice) % len(frames_rgb)], destino), repeticiones))
+
+    alto, ancho = frames[0].shape[:2]
+    resultados["resolucion"] = f"{ancho}x{alto}"
+    return resultados
+
+
+def benchmarkLandmarks(repeticiones, tamano_lote=256):
+    """
+    Mide la conversión de landmarks y el análisis de ojos sobre puntos sintéticos: EAR de
+    ambos ojos más IndicadoresOjos por frame, como en main.py, y el EAR de un lote, como en
+    procesamiento_lotes.py y grabacion_landmarks.py.
+    """
+    ancho, alto = 1280, 720
+    puntos = landmarksSinteticos(max(repeticiones, tamano_lote), ancho, alto)
+    rostro = _rostroMediaPipeSintetico(puntos[0], ancho, alto)
+    destino = np.empty((NUM_PUNTOS_MALLA, 2), dtype=np.float32)
+    analizador = AnalisisFacial()
+    indicadores = IndicadoresOjos()
+    indice = itertools.count()
+
+    def analizarFrame():
+        i = next(indice)
+        ear_izquierdo, ear_derecho = analizador.calcularEAR(puntos[i % len(puntos)])
+        return indicadores.actualizar(float(ear_izquierdo + ear_derecho) / 2, i / 30.0)
+
+    resultados = {
+        "conversion_landmarks": resumir(medir(lambda: landmarksAArreglo(rostro, ancho, alto, destino), repeticiones)),
+        "analisis_facial": resumir(medir(analizarFrame, repeticiones)),
+    }
+    lote = puntos[:tamano_lote]
+    resumen_lote = resumir(medir(lambda: analizador.calcularEAR(lote), max(1, repeticiones // 10)))
+    resumen_lote["frames_por_segundo"] = resumen_lote["por_segundo"] * tamano_lote
+    resultados[f"analisis_facial_lote_{tamano_lote}"] = resumen_lote
+    return resultados
+
+
+def benchmarkSerial(repeticiones):
+    """
+    Mide ArduinoComunicador.enviar_senal sobre un puerto de bucle de pyserial (sin hardware).
+    """
+    try:
+        import serial
+        from conexion_arduino import ArduinoComunicador
+    except ImportError as e:
+        print(f"pyserial no disponible, se omite la etapa serial: {e}", file=sys.stderr)
+        return {}
+    arduino_com = ArduinoComunicador(puerto="loop://")
+    arduino_com.arduino = serial.serial_for_url("loop://", timeout=0)
+    arduino_com.conectado = True
+    senales = itertools.count()
+    tiempos = medir(lambda: arduino_com.enviar_senal('1' if next(senales) % 2 else '0'), repeticiones)
+    arduino_com.arduino.close()
+    return {"envio_serial": resumir(tiempos)}
+
+
+def compararConBase(resultados, ruta_base, tolerancia):
+    """
+    Compara el p95 de cada etapa con un resultado anterior.
+
+    Returns:
+        list: Descripción de las etapas que empeoraron más que la tolerancia.
+    """
+    with open(ruta_base, encoding="utf-8") as archivo:
+        base = json.load(archivo)
+    regresiones = []
+    for grupo, etapas in resultados["etapas"].items():
+        for etapa, actual in etapas.items():
+            anterior = base.get("etapas", {}).get(grupo, {}).get(etapa)
+            if not isinstance(actual, dict) or not isinstance(anterior, dict) or "p95_ms" not in anterior:
+                continue
+            if actual["p95_ms"] > anterior["p95_ms"] * (1 + tolerancia):
+                regresiones.append(f"{grupo}/{etapa}: p95 {anterior['p95_ms']:.3f} ms -> {actual['p95_ms']:.3f} ms")
+    return regresiones
+
+
+def ejecutar(videos=None, repeticiones=300, backends=("facemesh",)):
+    """
+    Corre todas las etapas y devuelve un diccionario listo para guardar como JSON.
+    """
+    resultados = {
+        "equipo": {"plataforma": platform.platform(), "python": platform.python_version(),
+                   "opencv": cv2.__version__, "numpy": np.__version__, "cpus": os.cpu_count()},
+        "repeticiones": repeticiones,
+        "etapas": {},
+    }
+    backends = _crearBackends(backends)
+    with tempfile.TemporaryDirectory() as carpeta_temporal:
+        if not videos:
+            videos = [generarClipSintetico(os.path.join(carpeta_temporal, "sintetico.avi"))]
+        for ruta in videos:
+            nombre = os.path.basename(ruta)
+            print(f"Midiendo video {nombre}...", file=sys.stderr)
+            resultados["etapas"][f"video:{nombre}"] = benchmarkVideo(ruta, repeticiones, backends)
+    print("Midiendo landmarks sintéticos...", file=sys.stderr)
+    resultados["etapas"]["landmarks"] = benchmarkLandmarks(repeticiones)
+    print("Midiendo envío serial...", file=sys.stderr)
+    resultados["etapas"]["serial"] = benchmarkSerial(repeticiones)
+    return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mide la latencia de cada etapa del detector de somnolencia.")
+    parser.add_argument("videos", nargs="*", help="Clips de video grabados (por defecto uno sintético)")
+    parser.add_argument("--backends", default="facemesh,ojos_opencv",
+                        help=f"Backends de puntos faciales a medir, separados por comas ({', '.join(BACKENDS)})")
+    parser.add_argument("--repeticiones", type=int, default=300, help="Muestras por etapa")
+    parser.add_argument("--salida", default=None, help="Archivo JSON de salida (por defecto, la consola)")
+    parser.add_argument("--base", default=None, help="JSON de una corrida anterior para detectar regresiones")
+    parser.add_argument("--tolerancia", type=float, default=0.15, help="Aumento de p95 permitido respecto a la base")
+    argumentos = parser.parse_args()
+
+    resultados = ejecutar(argumentos.videos, argumentos.repeticiones, argumentos.backends.split(","))
+    texto = json.dumps(resultados, indent=2, ensure_ascii=False)
+    if argumentos.salida:
+        with open(argumentos.salida, "w", encoding="utf-8") as archivo:
+            archivo.write(texto)
+        print(f"Resultados guardados en {argumentos.salida}", file=sys.stderr)
+    else:
+        print(texto)
+
+    if argumentos.base:
+        regresiones = compararConBase(resultados, argumentos.base, argumentos.tolerancia)
+        for regresion in regresiones:
+            print(f"REGRESIÓN {regresion}", file=sys.stderr)
+        sys.exit(1 if regresiones else 0)
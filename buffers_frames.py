@@ -0,0 +1,105 @@
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from metricas import REGISTRO
+
+BUFFERS_RESERVADOS = REGISTRO.contador("somnolencia_buffers_frame_reservados_total",
+                                       "Arreglos de frame reservados por los pools (no crece en régimen)")
+
+
+def asegurarBuffer(buffer, forma, tipo=np.uint8):
+    """
+    Devuelve `buffer` si ya tiene la forma y el tipo pedidos o un arreglo nuevo si no (primer
+    frame o cambio de resolución). Sirve para el parámetro dst de las funciones de OpenCV.
+    """
+    if buffer is None or buffer.shape != tuple(forma) or buffer.dtype != tipo:
+        BUFFERS_RESERVADOS.incrementar()
+        return np.empty(forma, dtype=tipo)
+    return buffer
+
+
+class PoolBuffers:
+    """
+    Arreglos de una misma forma que se reciclan en lugar de reservar uno por frame.
+
+    tomar() entrega un arreglo libre (o reserva uno si no hay) y devolver() lo deja disponible
+    otra vez. Si cambia la forma pedida (otra resolución) se descartan los libres y los que se
+    devuelvan con la forma vieja quedan para el recolector.
+    """
+    def __init__(self, maximo_libres=8):
+        """
+        Args:
+            maximo_libres (int): Arreglos libres que se guardan como máximo.
+        """
+        self.maximo_libres = maximo_libres
+        self.forma = None
+        self.tipo = None
+        self.reservados = 0
+        self._libres = []
+        self._lock = threading.Lock()
+
+    def tomar(self, forma, tipo=np.uint8):
+        forma = tuple(forma)
+        with self._lock:
+            if forma != self.forma or tipo != self.tipo:
+                self.forma, self.tipo = forma, tipo
+                self._libres.clear()
+            if self._libres:
+                return self._libres.pop()
+            self.reservados += 1
+        BUFFERS_RESERVADOS.incrementar()
+        return np.empty(forma, dtype=tipo)
+
+    def devolver(self, arreglo):
+        with self._lock:
+            if (arreglo.shape == self.forma and arreglo.dtype == self.tipo
+                    and len(self._libres) < self.maximo_libres):
+                self._libres.append(arreglo)
+
+
+class RanuraCompartida:
+    """
+    Un frame en memoria compartida para pasarlo a otro proceso sin serializarlo: quien lo crea
+    escribe en `arreglo` (por ejemplo como dst de cv2.cvtColor) y manda solo el `descriptor`;
+    el otro proceso lo abre con abrirRanura().
+
+    No hay sincronización: quien escribe no debe tocar la ranura mientras otro proceso la lee.
+    """
+    def __init__(self, forma, tipo=np.uint8):
+        tipo = np.dtype(tipo)
+        self._memoria = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(forma)) * tipo.itemsize))
+        self.arreglo = np.ndarray(forma, dtype=tipo, buffer=self._memoria.buf)
+        self.descriptor = (self._memoria.name, tuple(forma), tipo.str)
+
+    def cerrar(self):
+        """
+        Libera la memoria compartida. Llamar solo desde el proceso que creó la ranura.
+        """
+        self.arreglo = None
+        self._memoria.close()
+        self._memoria.unlink()
+
+
+# Ranuras abiertas en este proceso: nombre -> (memoria, arreglo)
+_ranurasAbiertas = {}
+
+
+def abrirRanura(descriptor, maximo_abiertas=32):
+    """
+    Devuelve el arreglo de una RanuraCompartida creada en otro proceso. La ranura queda abierta
+    para los frames siguientes del mismo stream.
+    """
+    nombre, forma, tipo = descriptor
+    if nombre not in _ranurasAbiertas:
+        if len(_ranurasAbiertas) >= maximo_abiertas:
+            # La más vieja suele ser de un stream que cambió de resolución
+            memoria, arreglo = _ranurasAbiertas.pop(next(iter(_ranurasAbiertas)))
+            del arreglo # close() falla mientras haya arreglos sobre la memoria
+            memoria.close()
+        # Los trabajadores de un pool comparten el resource_tracker del proceso principal, así que
+        # abrirla no cambia quién la borra: la borra RanuraCompartida.cerrar()
+        memoria = shared_memory.SharedMemory(name=nombre)
+        _ranurasAbiertas[nombre] = (memoria, np.ndarray(forma, dtype=np.dtype(tipo), buffer=memoria.buf))
+    return _ranurasAbiertas[nombre][1]
@@ -0,0 +1,138 @@
+import json
+import os
+import time
+
+import numpy as np
+
+from analisis_facial import UMBRAL_EAR
+
+# Archivo donde se guarda la línea base de cada conductor
+ARCHIVO_CALIBRACION = "calibracion_conductores.json"
+# El umbral de ojo cerrado es esta fracción del EAR con los ojos abiertos
+FACTOR_UMBRAL = 0.65
+# Rango de EAR con ojos abiertos que se acepta como calibración válida
+EAR_BASE_MINIMO = 0.15
+EAR_BASE_MAXIMO = 0.5
+
+
+def cargarCalibraciones(ruta=ARCHIVO_CALIBRACION):
+    """
+    Lee las calibraciones guardadas.
+
+    Returns:
+        dict: Conductor -> {"ear_base", "umbral_ear", "muestras", "fecha"}. Vacío si no hay archivo.
+    """
+    try:
+        with open(ruta, encoding="utf-8") as archivo:
+            return json.load(archivo)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"No se pudo leer {ruta}: {e}. Se ignoran las calibraciones guardadas.")
+        return {}
+
+
+def guardarCalibracion(conductor, datos, ruta=ARCHIVO_CALIBRACION):
+    """
+    Agrega o reemplaza la calibración de un conductor. Escribe a un archivo temporal y lo
+    renombra, así un corte de energía no deja el archivo a medias.
+    """
+    calibraciones = cargarCalibraciones(ruta)
+    calibraciones[conductor] = datos
+    temporal = ruta + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as archivo:
+        json.dump(calibraciones, archivo, indent=2, ensure_ascii=False)
+    os.replace(temporal, ruta)
+
+
+class CalibracionConductor:
+    """
+    Ajusta el umbral de EAR al conductor a partir de sus primeros segundos frente a la cámara.
+
+    Si el conductor ya tiene una calibración guardada se usa de inmediato. Si no, se juntan
+    muestras de EAR durante `duracion` segundos; la mediana (los parpadeos no la mueven) es la
+    línea base con los ojos abiertos y el umbral es `factor_umbral` veces esa base. Mientras
+    tanto rige el umbral predeterminado. Una base fuera de `rango_ear_base` se descarta; el
+    rango depende del backend de puntos faciales (BackendLandmarks.rango_ear_abierto).
+    """
+    def __init__(self, conductor, ruta=ARCHIVO_CALIBRACION, duracion=10.0, factor_umbral=FACTOR_UMBRAL,
+                 umbral_predeterminado=UMBRAL_EAR, min_muestras=30, max_muestras=2000,
+                 rango_ear_base=(EAR_BASE_MINIMO, EAR_BASE_MAXIMO)):
+        """
+        Args:
+            conductor (str): Identificador del conductor en el archivo de calibración.
+            ruta (str): Archivo JSON con las calibraciones.
+            duracion (float): Segundos de muestras para una calibración nueva.
+            factor_umbral (float): Fracción de la línea base usada como umbral.
+            umbral_predeterminado (float): Umbral hasta terminar la calibración.
+            min_muestras (int): Muestras mínimas para aceptar la calibración.
+            max_muestras (int): Tamaño del buffer de muestras.
+            rango_ear_base (tuple): (mínimo, máximo) del EAR con ojos abiertos que se acepta.
+        """
+        self.conductor = conductor
+        self.rango_ear_base = rango_ear_base
+        self.ruta = ruta
+        self.duracion = duracion
+        self.factor_umbral = factor_umbral
+        self.min_muestras = min_muestras
+        self.umbral_ear = umbral_predeterminado
+        self.ear_base = None
+        self.completa = False
+        self._muestras = np.empty(max_muestras, dtype=np.float32)
+        self._cantidad = 0
+        self._inicio = None
+
+        guardada = cargarCalibraciones(ruta).get(conductor)
+        if guardada is not None:
+            self.ear_base = guardada["ear_base"]
+            self.umbral_ear = guardada["umbral_ear"]
+            self.completa = True
+            print(f"Calibración de '{conductor}' cargada: EAR base {self.ear_base:.3f}, umbral {self.umbral_ear:.3f}")
+        else:
+            print(f"Calibrando a '{conductor}' durante {duracion:.0f} s. Mantener la vista al frente.")
+
+    def restante(self, tiempo):
+        """
+        Segundos que faltan para terminar la calibración.
+        """
+        if self.completa or self._inicio is None:
+            return 0.0 if self.completa else self.duracion
+        return max(0.0, self.duracion - (tiempo - self._inicio))
+
+    def agregar(self, ear, tiempo):
+        """
+        Agrega el EAR de un frame con rostro.
+
+        Returns:
+            bool: True si con esta muestra la calibración quedó lista (el umbral cambió).
+        """
+        if self.completa:
+            return False
+        if self._inicio is None:
+            self._inicio = tiempo
+        if self._cantidad < len(self._muestras):
+            self._muestras[self._cantidad] = ear
+            self._cantidad += 1
+        if tiempo - self._inicio < self.duracion or self._cantidad < self.min_muestras:
+            return False
+
+        ear_base = float(np.median(self._muestras[:self._cantidad]))
+        minimo, maximo = self.rango_ear_base
+        if not minimo <= ear_base <= maximo:
+            # Ojos cerrados, rostro de perfil o puntos mal detectados: volver a intentar
+            print(f"Calibración descartada (EAR base {ear_base:.3f} fuera de rango). Reintentando...")
+            self._cantidad = 0
+            self._inicio = tiempo
+            return False
+
+        self.ear_base = ear_base
+        self.umbral_ear = ear_base * self.factor_umbral
+        self.completa = True
+        print(f"Calibración de '{self.conductor}' lista: EAR base {ear_base:.3f}, umbral {self.umbral_ear:.3f}")
+        try:
+            guardarCalibracion(self.conductor, {"ear_base": ear_base, "umbral_ear": self.umbral_ear,
+                                                "muestras": self._cantidad,
+                                                "fecha": time.strftime("%Y-%m-%d %H:%M:%S")}, self.ruta)
+        except OSError as e:
+            print(f"No se pudo guardar la calibración en {self.ruta}: {e}")
+        return True
@@ -0,0 +1,195 @@
+import threading
+
+import cv2 # Opencv
+import numpy as np
+
+from analisis_facial import PUNTOS_EAR_DERECHO, PUNTOS_EAR_IZQUIERDO
+from buffers_frames import asegurarBuffer
+from metricas import REGISTRO
+
+# Motivos por los que el filtro omite la inferencia de un frame
+MOTIVOS_OMISION = ("duplicado", "oscuro", "borroso")
+# Puntos que delimitan la zona de los ojos
+_INDICES_OJOS = np.array(PUNTOS_EAR_IZQUIERDO + PUNTOS_EAR_DERECHO)
+
+BRILLO_FRAME = REGISTRO.medidor("somnolencia_brillo_frame", "Brillo medio (0-255) del último frame evaluado")
+NITIDEZ_FRAME = REGISTRO.medidor("somnolencia_nitidez_frame",
+                                 "Varianza del laplaciano de la miniatura del último frame evaluado")
+
+
+def omitidosPorCalidad(motivo, registro=REGISTRO):
+    """
+    Contador de frames sin inferir por el filtro de calidad, con la etiqueta motivo="...".
+    """
+    return registro.contador("somnolencia_frames_omitidos_calidad_total",
+                             "Frames que el filtro de calidad no mandó a inferir", {"motivo": motivo})
+
+
+class FiltroCalidad:
+    """
+    Control barato antes de la inferencia para no gastarla en frames que no aportan.
+
+    Un frame se descarta si:
+    - duplicado: la zona de los ojos (ubicada con los puntos de la última inferencia, ver
+      actualizar()) casi no difiere de la del último frame inferido: diferencia media por debajo
+      de `umbral_duplicado` en un recorte en grises de `ancho_ojos` píxeles de ancho. Se mide
+      sobre los ojos y no sobre el frame entero para que un párpado que se cierra con el resto
+      de la cara quieta no pase por repetido (DroidCam y las cámaras RTSP baratas reenvían el
+      mismo frame). Sin puntos no se comprueba;
+    - oscuro: el brillo medio de una miniatura en grises de `ancho_muestra` píxeles de ancho no
+      llega a `umbral_brillo`;
+    - borroso: la varianza del laplaciano (nitidez) de esa miniatura no llega a `umbral_nitidez`.
+
+    Un frame descartado reutiliza el último resultado. El filtro no descarta nada mientras
+    `suspendido` esté activo (quien analiza lo activa con el temporizador de ojos cerrados
+    corriendo) ni cuando se pide inferir cada frame (el planificador con intervalo 0), y nunca
+    pasan más de `maximo_omitido` segundos sin inferir, así una noche oscura o un stream
+    congelado no dejan al detector ciego.
+
+    En la tubería evaluar() corre en el hilo de preproceso y actualizar() en el del análisis:
+    la zona de los ojos y `suspendido` se leen y cambian bajo un lock.
+    """
+    suspendido = False
+
+    def __init__(self, umbral_duplicado=0.5, umbral_brillo=35.0, umbral_nitidez=10.0, maximo_omitido=0.25,
+                 ancho_muestra=160, ancho_ojos=64, margen_ojos=0.25, rgb=False):
+        """
+        Args:
+            umbral_duplicado (float): Diferencia media (0-255) en la zona de los ojos por debajo
+                                      de la cual el frame se toma como repetido (None para no
+                                      comprobarlo).
+            umbral_brillo (float): Brillo medio (0-255) mínimo (None para no comprobarlo).
+            umbral_nitidez (float): Varianza del laplaciano mínima (None para no comprobarla).
+            maximo_omitido (float): Segundos sin inferir tras los que se infiere igual. No debe
+                                    superar el retardo máximo del planificador.
+            ancho_muestra (int): Ancho de la miniatura para el brillo y la nitidez.
+            ancho_ojos (int): Ancho del recorte de los ojos para comparar frames.
+            margen_ojos (float): Margen alrededor de los ojos, como fracción del ancho de la zona.
+            rgb (bool): Si los frames llegan en RGB en lugar de BGR.
+        """
+        self.umbral_duplicado = umbral_duplicado
+        self.umbral_brillo = umbral_brillo
+        self.umbral_nitidez = umbral_nitidez
+        self.maximo_omitido = maximo_omitido
+        self.ancho_muestra = ancho_muestra
+        self.ancho_ojos = ancho_ojos
+        self.margen_ojos = margen_ojos
+        self.conversion = cv2.COLOR_RGB2GRAY if rgb else cv2.COLOR_BGR2GRAY
+        self.suspendido = False
+        self.zona_ojos = None # (x0, y0, x1, y1) en píxeles del frame
+        self.omitidos = dict.fromkeys(MOTIVOS_OMISION, 0)
+        self._metricas = {motivo: omitidosPorCalidad(motivo) for motivo in MOTIVOS_OMISION}
+        self._ultima_inferencia = None
+        # Buffers reutilizados. El recorte de los ojos del frame actual y el del último inferido
+        # (con la zona en la que se tomó) se intercambian.
+        self._miniatura = None
+        self._gris = None
+        self._laplaciano = None
+        self._color_ojos = None
+        self._ojos = None
+        self._referencia = None
+        self._zona_referencia = None
+        self._bloqueo = threading.Lock()
+
+    def actualizar(self, puntos, suspendido):
+        """
+        Actualiza el filtro con el resultado de una inferencia.
+
+        Args:
+            puntos (np.ndarray or None): Puntos de la inferencia, o None si no hubo rostro.
+            suspendido (bool): Si hay que dejar de descartar frames (temporizador de ojos
+                               cerrados corriendo).
+        """
+        zona = self._zonaOjos(puntos)
+        with self._bloqueo:
+            self.zona_ojos = zona
+            self.suspendido = suspendido
+
+    def _zonaOjos(self, puntos):
+        """
+        Zona de los ojos según los puntos de la última inferencia (None si no hubo rostro).
+        La zona se mantiene mientras los ojos sigan dentro de ella, así dos frames iguales se
+        comparan sobre el mismo recorte.
+        """
+        if puntos is None:
+            return None
+        ojos = puntos[_INDICES_OJOS]
+        x0, y0 = ojos.min(axis=0)
+        x1, y1 = ojos.max(axis=0)
+        zona = self.zona_ojos
+        if zona is not None:
+            zx0, zy0, zx1, zy1 = zona
+            if zx0 <= x0 and zy0 <= y0 and x1 <= zx1 and y1 <= zy1:
+                return zona
+        margen = (x1 - x0) * self.margen_ojos
+        return (int(max(0, x0 - margen)), int(max(0, y0 - margen)), int(x1 + margen) + 1, int(y1 + margen) + 1)
+
+    def evaluar(self, frame, tiempo, cada_frame=False):
+        """
+        Decide si el frame se infiere.
+
+        Args:
+            frame (np.ndarray): Frame BGR (o RGB con rgb=True).
+            tiempo (float): Marca de tiempo de captura.
+            cada_frame (bool): True si el planificador pide inferir cada frame; no se descarta nada.
+
+        Returns:
+            str or None: Motivo de la omisión (uno de MOTIVOS_OMISION) o None si hay que inferirlo.
+        """
+        with self._bloqueo:
+            zona_ojos, suspendido = self.zona_ojos, self.suspendido
+        zona, ojos = self._recorteOjos(frame, zona_ojos)
+        motivo = None
+        if not (suspendido or cada_frame) and self._ultima_inferencia is not None \
+                and tiempo - self._ultima_inferencia < self.maximo_omitido:
+            motivo = self._motivo(frame, zona, ojos)
+        if motivo is not None:
+            self.omitidos[motivo] += 1
+            self._metricas[motivo].incrementar()
+            return motivo
+        self._ultima_inferencia = tiempo
+        self._ojos, self._referencia = self._referencia, ojos
+        self._zona_referencia = zona
+        return None
+
+    def _recorteOjos(self, frame, zona):
+        """
+        Recorte en grises de la zona de los ojos, o (None, None) si no hay zona.
+        """
+        if zona is None or self.umbral_duplicado is None:
+            return None, None
+        x0, y0, x1, y1 = zona
+        recorte = frame[y0:y1, x0:x1]
+        if recorte.shape[0] == 0 or recorte.shape[1] == 0:
+            return None, None
+        forma = (max(1, round(recorte.shape[0] * self.ancho_ojos / recorte.shape[1])), self.ancho_ojos)
+        self._color_ojos = asegurarBuffer(self._color_ojos, forma + frame.shape[2:])
+        cv2.resize(recorte, forma[::-1], dst=self._color_ojos, interpolation=cv2.INTER_AREA)
+        self._ojos = asegurarBuffer(self._ojos, forma)
+        return zona, cv2.cvtColor(self._color_ojos, self.conversion, dst=self._ojos)
+
+    def _motivo(self, frame, zona, ojos):
+        if (ojos is not None and zona == self._zona_referencia and self._referencia is not None
+                and self._referencia.shape == ojos.shape
+                and cv2.norm(ojos, self._referencia, cv2.NORM_L1) / ojos.size < self.umbral_duplicado):
+            return "duplicado"
+        if self.umbral_brillo is None and self.umbral_nitidez is None:
+            return None
+
+        alto, ancho = frame.shape[:2]
+        forma = (max(1, round(alto * self.ancho_muestra / ancho)), self.ancho_muestra)
+        self._miniatura = asegurarBuffer(self._miniatura, forma + frame.shape[2:])
+        cv2.resize(frame, forma[::-1], dst=self._miniatura, interpolation=cv2.INTER_AREA)
+        self._gris = asegurarBuffer(self._gris, forma)
+        gris = cv2.cvtColor(self._miniatura, self.conversion, dst=self._gris)
+        brillo = cv2.mean(gris)[0]
+        BRILLO_FRAME.fijar(brillo)
+        if self.umbral_brillo is not None and brillo < self.umbral_brillo:
+            return "oscuro"
+        self._laplaciano = asegurarBuffer(self._laplaciano, gris.shape, np.float32)
+        cv2.Laplacian(gris, cv2.CV_32F, dst=self._laplaciano)
+        nitidez = cv2.meanStdDev(self._laplaciano)[1][0, 0] ** 2
+        NITIDEZ_FRAME.fijar(nitidez)
+        if self.umbral_nitidez is not None and nitidez < self.umbral_nitidez:
+            return "borroso"
+        return None
@@ -1,34 +1,80 @@
+import os
+import threading
+import time
+from collections import deque
+
 import cv2 #Opencv
 
+from buffers_frames import PoolBuffers
+from captura_pantalla import FuentePantalla, esFuentePantalla, interpretarFuentePantalla
+from metricas import REGISTRO
+
+# OpenCV solo toma las opciones de FFmpeg de esta variable de entorno, que es de todo el proceso
+VARIABLE_OPCIONES_FFMPEG = "OPENCV_FFMPEG_CAPTURE_OPTIONS"
+OPCIONES_FFMPEG_BAJA_LATENCIA = "fflags;nobuffer|flags;low_delay"
+_bloqueo_entorno_ffmpeg = threading.Lock()
+
 class Captura:
     """
     Clase para manejar la captura de video desde diferentes fuentes.
     """
     captura=None
     fuente_video=None
+    modo_hilo=False
+    frames_descartados=0
+    intervalo_minimo=0.0 # Segundos entre frames decodificados (modo reposo); 0 para todos
 
-    def __init__(self, fuente_video=0):
+    def __init__(self, fuente_video=0, modo_hilo=False, tamano_buffer=2):
         """
         Inicializa la captura de video.
 
         Args:
             fuente_video (int or str): Índice de la cámara (e.g., 0 para webcam integrada)
                                        o URL del stream de video (e.g., DroidCam IP).
+                                       "pantalla:izq,arriba,ancho,alto@fps" captura una
+                                       región de la pantalla (ver captura_pantalla.py).
                                        Por defecto es 0.
+            modo_hilo (bool): Si es True, un hilo decodifica frames continuamente y
+                              leer() entrega siempre el más reciente, descartando los viejos.
+            tamano_buffer (int): Capacidad del buffer circular usado en modo hilo.
+
+        Con `intervalo_minimo` > 0 solo se decodifica un frame por intervalo: los demás se
+        sacan del stream con grab(), sin decodificarlos, para que no se acumulen.
+        Los frames se decodifican sobre arreglos reutilizados (un pool en modo hilo, uno solo
+        sin hilo), así que no se reserva memoria por frame. Las fuentes de pantalla entregan
+        los frames ya en RGB (`rgb` es True); las demás, en BGR como OpenCV.
         """
         self.fuente_video = fuente_video
+        self.rgb = esFuentePantalla(fuente_video)
+        self.modo_hilo = modo_hilo
+        self.frames_descartados = 0
+        self.frames_salteados = 0
+        self.intervalo_minimo = 0.0
+        self._ultima_decodificacion = 0.0
+        self._buffer = deque(maxlen=max(1, tamano_buffer))
+        self._condicion = threading.Condition()
+        self._detener = threading.Event()
+        self._hilo = None
+        self._secuencia = 0 # Número del último frame decodificado
+        self._secuencia_leida = 0 # Número del último frame entregado
+        self._fin_stream = False
+        # Buffer circular + el frame entregado + el que se está decodificando
+        self._pool = PoolBuffers(maximo_libres=self._buffer.maxlen + 2)
+        self._prestado = None # Frame entregado por leer(), en uso hasta la próxima lectura
+        self._destino = None # Arreglo reutilizado sin hilo
         print(f"Inicializando captura desde: {self.fuente_video}")
 
     def getCaptura(self):
         """
         Intenta abrir la fuente de video especificada.
+        En modo hilo también arranca el hilo de lectura.
 
         Returns:
             cv2.VideoCapture or None: Objeto de captura si tiene éxito, None si falla.
         """
         try:
-            # Intenta abrir la fuente de video (índice o URL)
-            self.captura = cv2.VideoCapture(self.fuente_video)
+            # Intenta abrir la fuente de video (índice, URL o pantalla)
+            self.captura = self._crearCaptura()
 
             # Verifica si la captura se abrió correctamente
             if not self.captura.isOpened():
@@ -41,13 +87,405 @@ class Captura:
             print(f"Excepción al abrir la fuente de video: {e}")
             self.captura = None
 
+        if self.captura is not None and self.modo_hilo:
+            self._iniciarHilo()
+
         return self.captura
 
+    def _crearCaptura(self):
+        if self.rgb:
+            region, fps = interpretarFuentePantalla(self.fuente_video)
+            return FuentePantalla(region=region, fps=fps)
+        return cv2.VideoCapture(self.fuente_video)
+
+    def _iniciarHilo(self):
+        """
+        Arranca el hilo que decodifica frames en segundo plano.
+        """
+        self._detener.clear()
+        self._fin_stream = False
+        self._hilo = threading.Thread(target=self._bucleLectura, name="CapturaFrames", daemon=True)
+        self._hilo.start()
+
+    def _bucleLectura(self):
+        """
+        Lee frames sin pausa y los guarda en el buffer circular junto a su marca de tiempo.
+        Si el análisis es más lento que el stream, los frames viejos se pisan en lugar de acumularse.
+        Cada frame se decodifica en un arreglo del pool y el que sale del buffer vuelve al pool,
+        salvo que sea el que tiene el bucle de análisis.
+        """
+        forma = None
+        while not self._detener.is_set():
+            estado, frame, tiempo_captura = self._leerEnPool(self.captura, forma)
+            if not estado:
+                self._finalizarStream()
+                break
+            forma = frame.shape
+            self._guardarFrame(frame, tiempo_captura)
+
+    def _leerEnPool(self, captura, forma):
+        """
+        Decodifica el próximo frame en un arreglo del pool (si ya se conoce la resolución).
+
+        Returns:
+            tuple: (estado, frame, tiempo_captura)
+        """
+        if not self._saltarFrames(captura):
+            return False, None, time.perf_counter()
+        destino = self._pool.tomar(forma) if forma is not None else None
+        estado, frame = captura.read(destino)
+        tiempo_captura = self._ultima_decodificacion = time.perf_counter()
+        if destino is not None and frame is not destino:
+            self._pool.devolver(destino) # Cambió la resolución o falló la lectura
+        return estado, frame, tiempo_captura
+
+    def _saltarFrames(self, captura):
+        """
+        Con `intervalo_minimo`, saca del stream sin decodificar los frames que llegan antes de
+        que pase el intervalo desde el último decodificado.
+
+        Returns:
+            bool: False si falló una lectura.
+        """
+        while (self.intervalo_minimo and not self._detener.is_set()
+               and time.perf_counter() - self._ultima_decodificacion < self.intervalo_minimo):
+            if not captura.grab():
+                return False
+            self.frames_salteados += 1
+        return True
+
+    def _guardarFrame(self, frame, tiempo_captura):
+        """
+        Agrega un frame al buffer circular; el que sale vuelve al pool salvo que lo tenga el
+        bucle de análisis.
+        """
+        with self._condicion:
+            if len(self._buffer) == self._buffer.maxlen:
+                descartado = self._buffer[0][1]
+                if descartado is not self._prestado:
+                    self._pool.devolver(descartado)
+            self._secuencia += 1
+            self._buffer.append((self._secuencia, frame, tiempo_captura))
+            self._condicion.notify_all()
+
+    def _finalizarStream(self):
+        with self._condicion:
+            self._fin_stream = True
+            self._condicion.notify_all()
+
+    @property
+    def finalizada(self):
+        """
+        True si la fuente no va a entregar más frames. Esta captura no reconecta: sin hilo
+        cualquier lectura fallida se toma como el final; en modo hilo solo cuando el hilo de
+        lectura llegó al fin del archivo o falló el dispositivo, así que un leer() que vence el
+        timeout por un frame atrasado no termina el análisis.
+        """
+        if not self.modo_hilo:
+            return True
+        return self.captura is None or self._hilo is None or self._fin_stream
+
+    def leer(self, timeout=1.0):
+        """
+        Devuelve el frame más reciente con su marca de tiempo de captura.
+
+        La marca es de time.perf_counter(): monotónica (no salta si se cambia la hora del
+        equipo), de alta resolución y comparable con el resto de las marcas del proceso, así
+        que sirve para medir la latencia de cada frame hasta el Arduino.
+
+        En modo hilo espera (hasta `timeout` segundos, más `intervalo_minimo`) un frame que no
+        se haya entregado todavía y cuenta como descartados los que quedaron entre medio.
+
+        El frame es válido hasta la próxima llamada a leer(): después su memoria se reutiliza
+        para otro frame. Para conservarlo hay que copiarlo.
+
+        Returns:
+            tuple: (estado, frame, tiempo_captura). estado es False si no hay frame.
+        """
+        if self.captura is None:
+            return False, None, None
+
+        if not self.modo_hilo:
+            if not self._saltarFrames(self.captura):
+                return False, None, None
+            estado, frame = self.captura.read(self._destino)
+            if estado:
+                self._destino = frame
+            self._ultima_decodificacion = time.perf_counter()
+            return estado, frame, self._ultima_decodificacion
+
+        with self._condicion:
+            hay_nuevo = self._condicion.wait_for(
+                lambda: self._secuencia > self._secuencia_leida or self._fin_stream,
+                timeout=timeout + self.intervalo_minimo)
+            if not hay_nuevo or self._secuencia <= self._secuencia_leida:
+                return False, None, None
+            secuencia, frame, tiempo_captura = self._buffer[-1]
+            self.frames_descartados += secuencia - self._secuencia_leida - 1
+            self._secuencia_leida = secuencia
+            # El frame entregado antes ya no está en uso; si salió del buffer vuelve al pool
+            anterior, self._prestado = self._prestado, frame
+            if anterior is not None and anterior is not frame and all(f is not anterior for _, f, _ in self._buffer):
+                self._pool.devolver(anterior)
+        return True, frame, tiempo_captura
+
     def liberar(self):
         """
-        Libera el objeto de captura si está abierto.
+        Detiene el hilo de lectura (si existe) y libera el objeto de captura si está abierto.
         """
+        if self._hilo is not None:
+            self._detener.set()
+            self._hilo.join(timeout=2)
+            self._hilo = None
+            print(f"Frames descartados por atraso del análisis: {self.frames_descartados}")
         if self.captura and self.captura.isOpened():
             self.captura.release()
             print("Captura de video liberada.")
 
+
+class CapturaResiliente(Captura):
+    """
+    Captura en hilo para streams en vivo (DroidCam por HTTP, RTSP, cámaras USB) que sobrevive
+    a los cortes sin cortar el análisis.
+
+    - Abre la fuente con el buffer del decodificador al mínimo y, si OpenCV lo permite, con
+      timeouts de apertura y de lectura para que un stream colgado no bloquee para siempre.
+    - Un corte es una lectura fallida o `timeout_lectura` segundos sin frames. Si read() quedó
+      colgado, ese hilo se abandona (termina solo cuando read() vuelve) y se abre una captura
+      nueva en otro hilo.
+    - Reconecta con espera exponencial y, al volver, descarta los frames que el decodificador
+      acumuló para no arrastrar latencia.
+    - Mientras dura el corte leer() devuelve (False, None, None) y `finalizada` sigue en False,
+      así el bucle de análisis espera sin perder su estado. Con un archivo de video el final
+      del archivo sí termina la captura.
+    """
+    def __init__(self, fuente_video=0, tamano_buffer=2, timeout_lectura=2.0, espera_inicial=0.5,
+                 espera_maxima=10.0, max_frames_vaciado=60, nombre="camara"):
+        """
+        Args:
+            fuente_video (int or str): Ver Captura.
+            tamano_buffer (int): Capacidad del buffer circular.
+            timeout_lectura (float): Segundos sin frames para dar el stream por cortado.
+            espera_inicial (float): Segundos antes del primer reintento de conexión.
+            espera_maxima (float): Tope de la espera entre reintentos.
+            max_frames_vaciado (int): Frames acumulados que se descartan como máximo al reconectar.
+            nombre (str): Etiqueta de las métricas de esta fuente.
+        """
+        super().__init__(fuente_video=fuente_video, modo_hilo=True, tamano_buffer=tamano_buffer)
+        self.timeout_lectura = timeout_lectura
+        self.espera_inicial = espera_inicial
+        self.espera_maxima = espera_maxima
+        self.max_frames_vaciado = max_frames_vaciado
+        self.es_archivo = isinstance(fuente_video, str) and os.path.isfile(fuente_video)
+        self.cortes = 0
+        self.reconexiones = 0
+        self.segundos_sin_video = 0.0
+        self._generacion = 0 # Cambia al abandonar un hilo lector colgado
+        self._inicio_corte = None
+        self._ultimo_frame = time.perf_counter()
+        etiquetas = {"fuente": nombre}
+        self._metrica_cortes = REGISTRO.contador("somnolencia_cortes_camara_total",
+                                                 "Cortes del stream de video (lectura fallida o sin frames)",
+                                                 etiquetas)
+        self._metrica_reconexiones = REGISTRO.contador("somnolencia_reconexiones_camara_total",
+                                                       "Reconexiones del stream de video tras un corte",
+                                                       etiquetas)
+        self._metrica_sin_video = REGISTRO.contador("somnolencia_camara_sin_video_segundos_total",
+                                                    "Segundos acumulados sin video por cortes del stream",
+                                                    etiquetas)
+        self._metrica_conectada = REGISTRO.medidor("somnolencia_camara_conectada",
+                                                   "1 si el stream de video entrega frames, 0 durante un corte",
+                                                   etiquetas)
+
+    def _abrir(self):
+        """
+        Abre la fuente con el menor buffer posible.
+
+        Returns:
+            cv2.VideoCapture or None
+        """
+        captura = None
+        try:
+            if isinstance(self.fuente_video, str) and not self.es_archivo and not self.rgb:
+                captura = self._abrirStream()
+            if captura is None:
+                captura = self._crearCaptura()
+            if not captura.isOpened():
+                captura.release()
+                return None
+            captura.set(cv2.CAP_PROP_BUFFERSIZE, 1) # Lo ignoran los backends que no lo soportan
+            return captura
+        except Exception as e:
+            print(f"Excepción al abrir la fuente de video: {e}")
+            return None
+
+    def _abrirStream(self):
+        """
+        Abre un stream de red sin el buffer propio de FFmpeg y con timeouts (OpenCV >= 4.6).
+
+        Las opciones de FFmpeg se fijan en la variable de entorno solo mientras dura la apertura
+        y después se restaura el valor anterior, para no cambiar las demás capturas del proceso.
+        Si el usuario ya la había definido se respeta su valor.
+
+        Returns:
+            cv2.VideoCapture
+        """
+        with _bloqueo_entorno_ffmpeg:
+            anterior = os.environ.get(VARIABLE_OPCIONES_FFMPEG)
+            if anterior is None:
+                os.environ[VARIABLE_OPCIONES_FFMPEG] = OPCIONES_FFMPEG_BAJA_LATENCIA
+            try:
+                if hasattr(cv2, "CAP_PROP_READ_TIMEOUT_MSEC"):
+                    milisegundos = int(self.timeout_lectura * 1000)
+                    return cv2.VideoCapture(self.fuente_video, cv2.CAP_ANY,
+                                            [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, max(milisegundos, 5000),
+                                             cv2.CAP_PROP_READ_TIMEOUT_MSEC, milisegundos])
+                return self._crearCaptura()
+            finally:
+                if anterior is None:
+                    os.environ.pop(VARIABLE_OPCIONES_FFMPEG, None)
+
+    def getCaptura(self):
+        """
+        Abre la fuente y arranca el hilo de lectura, que desde ahí se encarga de reconectar.
+
+        Returns:
+            cv2.VideoCapture or None: Objeto de captura si la primera apertura tuvo éxito.
+        """
+        self.captura = self._abrir()
+        if self.captura is None:
+            print(f"Error: No se pudo abrir la fuente de video: {self.fuente_video}")
+            return None
+        print(f"Fuente de video abierta correctamente: {self.fuente_video}")
+        self._ultimo_frame = time.perf_counter()
+        self._iniciarHilo()
+        return self.captura
+
+    def _iniciarHilo(self):
+        self._detener.clear()
+        self._fin_stream = False
+        self._hilo = threading.Thread(target=self._bucleLectura, args=(self._generacion, self.captura),
+                                      name="CapturaFrames", daemon=True)
+        self._hilo.start()
+
+    def _bucleLectura(self, generacion, captura):
+        """
+        Lee frames mientras el hilo siga siendo el vigente; ante una lectura fallida registra el
+        corte y reconecta con espera exponencial.
+        """
+        forma = None
+        espera = self.espera_inicial
+        while not self._detener.is_set() and generacion == self._generacion:
+            if captura is None:
+                captura = self._abrir()
+                if captura is None:
+                    self._detener.wait(espera)
+                    espera = min(espera * 2, self.espera_maxima)
+                    continue
+                if generacion != self._generacion:
+                    break
+                self.captura = captura
+                self._vaciar(captura)
+                self._registrarReconexion()
+                espera = self.espera_inicial
+
+            estado, frame, tiempo_captura = self._leerEnPool(captura, forma)
+            if generacion != self._generacion:
+                break # Este hilo fue reemplazado mientras read() estaba colgado
+            if not estado:
+                if self.es_archivo:
+                    self._finalizarStream()
+                    break
+                self._registrarCorte("lectura fallida")
+                captura.release()
+                captura = None
+                continue
+            forma = frame.shape
+            self._ultimo_frame = tiempo_captura
+            self._guardarFrame(frame, tiempo_captura)
+        if captura is not None and generacion != self._generacion:
+            captura.release()
+
+    def _vaciar(self, captura):
+        """
+        Descarta los frames que el decodificador ya tenía acumulados: mientras grab() vuelve
+        casi al instante el frame no es en vivo. leer() también suma descartados, así que la
+        cuenta se actualiza bajo el lock.
+        """
+        vaciados = 0
+        for _ in range(self.max_frames_vaciado):
+            inicio = time.perf_counter()
+            if not captura.grab() or time.perf_counter() - inicio > 0.005:
+                break
+            vaciados += 1
+        with self._condicion:
+            self.frames_descartados += vaciados
+
+    def _registrarCorte(self, motivo):
+        """
+        Registra el comienzo de un corte, salvo que ya haya uno en curso. Lo llaman tanto el
+        hilo lector como leer(), así que se hace bajo el lock.
+
+        Returns:
+            bool: True si el corte es nuevo.
+        """
+        with self._condicion:
+            if self._inicio_corte is not None:
+                return False
+            self._inicio_corte = self._ultimo_frame # El video falta desde el último frame recibido
+            self.cortes += 1
+            self._metrica_cortes.incrementar()
+            self._metrica_conectada.fijar(0)
+        print(f"Corte del stream de video ({motivo}). Reconectando...")
+        return True
+
+    def _registrarReconexion(self):
+        with self._condicion:
+            if self._inicio_corte is None:
+                return
+            duracion = time.perf_counter() - self._inicio_corte
+            self._inicio_corte = None
+            self.reconexiones += 1
+            self.segundos_sin_video += duracion
+            self._ultimo_frame = time.perf_counter()
+            self._metrica_reconexiones.incrementar()
+            self._metrica_sin_video.incrementar(duracion)
+            self._metrica_conectada.fijar(1)
+        print(f"Stream de video recuperado tras {duracion:.1f} s sin frames.")
+
+    def leer(self, timeout=1.0):
+        """
+        Como Captura.leer(). Si pasan `timeout_lectura` segundos sin frames da el stream por
+        cortado y arranca un hilo lector nuevo, que reconecta.
+        """
+        estado, frame, tiempo_captura = super().leer(timeout)
+        if (not estado and self._inicio_corte is None and not self.finalizada
+                and time.perf_counter() - self._ultimo_frame > self.timeout_lectura + self.intervalo_minimo
+                and self._registrarCorte(f"sin frames en {self.timeout_lectura:.1f} s")):
+            # Si el hilo lector registró el corte primero, ya está reconectando él
+            with self._condicion:
+                self._generacion += 1
+            self._hilo = threading.Thread(target=self._bucleLectura, args=(self._generacion, None),
+                                          name="CapturaFrames", daemon=True)
+            self._hilo.start()
+        return estado, frame, tiempo_captura
+
+    @property
+    def finalizada(self):
+        return self._fin_stream or self._detener.is_set()
+
+    def liberar(self):
+        """
+        Detiene la lectura y libera la captura. Un hilo colgado en read() se abandona.
+        """
+        self._detener.set()
+        with self._condicion:
+            self._generacion += 1
+        if self._hilo is not None:
+            self._hilo.join(timeout=2)
+            self._hilo = None
+        print(f"Frames descartados: {self.frames_descartados}, cortes: {self.cortes}, "
+              f"tiempo sin video: {self.segundos_sin_video:.1f} s")
+        if self.captura is not None and self.captura.isOpened():
+            self.captura.release()
+            print("Captura de video liberada.")
@@ -0,0 +1,124 @@
+import time
+
+import cv2 # Opencv
+import numpy as np
+
+# Prefijo de las fuentes de video de pantalla: "pantalla", "pantalla:izq,arriba,ancho,alto",
+# "pantalla@fps" o "pantalla:izq,arriba,ancho,alto@fps"
+PREFIJO_PANTALLA = "pantalla"
+FPS_PANTALLA = 30.0
+
+
+def esFuentePantalla(fuente_video):
+    return isinstance(fuente_video, str) and fuente_video.split(":", 1)[0].split("@", 1)[0] == PREFIJO_PANTALLA
+
+
+def interpretarFuentePantalla(fuente_video):
+    """
+    Interpreta una fuente de pantalla.
+
+    Returns:
+        tuple: (región como diccionario de mss o None para el monitor principal, fps)
+    """
+    texto, _, fps = fuente_video.partition("@")
+    _, _, region = texto.partition(":")
+    if region:
+        izquierda, arriba, ancho, alto = (int(valor) for valor in region.split(","))
+        region = {"left": izquierda, "top": arriba, "width": ancho, "height": alto}
+    return region or None, float(fps) if fps else FPS_PANTALLA
+
+
+class FuentePantalla:
+    """
+    Región de la pantalla como fuente de video, con la misma interfaz que cv2.VideoCapture
+    (isOpened, read, grab, get, set, release), así Captura la usa como a una cámara. Sirve
+    para vigilar un video remoto que se muestra en una consola.
+
+    Cada captura de mss se envuelve sin copiar (np.frombuffer sobre los bytes BGRA) y se
+    convierte en una sola pasada directo a RGB, el orden que necesita la malla facial, sobre el
+    arreglo destino de read(). read() además espacia los frames a `fps` para no capturar la
+    pantalla más rápido de lo necesario.
+    """
+    def __init__(self, region=None, fps=FPS_PANTALLA, monitor=1):
+        """
+        Args:
+            region (dict, opcional): {"left", "top", "width", "height"} en píxeles de pantalla.
+                                     Por defecto, el monitor completo.
+            fps (float): Frames por segundo que entrega read() como máximo.
+            monitor (int): Monitor de mss cuando no se da una región (1 = principal).
+        """
+        try:
+            import mss
+        except ImportError as e:
+            raise RuntimeError("La captura de pantalla necesita mss: pip install mss") from e
+        self._mss = mss
+        self.periodo = 1.0 / fps if fps else 0.0
+        with mss.mss() as pantalla:
+            self.region = dict(region) if region else dict(pantalla.monitors[monitor])
+        self._pantalla = None # La instancia de mss se crea en el hilo que lee
+        self._siguiente = None
+        self._abierta = True
+
+    def isOpened(self):
+        return self._abierta
+
+    def _esperarTurno(self):
+        """
+        Duerme hasta el próximo frame según los fps pedidos; si la lectura viene atrasada no
+        acumula deuda.
+        """
+        ahora = time.perf_counter()
+        if self._siguiente is None or self._siguiente < ahora:
+            self._siguiente = ahora
+        else:
+            time.sleep(self._siguiente - ahora)
+        self._siguiente += self.periodo
+
+    def _capturar(self):
+        if self._pantalla is None:
+            self._pantalla = self._mss.mss()
+        captura = self._pantalla.grab(self.region)
+        return np.frombuffer(captura.raw, dtype=np.uint8).reshape(captura.height, captura.width, 4)
+
+    def grab(self):
+        if not self._abierta:
+            return False
+        self._esperarTurno()
+        return True
+
+    def read(self, image=None):
+        """
+        Captura la región y la deja en RGB sobre `image` si tiene la forma correcta.
+
+        Returns:
+            tuple: (estado, frame RGB)
+        """
+        if not self._abierta:
+            return False, image
+        self._esperarTurno()
+        try:
+            bgra = self._capturar()
+        except Exception as e:
+            print(f"Error al capturar la pantalla: {e}")
+            return False, image
+        if image is None or image.shape != bgra.shape[:2] + (3,):
+            image = None
+        return True, cv2.cvtColor(bgra, cv2.COLOR_BGRA2RGB, dst=image)
+
+    def get(self, propiedad):
+        if propiedad == cv2.CAP_PROP_FPS:
+            return 1.0 / self.periodo if self.periodo else 0.0
+        if propiedad == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.region["width"])
+        if propiedad == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.region["height"])
+        return 0.0
+
+    def set(self, propiedad, valor):
+        return False
+
+    def release(self):
+        self._abierta = False
+        if self._pantalla is not None:
+            self._pantalla.close()
+            self._pantalla = None
@@ -1,6 +1,31 @@
 import serial # Para comunicación serial
+import threading
 import time   # Para pausas
 
+from metricas import REGISTRO, latenciaAlerta, latenciaEtapa
+from protocolo_serial import (DecodificadorTramas, codificarTrama, NIVEL_NORMAL, NIVEL_SOMNOLENCIA,
+                              TIPO_ACK, TIPO_ALERTA, TIPO_LATIDO)
+
+# Texto que imprime el sketch al terminar su setup()
+MENSAJE_LISTO = "Arduino listo"
+
+# Métricas de la conexión serial
+LATENCIA_ENVIO = latenciaEtapa("envio_serial")
+ERRORES_SERIAL = REGISTRO.contador("somnolencia_errores_serial_total",
+                                   "Errores al conectar o escribir en el puerto serial")
+RECONEXIONES_SERIAL = REGISTRO.contador("somnolencia_reconexiones_serial_total",
+                                        "Conexiones con Arduino restablecidas tras un error")
+RTT_SERIAL = REGISTRO.histograma("somnolencia_rtt_serial_segundos",
+                                 "Tiempo entre el envío de una trama y su confirmación del Arduino")
+# Recorrido de cada alerta desde la captura del frame: escrita en el puerto y confirmada por el Arduino
+LATENCIA_ALERTA_ESCRITURA = latenciaAlerta("escritura_serial")
+LATENCIA_ALERTA_CONFIRMACION = latenciaAlerta("confirmacion_arduino")
+RETRANSMISIONES_SERIAL = REGISTRO.contador("somnolencia_retransmisiones_serial_total",
+                                           "Tramas de alerta reenviadas por falta de confirmación")
+
+# Señales del protocolo ASCII y su nivel equivalente en el protocolo de tramas
+NIVEL_POR_SENAL = {'0': NIVEL_NORMAL, '1': NIVEL_SOMNOLENCIA}
+
 class ArduinoComunicador:
     """
     Clase para manejar la comunicación serial con Arduino.
@@ -9,19 +34,30 @@ class ArduinoComunicador:
     puerto = None
     baud_rate = 9600 # Tasa de baudios estándar
     conectado = False
+    protocolo = "ascii"
+    rtt_ultimo = None # Último tiempo de ida y vuelta medido con un ACK (segundos)
+    ultimo_ack = None # Momento (time.perf_counter, el mismo reloj que Captura) del último ACK recibido
+    nivel_confirmado = None # Nivel de alerta que el Arduino informó en su último ACK
 
-    def __init__(self, puerto='COM7', baud_rate=9600, tiempo_espera=2):
+    def __init__(self, puerto='COM7', baud_rate=9600, tiempo_espera=2, protocolo="ascii"):
         """
         Inicializa el comunicador Arduino.
 
         Args:
             puerto (str): Puerto serial al que está conectado Arduino (e.g., 'COM7').
             baud_rate (int): Tasa de baudios para la comunicación (debe coincidir con Arduino).
-            tiempo_espera (int): Segundos para esperar a que se establezca la conexión.
+            tiempo_espera (int): Segundos máximos para esperar el mensaje de inicio del sketch.
+            protocolo (str): "ascii" envía los bytes '0'/'1'; "tramas" usa el protocolo con
+                             secuencia, checksum y confirmaciones de protocolo_serial.py.
         """
         self.puerto = puerto
         self.baud_rate = baud_rate
         self.tiempo_espera = tiempo_espera
+        self.protocolo = protocolo
+        self._secuencia = 0
+        self._pendientes = {} # secuencia -> (momento de envío, tipo, captura del frame o None)
+        self._ultima_alerta = None # (secuencia, momento, nivel, captura) de la última trama de alerta
+        self._decodificador = DecodificadorTramas()
 
     def conectar(self):
         """
@@ -33,56 +69,215 @@ class ArduinoComunicador:
 
         try:
             print(f"Intentando conectar a Arduino en {self.puerto} a {self.baud_rate} baudios...")
-            self.arduino = serial.Serial(self.puerto, self.baud_rate, timeout=1)
-            time.sleep(self.tiempo_espera) # Espera a que la conexión serial se establezca
+            # serial_for_url acepta nombres de puerto y también URLs como loop:// o socket://
+            self.arduino = serial.serial_for_url(self.puerto, self.baud_rate, timeout=0.1)
+            if self.esperar_listo():
+                print("Conexión con Arduino establecida.")
+            else:
+                print(f"No llegó '{MENSAJE_LISTO}' en {self.tiempo_espera} s; se asume que Arduino está listo.")
             self.conectado = True
-            print("Conexión con Arduino establecida.")
+            self._pendientes.clear()
+            self._ultima_alerta = None
+            self.ultimo_ack = time.perf_counter()
             return True
         except serial.SerialException as e:
+            ERRORES_SERIAL.incrementar()
             print(f"Error al conectar con Arduino en {self.puerto}: {e}")
             print("El programa continuará sin comunicación con Arduino.")
             self.arduino = None
             self.conectado = False
             return False
         except Exception as e:
+            ERRORES_SERIAL.incrementar()
             print(f"Error inesperado al conectar con Arduino: {e}")
             self.arduino = None
             self.conectado = False
             return False
 
-    def enviar_senal(self, senal):
+    def esperar_listo(self):
+        """
+        Espera el mensaje de inicio del sketch en lugar de una pausa fija. Al abrir el puerto
+        Arduino se reinicia, así que la conexión está lista en cuanto imprime MENSAJE_LISTO.
+
+        Returns:
+            bool: True si llegó el mensaje antes de tiempo_espera segundos.
+        """
+        limite = time.perf_counter() + self.tiempo_espera
+        while time.perf_counter() < limite:
+            linea = self.arduino.readline()
+            if MENSAJE_LISTO.encode() in linea:
+                return True
+        return False
+
+    def enviar_senal(self, senal, tiempo_captura=None):
         """
         Envía una señal (byte) a Arduino si está conectado.
 
         Args:
             senal (str): La señal a enviar ('1' para alerta, '0' para normalidad).
+            tiempo_captura (float, opcional): Marca de captura del frame que originó la señal.
+        """
+        if senal not in NIVEL_POR_SENAL:
+            print(f"Advertencia: Señal desconocida '{senal}'. No se envió nada.")
+            return
+        self.enviar_nivel(NIVEL_POR_SENAL[senal], tiempo_captura)
+
+    def enviar_nivel(self, nivel, tiempo_captura=None):
+        """
+        Envía un nivel de alerta. Con el protocolo ASCII solo existe encendido ('1', nivel de
+        somnolencia) o apagado ('0').
+
+        Si se da tiempo_captura (time.perf_counter() de la captura del frame que originó el
+        nivel), se registra cuánto tardó en escribirse y, con tramas, en confirmarse.
+        """
+        if self.protocolo == "tramas":
+            momento = self._enviarAlerta(nivel, tiempo_captura)
+        else:
+            momento = time.perf_counter() if self._escribir(b'1' if nivel >= NIVEL_SOMNOLENCIA else b'0') else None
+            if momento is not None and tiempo_captura is not None and nivel >= NIVEL_SOMNOLENCIA:
+                # Sin tramas no hay confirmación: la traza termina en la escritura
+                print(f"Alerta escrita en el puerto serial a los {(momento - tiempo_captura) * 1000:.1f} ms "
+                      f"de la captura del frame")
+        if momento is not None and tiempo_captura is not None:
+            LATENCIA_ALERTA_ESCRITURA.observar(momento - tiempo_captura)
+
+    def reenviar_alerta(self):
+        """
+        Vuelve a enviar la última trama de alerta con una secuencia nueva. Conserva la captura
+        del frame que la originó, así la confirmación mide el tiempo total hasta el Arduino.
+        """
+        if self._ultima_alerta is not None:
+            _, _, nivel, tiempo_captura = self._ultima_alerta
+            self._enviarAlerta(nivel, tiempo_captura)
+
+    def _enviarAlerta(self, nivel, tiempo_captura):
+        """
+        Escribe una trama de alerta y la deja pendiente de ACK.
+
+        Returns:
+            float or None: Momento de la escritura, o None si no se pudo escribir.
+        """
+        secuencia = self._siguienteSecuencia()
+        if not self._escribir(codificarTrama(TIPO_ALERTA, secuencia, nivel)):
+            return None
+        momento = time.perf_counter()
+        self._pendientes[secuencia] = (momento, TIPO_ALERTA, tiempo_captura)
+        self._ultima_alerta = (secuencia, momento, nivel, tiempo_captura)
+        return momento
+
+    def enviar_latido(self):
+        """
+        Envía una trama de latido para comprobar que el enlace sigue vivo (solo protocolo de tramas).
+        """
+        if self.protocolo != "tramas":
+            return
+        secuencia = self._siguienteSecuencia()
+        if self._escribir(codificarTrama(TIPO_LATIDO, secuencia)):
+            self._pendientes[secuencia] = (time.perf_counter(), TIPO_LATIDO, None)
+
+    def alerta_sin_confirmar(self, timeout):
+        """
+        Devuelve el nivel de la última trama de alerta si lleva más de `timeout` segundos sin ACK.
+        """
+        if self._ultima_alerta is None:
+            return None
+        secuencia, momento, nivel, _ = self._ultima_alerta
+        if secuencia in self._pendientes and time.perf_counter() - momento > timeout:
+            return nivel
+        return None
+
+    def procesar_entrada(self):
+        """
+        Lee lo que haya llegado del Arduino sin bloquear. Con el protocolo de tramas registra
+        los ACK y mide el tiempo de ida y vuelta; con el ASCII descarta el texto de depuración
+        para que no se acumule en el buffer del sistema operativo.
+        """
+        if not self.conectado or not self.arduino or not self.arduino.is_open:
+            return
+        try:
+            disponibles = self.arduino.in_waiting
+            if not disponibles:
+                return
+            if self.protocolo != "tramas":
+                self.arduino.reset_input_buffer()
+                return
+            datos = self.arduino.read(disponibles)
+        except serial.SerialException as e:
+            ERRORES_SERIAL.incrementar()
+            print(f"Error al leer de Arduino: {e}")
+            self.cerrar()
+            return
+
+        ahora = time.perf_counter()
+        for tipo, secuencia, dato in self._decodificador.agregar(datos):
+            if tipo != TIPO_ACK:
+                continue
+            self.ultimo_ack = ahora
+            self.nivel_confirmado = dato
+            pendiente = self._pendientes.pop(secuencia, None)
+            if pendiente is None:
+                continue
+            momento, _, tiempo_captura = pendiente
+            self.rtt_ultimo = ahora - momento
+            RTT_SERIAL.observar(self.rtt_ultimo)
+            if tiempo_captura is not None:
+                self._trazarConfirmacion(momento, tiempo_captura, dato, ahora)
+        # Olvidar las tramas que ya no van a ser confirmadas
+        for secuencia in [s for s, pendiente in self._pendientes.items() if ahora - pendiente[0] > 5.0]:
+            del self._pendientes[secuencia]
+
+    def _trazarConfirmacion(self, momento, tiempo_captura, nivel, ahora):
+        """
+        Cierra la traza de una alerta confirmada: registra el tiempo desde la captura del frame
+        hasta el ACK y descarta los reenvíos de la misma alerta, para no contarla dos veces.
+        """
+        LATENCIA_ALERTA_CONFIRMACION.observar(ahora - tiempo_captura)
+        for secuencia in [s for s, pendiente in self._pendientes.items() if pendiente[2] == tiempo_captura]:
+            del self._pendientes[secuencia]
+        if nivel >= NIVEL_SOMNOLENCIA:
+            print(f"Alerta confirmada por Arduino a los {(ahora - tiempo_captura) * 1000:.1f} ms de la captura "
+                  f"del frame (último envío a los {(momento - tiempo_captura) * 1000:.1f} ms)")
+
+    def _siguienteSecuencia(self):
+        self._secuencia = (self._secuencia + 1) & 0xFF
+        return self._secuencia
+
+    def _escribir(self, datos):
+        """
+        Escribe bytes en el puerto. Ante un error cierra la conexión.
+
+        Returns:
+            bool: True si se escribió.
         """
         if not self.conectado or not self.arduino or not self.arduino.is_open:
             # print("Advertencia: No hay conexión con Arduino para enviar señal.")
-            return # No hacer nada si no está conectado
+            return False # No hacer nada si no está conectado
 
+        inicio = time.perf_counter()
         try:
-            if senal == '1':
-                self.arduino.write(b'1') # Enviar byte '1'
-                # print("Señal '1' enviada a Arduino.")
-            elif senal == '0':
-                self.arduino.write(b'0') # Enviar byte '0'
-                # print("Señal '0' enviada a Arduino.")
-            else:
-                print(f"Advertencia: Señal desconocida '{senal}'. No se envió nada.")
+            self.arduino.write(datos)
+            LATENCIA_ENVIO.observar(time.perf_counter() - inicio)
+            return True
         except serial.SerialException as e:
+            ERRORES_SERIAL.incrementar()
             print(f"Error al escribir en Arduino: {e}")
-            # Podríamos intentar reconectar o marcar como desconectado aquí
-            self.conectado = False
-            self.arduino.close()
-            self.arduino = None
         except Exception as e:
+            ERRORES_SERIAL.incrementar()
             print(f"Error inesperado al enviar señal a Arduino: {e}")
-            self.conectado = False
+        self.cerrar()
+        return False
+
+    def cerrar(self):
+        """
+        Cierra el puerto sin enviar nada y marca la conexión como perdida.
+        """
+        self.conectado = False
+        try:
             if self.arduino and self.arduino.is_open:
                 self.arduino.close()
-            self.arduino = None
-
+        except Exception:
+            pass
+        self.arduino = None
 
     def desconectar(self):
         """
@@ -108,6 +303,148 @@ class ArduinoComunicador:
         #      print("No había conexión activa con Arduino para cerrar.")
 
 
+class DespachadorAlertas:
+    """
+    Envía las señales a Arduino desde un hilo propio para que el bucle de video nunca
+    espere al puerto serial.
+
+    enviar_senal() solo guarda el estado deseado ('0' o '1') y la captura del frame que lo
+    pidió; si llegan varias señales antes
+    de que el hilo escriba, se envía únicamente la última y no se repite la que ya está en el
+    Arduino. Si la conexión se cae, el hilo reconecta con espera exponencial y vuelve a
+    enviar el estado vigente.
+
+    Con el protocolo de tramas el hilo además reenvía la alerta que no fue confirmada, manda
+    un latido cuando no hay nada que enviar y da el enlace por perdido (y reconecta) si pasan
+    `latidos_perdidos` periodos de latido sin ningún ACK.
+    """
+    def __init__(self, puerto='COM7', baud_rate=9600, tiempo_espera=2, espera_inicial=0.5, espera_maxima=30.0,
+                 protocolo="ascii", intervalo_latido=1.0, timeout_ack=0.25, latidos_perdidos=3):
+        """
+        Args:
+            puerto, baud_rate, tiempo_espera, protocolo: Ver ArduinoComunicador.
+            espera_inicial (float): Segundos antes del primer reintento de conexión.
+            espera_maxima (float): Tope de la espera entre reintentos.
+            intervalo_latido (float): Segundos sin envíos tras los que se manda un latido.
+            timeout_ack (float): Segundos de espera del ACK de una alerta antes de reenviarla.
+            latidos_perdidos (int): Periodos de latido sin ACK para dar el enlace por perdido.
+        """
+        self.comunicador = ArduinoComunicador(puerto=puerto, baud_rate=baud_rate, tiempo_espera=tiempo_espera,
+                                              protocolo=protocolo)
+        self.espera_inicial = espera_inicial
+        self.espera_maxima = espera_maxima
+        self.intervalo_latido = intervalo_latido
+        self.timeout_ack = timeout_ack
+        self.latidos_perdidos = latidos_perdidos
+        self._condicion = threading.Condition()
+        self._deseado = NIVEL_NORMAL
+        self._tiempo_captura = None # Captura del frame que pidió el nivel deseado, hasta enviarlo
+        self._enviado = None # Nivel enviado al Arduino (None tras conectar o fallar)
+        self._ultimo_envio = 0.0
+        self._activo = False
+        self._hilo = None
+
+    @property
+    def conectado(self):
+        return self.comunicador.conectado
+
+    def conectar(self):
+        """
+        Arranca el hilo de envío, que se conecta en segundo plano. No bloquea.
+        """
+        if self._hilo is None:
+            self._activo = True
+            self._hilo = threading.Thread(target=self._bucle, name="DespachadorAlertas", daemon=True)
+            self._hilo.start()
+        return True
 
+    def enviar_senal(self, senal, tiempo_captura=None):
+        """
+        Registra el estado que debe tener la alerta. Vuelve de inmediato.
+        """
+        if senal not in NIVEL_POR_SENAL:
+            print(f"Advertencia: Señal desconocida '{senal}'. No se envió nada.")
+            return
+        self.enviar_nivel(NIVEL_POR_SENAL[senal], tiempo_captura)
 
+    def enviar_nivel(self, nivel, tiempo_captura=None):
+        """
+        Registra el nivel de alerta (NIVEL_*) que debe tener el Arduino. Vuelve de inmediato.
 
+        Args:
+            nivel (int): Nivel de alerta.
+            tiempo_captura (float, opcional): Marca de captura del frame que pidió el nivel,
+                                              para trazar la alerta hasta el Arduino.
+        """
+        with self._condicion:
+            if nivel != self._deseado:
+                self._tiempo_captura = tiempo_captura
+            self._deseado = nivel
+            self._condicion.notify()
+
+    def _bucle(self):
+        espera = self.espera_inicial
+        primera_conexion = True
+        tramas = self.comunicador.protocolo == "tramas"
+        # Con tramas hay que revisar los ACK y los latidos aunque no cambie el estado
+        sondeo = 0.01 if tramas else None
+        while self._activo:
+            if not self.comunicador.conectado:
+                if self.comunicador.conectar():
+                    if not primera_conexion:
+                        RECONEXIONES_SERIAL.incrementar()
+                    primera_conexion = False
+                    espera = self.espera_inicial
+                    with self._condicion:
+                        self._enviado = None # Reenviar el estado vigente
+                else:
+                    with self._condicion:
+                        self._condicion.wait_for(lambda: not self._activo, timeout=espera)
+                    espera = min(espera * 2, self.espera_maxima)
+                    continue
+
+            with self._condicion:
+                self._condicion.wait_for(lambda: self._deseado != self._enviado or not self._activo,
+                                         timeout=sondeo)
+                nivel, tiempo_captura = self._deseado, self._tiempo_captura
+
+            if tramas:
+                self.comunicador.procesar_entrada()
+            ahora = time.perf_counter()
+            if nivel != self._enviado:
+                self.comunicador.enviar_nivel(nivel, tiempo_captura)
+                self._ultimo_envio = ahora
+            elif tramas:
+                if self.comunicador.alerta_sin_confirmar(self.timeout_ack) is not None:
+                    RETRANSMISIONES_SERIAL.incrementar()
+                    self.comunicador.reenviar_alerta()
+                    self._ultimo_envio = ahora
+                elif ahora - self._ultimo_envio >= self.intervalo_latido:
+                    self.comunicador.enviar_latido()
+                    self._ultimo_envio = ahora
+                if ahora - self.comunicador.ultimo_ack > self.latidos_perdidos * self.intervalo_latido:
+                    ERRORES_SERIAL.incrementar()
+                    print(f"Sin respuesta de Arduino en {self.latidos_perdidos * self.intervalo_latido:.1f} s. Reconectando...")
+                    self.comunicador.cerrar()
+
+            with self._condicion:
+                if nivel != self._enviado:
+                    self._enviado = nivel if self.comunicador.conectado else None
+                    if self._enviado is not None and self._deseado == nivel:
+                        self._tiempo_captura = None # Ya se trazó; un reenvío tras reconectar no cuenta
+                    self._condicion.notify_all()
+
+    def desconectar(self, timeout=1.0):
+        """
+        Envía '0' (si hay conexión), detiene el hilo y cierra el puerto.
+        """
+        self.enviar_nivel(NIVEL_NORMAL)
+        with self._condicion:
+            if self.comunicador.conectado:
+                self._condicion.wait_for(lambda: self._enviado == NIVEL_NORMAL, timeout=timeout)
+            self._activo = False
+            self._condicion.notify_all()
+        if self._hilo is not None:
+            self._hilo.join(timeout=timeout + self.comunicador.tiempo_espera)
+            self._hilo = None
+        self.comunicador.desconectar()
@@ -0,0 +1,136 @@
+import os
+
+import cv2 # Opencv
+import numpy as np
+
+from backends_landmarks import BackendLandmarks, puntosDesdeOjos
+
+# Zonas de cada ojo dentro del recuadro del rostro, como fracción (x0, y0, x1, y1).
+# Ojo izquierdo y derecho de la imagen, igual que PUNTOS_EAR_IZQUIERDO / PUNTOS_EAR_DERECHO.
+ZONAS_OJOS = ((0.10, 0.20, 0.50, 0.55), (0.50, 0.20, 0.90, 0.55))
+
+
+def _cargarCascada(archivo):
+    ruta = os.path.join(cv2.data.haarcascades, archivo)
+    cascada = cv2.CascadeClassifier(ruta)
+    if cascada.empty():
+        raise RuntimeError(f"No se encontró la cascada {ruta}. Instalar opencv-python, que las incluye.")
+    return cascada
+
+
+def medirApertura(ojo_gris):
+    """
+    Estima la apertura de un ojo a partir de su recorte en grises: alto de la franja de
+    píxeles oscuros (iris, pupila y pestañas) dividido por el ancho del recorte.
+
+    Returns:
+        float: Relación alto / ancho, comparable al EAR.
+    """
+    alto, ancho = ojo_gris.shape
+    # Se descarta el cuarto superior, donde puede aparecer la ceja
+    ojo_gris = cv2.GaussianBlur(ojo_gris[alto // 4:], (3, 3), 0)
+    minimo, maximo = int(ojo_gris.min()), int(ojo_gris.max())
+    if maximo - minimo < 20:
+        return 0.0 # Sin contraste no hay iris visible
+    oscuros = (ojo_gris < minimo + 0.35 * (maximo - minimo)).mean(axis=1)
+    filas = np.flatnonzero(oscuros >= 0.15)
+    if len(filas) == 0:
+        return 0.0
+    # Franja continua alrededor de la fila más oscura
+    centro = int(np.argmax(oscuros))
+    cortes = np.flatnonzero(np.diff(filas) > 1)
+    tramos = np.split(filas, cortes + 1)
+    tramo = next((t for t in tramos if t[0] <= centro <= t[-1]), tramos[0])
+    return (tramo[-1] - tramo[0] + 1) / ancho
+
+
+class DetectorOjosOpenCV(BackendLandmarks):
+    """
+    Backend liviano para equipos con poca CPU: cascadas Haar de OpenCV en lugar de FaceMesh.
+
+    Busca el rostro (alrededor del recuadro anterior mientras lo siga encontrando) y, en cada
+    zona de ojo del rostro, el ojo con su propia cascada. Un ojo encontrado se mide con
+    medirApertura(); la cascada casi nunca encuentra ojos cerrados, así que un ojo no
+    encontrado se toma como cerrado. Con esos datos arma los puntos de los ojos y del ancho del
+    rostro con puntosDesdeOjos(); el resto de la malla no se calcula.
+
+    La confianza es 1/3 con el rostro solo, 2/3 con un ojo y 1.0 con ambos.
+    La apertura medida está en otra escala que el EAR de FaceMesh: conviene calibrar al
+    conductor con este backend (main.py guarda su calibración aparte). medirApertura() llega
+    hasta 0.75 (el recorte del ojo es casi cuadrado y se descarta su cuarto superior) y un ojo
+    abierto suele dar bastante más que el EAR de FaceMesh, así que la calibración acepta otro
+    rango de base.
+    """
+    nombre = "ojos_opencv"
+    rango_ear_abierto = (0.1, 0.75)
+
+    def __init__(self, escala=0.5, ear_cerrado=0.05, vecinos_rostro=5, vecinos_ojo=4, margen_seguimiento=0.5):
+        """
+        Args:
+            escala (float): Reducción de la imagen para buscar el rostro.
+            ear_cerrado (float): Apertura asignada a un ojo que no se encontró.
+            vecinos_rostro (int): minNeighbors de la cascada de rostros (más alto, menos falsos positivos).
+            vecinos_ojo (int): minNeighbors de la cascada de ojos.
+            margen_seguimiento (float): Margen alrededor del rostro anterior donde se lo busca primero.
+        """
+        self.escala = escala
+        self.ear_cerrado = ear_cerrado
+        self.vecinos_rostro = vecinos_rostro
+        self.vecinos_ojo = vecinos_ojo
+        self.margen_seguimiento = margen_seguimiento
+        self.cascada_rostro = _cargarCascada("haarcascade_frontalface_default.xml")
+        self.cascada_ojo = _cargarCascada("haarcascade_eye_tree_eyeglasses.xml")
+        self.rostro = None # Último recuadro (x, y, ancho, alto) en píxeles del frame
+
+    def _buscarRostro(self, gris):
+        alto, ancho = gris.shape
+        zonas = [(0, 0, ancho, alto)]
+        if self.rostro is not None:
+            # Primero alrededor del rostro anterior, que es mucho más barato que el frame completo
+            x, y, w, h = self.rostro
+            mx, my = w * self.margen_seguimiento, h * self.margen_seguimiento
+            zonas.insert(0, (int(max(0, x - mx)), int(max(0, y - my)), int(min(ancho, x + w + mx)), int(min(alto, y + h + my))))
+        for x0, y0, x1, y1 in zonas:
+            recorte = gris[y0:y1, x0:x1]
+            if self.escala != 1.0:
+                recorte = cv2.resize(recorte, None, fx=self.escala, fy=self.escala, interpolation=cv2.INTER_AREA)
+            lado_minimo = max(20, int(min(recorte.shape) * 0.15))
+            rostros = self.cascada_rostro.detectMultiScale(recorte, scaleFactor=1.1, minNeighbors=self.vecinos_rostro,
+                                                           minSize=(lado_minimo, lado_minimo))
+            if len(rostros):
+                x, y, w, h = max(rostros, key=lambda r: r[2] * r[3]) / self.escala
+                return (x0 + x, y0 + y, w, h)
+        return None
+
+    def reiniciar(self):
+        """
+        Olvida el recuadro del rostro anterior: el próximo frame lo busca en toda la imagen.
+        """
+        self.rostro = None
+
+    def detectar(self, frame_rgb, destino=None):
+        gris = cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2GRAY)
+        self.rostro = self._buscarRostro(gris)
+        if self.rostro is None:
+            return None, 0.0
+
+        x, y, w, h = self.rostro
+        ojos = []
+        encontrados = 0
+        for zx0, zy0, zx1, zy1 in ZONAS_OJOS:
+            x0, y0 = int(x + w * zx0), int(y + h * zy0)
+            x1, y1 = int(x + w * zx1), int(y + h * zy1)
+            zona = gris[max(0, y0):y1, max(0, x0):x1]
+            candidatos = ()
+            if zona.size:
+                lado_minimo = max(8, int(zona.shape[1] * 0.3))
+                candidatos = self.cascada_ojo.detectMultiScale(zona, scaleFactor=1.1, minNeighbors=self.vecinos_ojo,
+                                                               minSize=(lado_minimo, lado_minimo))
+            if len(candidatos):
+                ox, oy, ow, oh = max(candidatos, key=lambda r: r[2] * r[3])
+                ear = max(self.ear_cerrado, medirApertura(zona[oy:oy + oh, ox:ox + ow]))
+                ojos.append((max(0, x0) + ox + ow / 2, max(0, y0) + oy + oh / 2, ow * 0.8, ear))
+                encontrados += 1
+            else:
+                ojos.append(((x0 + x1) / 2, (y0 + y1) / 2, w * 0.25, self.ear_cerrado))
+        return puntosDesdeOjos(self.rostro, ojos, destino), (1 + encontrados) / 3
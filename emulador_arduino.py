@@ -0,0 +1,188 @@
+import argparse
+import os
+import random
+import select
+import threading
+import time
+import tty
+
+from protocolo_serial import (DecodificadorTramas, codificarTrama, INICIO, LARGO_TRAMA, NIVEL_SOMNOLENCIA,
+                              TIPO_ACK, TIPO_ALERTA)
+
+MENSAJE_INICIO = b"Arduino listo. Esperando datos...\r\n"
+
+
+class EmuladorArduino:
+    """
+    Arduino falso sobre una pseudo-terminal (solo Linux/macOS) que responde como el sketch
+    pruebasomnolencia_arduino.ino, para probar la conexión sin hardware.
+
+    Python se conecta a `emulador.puerto` como a cualquier puerto serial. Se pueden simular
+    demoras en el ACK, tramas perdidas o corruptas y cortes del enlace con pausar().
+    """
+    def __init__(self, retardo_ack=0.0, prob_perdida=0.0, prob_corrupcion=0.0, semilla=None):
+        """
+        Args:
+            retardo_ack (float): Segundos que espera antes de responder cada trama.
+            prob_perdida (float): Probabilidad de ignorar una trama recibida (sin ACK).
+            prob_corrupcion (float): Probabilidad de enviar el ACK con el checksum alterado.
+            semilla (int, opcional): Semilla para que las fallas simuladas sean reproducibles.
+        """
+        self.retardo_ack = retardo_ack
+        self.prob_perdida = prob_perdida
+        self.prob_corrupcion = prob_corrupcion
+        self._azar = random.Random(semilla)
+        self._maestro, self._esclavo = os.openpty()
+        tty.setraw(self._esclavo) # Sin eco ni traducción de saltos de línea, como un puerto real
+        self.puerto = os.ttyname(self._esclavo)
+        self.nivel = 0
+        self.alerta_encendida = False
+        self.senales_ascii = 0
+        self.tramas_recibidas = 0
+        self.tramas_perdidas = 0
+        self.acks_enviados = 0
+        self._decodificador = DecodificadorTramas()
+        self._restantes = 0 # Bytes que faltan de la trama en curso
+        self._pausado_hasta = 0.0
+        self._activo = threading.Event()
+        self._hilo = None
+
+    def iniciar(self):
+        """
+        Arranca el hilo que atiende el puerto.
+        """
+        self._activo.set()
+        self._hilo = threading.Thread(target=self._bucle, name="EmuladorArduino", daemon=True)
+        self._hilo.start()
+        return self
+
+    def pausar(self, segundos):
+        """
+        Deja de responder (y descarta lo recibido) durante `segundos`, como un cable desconectado.
+        """
+        self._pausado_hasta = time.monotonic() + segundos
+
+    def _bucle(self):
+        # Un Arduino real se reinicia al abrir el puerto y recién entonces manda su mensaje de
+        # inicio. Como pyserial vacía la entrada al abrir, se repite hasta recibir el primer byte.
+        proximo_inicio = 0.0
+        recibio_datos = False
+        while self._activo.is_set():
+            if not recibio_datos and time.monotonic() >= proximo_inicio:
+                os.write(self._maestro, MENSAJE_INICIO)
+                proximo_inicio = time.monotonic() + 0.2
+            listos, _, _ = select.select([self._maestro], [], [], 0.05)
+            if not listos:
+                continue
+            recibio_datos = True
+            try:
+                datos = os.read(self._maestro, 4096)
+            except OSError:
+                break
+            if time.monotonic() < self._pausado_hasta:
+                continue
+            self._procesar(datos)
+
+    def _procesar(self, datos):
+        # Los bytes sueltos '0'/'1' son el protocolo anterior; el resto va al decodificador de tramas
+        for byte in datos:
+            if self._restantes == 0 and byte in b"01":
+                self.senales_ascii += 1
+                self._aplicarNivel(NIVEL_SOMNOLENCIA if byte == ord("1") else 0)
+                continue
+            if self._restantes == 0 and byte == INICIO:
+                self._restantes = LARGO_TRAMA
+            if self._restantes > 0:
+                self._restantes -= 1
+            for tipo, secuencia, dato in self._decodificador.agregar(bytes((byte,))):
+                self._atenderTrama(tipo, secuencia, dato)
+
+    def _atenderTrama(self, tipo, secuencia, dato):
+        self.tramas_recibidas += 1
+        if self._azar.random() < self.prob_perdida:
+            self.tramas_perdidas += 1
+            return
+        if tipo == TIPO_ALERTA:
+            self._aplicarNivel(dato)
+        if self.retardo_ack > 0:
+            time.sleep(self.retardo_ack)
+        ack = bytearray(codificarTrama(TIPO_ACK, secuencia, self.nivel))
+        if self._azar.random() < self.prob_corrupcion:
+            ack[-1] ^= 0xFF
+        os.write(self._maestro, bytes(ack))
+        self.acks_enviados += 1
+
+    def _aplicarNivel(self, nivel):
+        self.nivel = nivel
+        self.alerta_encendida = nivel >= NIVEL_SOMNOLENCIA
+
+    def detener(self):
+        """
+        Detiene el hilo y cierra la pseudo-terminal.
+        """
+        self._activo.clear()
+        if self._hilo is not None:
+            self._hilo.join(timeout=1)
+            self._hilo = None
+        for descriptor in (self._maestro, self._esclavo):
+            try:
+                os.close(descriptor)
+            except OSError:
+                pass
+
+
+def pruebaEnlace(emulador, alertas=200, baud_rate=115200):
+    """
+    Envía `alertas` tramas alternando el nivel y mide el tiempo de ida y vuelta de cada una.
+
+    Returns:
+        dict: Tramas por segundo y percentiles del RTT en milisegundos.
+    """
+    from conexion_arduino import ArduinoComunicador
+
+    comunicador = ArduinoComunicador(puerto=emulador.puerto, baud_rate=baud_rate, tiempo_espera=1, protocolo="tramas")
+    if not comunicador.conectar():
+        raise RuntimeError(f"No se pudo abrir {emulador.puerto}")
+    rtts = []
+    inicio = time.perf_counter()
+    for i in range(alertas):
+        comunicador.enviar_nivel(NIVEL_SOMNOLENCIA if i % 2 else 0)
+        limite = time.monotonic() + 0.5
+        previo = comunicador.rtt_ultimo
+        while comunicador.rtt_ultimo is previo and time.monotonic() < limite:
+            comunicador.procesar_entrada()
+            time.sleep(0.0002)
+        if comunicador.rtt_ultimo is not previo:
+            rtts.append(comunicador.rtt_ultimo * 1000)
+    transcurrido = time.perf_counter() - inicio
+    comunicador.desconectar()
+
+    rtts.sort()
+    percentil = lambda p: rtts[min(len(rtts) - 1, int(p / 100 * len(rtts)))] if rtts else float("nan")
+    return {"tramas_por_segundo": alertas / transcurrido, "confirmadas": len(rtts),
+            "rtt_p50_ms": percentil(50), "rtt_p95_ms": percentil(95), "rtt_p99_ms": percentil(99)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Arduino falso sobre una pseudo-terminal.")
+    parser.add_argument("--retardo-ack", type=float, default=0.0, help="Segundos antes de responder cada trama")
+    parser.add_argument("--perdida", type=float, default=0.0, help="Probabilidad de ignorar una trama")
+    parser.add_argument("--corrupcion", type=float, default=0.0, help="Probabilidad de corromper un ACK")
+    parser.add_argument("--prueba", action="store_true", help="Medir tramas por segundo y RTT y salir")
+    argumentos = parser.parse_args()
+
+    emulador = EmuladorArduino(retardo_ack=argumentos.retardo_ack, prob_perdida=argumentos.perdida,
+                               prob_corrupcion=argumentos.corrupcion).iniciar()
+    try:
+        if argumentos.prueba:
+            for clave, valor in pruebaEnlace(emulador).items():
+                print(f"{clave}: {valor:.2f}")
+        else:
+            print(f"Emulador escuchando en {emulador.puerto} (Ctrl+C para salir)")
+            print(f"Usar puerto_arduino = \"{emulador.puerto}\" en main.py")
+            while True:
+                time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        emulador.detener()
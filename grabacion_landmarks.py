@@ -0,0 +1,263 @@
+import argparse
+import os
+
+import numpy as np
+
+from analisis_facial import (AnalisisFacial, IndicadoresOjos, TemporizadorSomnolencia, NUM_PUNTOS_MALLA,
+                             UMBRAL_EAR)
+from registro_sesion import ArchivoMapeado, leerArchivo
+
+# Qué pasó con cada frame analizado
+FRAME_INFERIDO = 0
+FRAME_REPETIDO = 1 # El planificador lo omitió y se reutilizó el último resultado
+FRAME_DESCARTADO = 2 # El filtro de calidad lo descartó (no cuenta para el PERCLOS)
+FRAME_CORTE = 3 # No llegó frame (corte del stream); la marca es la de la lectura fallida
+
+# Un registro por frame analizado: marca de tiempo, tipo, si hubo rostro y los puntos en
+# píxeles (solo en los inferidos). 3754 bytes por frame; una hora a 30 FPS ocupa unos 400 MB.
+TIPO_FRAME_LANDMARKS = np.dtype([
+    ("tiempo", "<f8"),
+    ("tipo", "u1"),
+    ("rostro", "u1"),
+    ("puntos", "<f4", (NUM_PUNTOS_MALLA, 2)),
+])
+
+# Cabecera al comienzo del archivo con la configuración del análisis en vivo. Si la
+# calibración cambió el umbral durante la sesión, `umbral_calibrado` rige desde el frame con
+# marca `tiempo_calibracion` (NaN si no cambió).
+MAGIA_LANDMARKS = b"LMK2"
+TIPO_CABECERA_LANDMARKS = np.dtype([
+    ("magia", "S4"),
+    ("umbral_ear", "<f8"),
+    ("umbral_calibrado", "<f8"),
+    ("tiempo_calibracion", "<f8"),
+    ("umbral_tiempo", "<f8"),
+    ("ventana_perclos", "<f8"),
+    ("frames_suavizado", "<u4"),
+])
+
+# Resultado por frame de una reproducción
+TIPO_RESULTADO = np.dtype([
+    ("tiempo", "<f8"),
+    ("ear", "<f4"),
+    ("perclos", "<f4"),
+    ("ojos_cerrados", "u1"),
+    ("alerta", "u1"),
+])
+
+
+class GrabadorLandmarks:
+    """
+    Guarda los puntos de la malla facial de cada frame analizado en un archivo binario
+    mapeable en memoria, para volver a analizar la sesión sin cámara ni MediaPipe.
+
+    Se registran también los frames sin inferir (con su tipo) y, en la cabecera, los umbrales
+    y la ventana del PERCLOS, así reproducir() repite el análisis en vivo frame a frame.
+    """
+    def __init__(self, ruta, umbral_ear=UMBRAL_EAR, umbral_tiempo=1.0, ventana_perclos=60.0, frames_suavizado=3,
+                 registros_por_bloque=4096):
+        """
+        Args:
+            ruta (str): Archivo de la grabación (por convención con extensión .lmk).
+            umbral_ear (float): Umbral de EAR al empezar la sesión.
+            umbral_tiempo (float): Segundos con los ojos cerrados para activar la alerta.
+            ventana_perclos (float): Ventana del PERCLOS en segundos.
+            frames_suavizado (int): Frames promediados para el EAR.
+            registros_por_bloque (int): Frames que se reservan en el archivo cada vez que se llena.
+        """
+        self.ruta = ruta
+        self.cabecera = np.zeros((), dtype=TIPO_CABECERA_LANDMARKS)
+        self.cabecera["magia"] = MAGIA_LANDMARKS
+        self.cabecera["umbral_ear"] = umbral_ear
+        self.cabecera["umbral_calibrado"] = np.nan
+        self.cabecera["tiempo_calibracion"] = np.nan
+        self.cabecera["umbral_tiempo"] = umbral_tiempo
+        self.cabecera["ventana_perclos"] = ventana_perclos
+        self.cabecera["frames_suavizado"] = frames_suavizado
+        self._archivo = ArchivoMapeado(ruta, TIPO_FRAME_LANDMARKS, registros_por_bloque,
+                                       cabecera=self.cabecera.tobytes())
+
+    def agregar(self, tiempo, puntos, tipo=FRAME_INFERIDO):
+        """
+        Registra un frame. Los puntos de un frame inferido se copian directo al mapa del archivo.
+
+        Args:
+            tiempo (float): Marca de tiempo de captura del frame.
+            puntos (np.ndarray or None): Arreglo (468, 2) o None si no hubo rostro. En los frames
+                                         sin inferir, el resultado reutilizado (solo se guarda
+                                         si tenía rostro).
+            tipo (int): FRAME_INFERIDO, FRAME_REPETIDO, FRAME_DESCARTADO o FRAME_CORTE.
+        """
+        registro = self._archivo.siguiente()
+        registro["tiempo"] = tiempo
+        registro["tipo"] = tipo
+        registro["rostro"] = puntos is not None
+        if puntos is not None and tipo == FRAME_INFERIDO:
+            registro["puntos"] = puntos
+
+    def fijarUmbral(self, umbral_ear, tiempo):
+        """
+        Registra que la calibración cambió el umbral de EAR a partir del frame con marca `tiempo`.
+        """
+        self.cabecera["umbral_calibrado"] = umbral_ear
+        self.cabecera["tiempo_calibracion"] = tiempo
+        with open(self.ruta, "r+b") as archivo:
+            archivo.write(self.cabecera.tobytes())
+
+    def cerrar(self):
+        self._archivo.cerrar()
+
+
+def leerGrabacion(ruta):
+    """
+    Abre una grabación sin cargarla en memoria.
+
+    Returns:
+        np.ndarray: Arreglo de solo lectura con TIPO_FRAME_LANDMARKS.
+    """
+    return leerArchivo(ruta, TIPO_FRAME_LANDMARKS, inicio=TIPO_CABECERA_LANDMARKS.itemsize)
+
+
+def leerCabecera(ruta):
+    """
+    Lee la configuración del análisis en vivo guardada al comienzo de una grabación.
+
+    Returns:
+        np.void: Registro TIPO_CABECERA_LANDMARKS.
+    """
+    cabecera = np.fromfile(ruta, dtype=TIPO_CABECERA_LANDMARKS, count=1)
+    if len(cabecera) == 0 or cabecera[0]["magia"] != MAGIA_LANDMARKS:
+        raise ValueError(f"{ruta} no es una grabación de puntos faciales de esta versión")
+    return cabecera[0]
+
+
+def reproducir(grabacion, umbral_ear=None, umbral_tiempo=None, ventana_perclos=None, cabecera=None,
+               tamano_lote=8192):
+    """
+    Vuelve a correr el análisis de somnolencia de analisisVideo sobre una grabación: EAR
+    promedio de ambos ojos, suavizado y PERCLOS con IndicadoresOjos y alerta con
+    TemporizadorSomnolencia. El EAR se calcula por lotes sobre el archivo mapeado; solo la
+    lógica con estado recorre los frames uno a uno. El resultado es determinista.
+
+    Los frames sin inferir se tratan como en vivo: el repetido cuenta para el PERCLOS con el
+    último estado de los ojos, el descartado por calidad no cuenta y un corte del stream
+    descarta la cuenta de ojos cerrados si la alerta no estaba activa. Sin umbrales explícitos
+    se usan los de la cabecera, incluido el cambio de umbral de la calibración, así que el
+    resultado coincide con el de la sesión en vivo.
+
+    Args:
+        grabacion (np.ndarray or str): Grabación (TIPO_FRAME_LANDMARKS) o ruta al archivo.
+        umbral_ear (float): EAR por debajo del cual los ojos se consideran cerrados (None para
+                            el de la cabecera).
+        umbral_tiempo (float): Segundos con los ojos cerrados para activar la alerta (None para
+                               el de la cabecera).
+        ventana_perclos (float): Ventana del PERCLOS en segundos (None para la de la cabecera).
+        cabecera (np.void, opcional): Cabecera de la grabación si se pasa un arreglo; con una
+                                      ruta se lee del archivo.
+        tamano_lote (int): Frames por lote al calcular el EAR.
+
+    Returns:
+        np.ndarray: Un registro TIPO_RESULTADO por frame.
+    """
+    if isinstance(grabacion, (str, os.PathLike)):
+        cabecera = leerCabecera(grabacion)
+        grabacion = leerGrabacion(grabacion)
+    frames_suavizado = 3
+    umbral_calibrado, tiempo_calibracion = None, None
+    if cabecera is not None:
+        frames_suavizado = int(cabecera["frames_suavizado"])
+        if umbral_ear is None:
+            umbral_ear = float(cabecera["umbral_ear"])
+            if not np.isnan(cabecera["tiempo_calibracion"]):
+                umbral_calibrado = float(cabecera["umbral_calibrado"])
+                tiempo_calibracion = float(cabecera["tiempo_calibracion"])
+        if umbral_tiempo is None:
+            umbral_tiempo = float(cabecera["umbral_tiempo"])
+        if ventana_perclos is None:
+            ventana_perclos = float(cabecera["ventana_perclos"])
+    analizador = AnalisisFacial()
+    indicadores = IndicadoresOjos(umbral_ear=UMBRAL_EAR if umbral_ear is None else umbral_ear,
+                                  frames_suavizado=frames_suavizado,
+                                  ventana_perclos=60.0 if ventana_perclos is None else ventana_perclos)
+    temporizador = TemporizadorSomnolencia(umbral_tiempo=1.0 if umbral_tiempo is None else umbral_tiempo)
+    resultado = np.zeros(len(grabacion), dtype=TIPO_RESULTADO)
+    resultado["tiempo"] = grabacion["tiempo"]
+    ear, cerrados = np.nan, False # Último resultado, que repiten los frames sin inferir
+
+    for inicio in range(0, len(grabacion), tamano_lote):
+        lote = grabacion[inicio:inicio + tamano_lote]
+        ear_izquierdo, ear_derecho = analizador.calcularEAR(lote["puntos"])
+        ears = ((ear_izquierdo + ear_derecho) / 2).tolist()
+        for desplazamiento, (tiempo, tipo, rostro) in enumerate(zip(
+                lote["tiempo"].tolist(), lote["tipo"].tolist(), lote["rostro"].tolist())):
+            if tipo == FRAME_INFERIDO:
+                if tiempo_calibracion is not None and tiempo >= tiempo_calibracion:
+                    indicadores.umbral_ear = umbral_calibrado
+                    tiempo_calibracion = None
+                if rostro:
+                    ear, cerrados, _ = indicadores.actualizar(ears[desplazamiento], tiempo)
+                    temporizador.actualizar(cerrados, tiempo)
+                else:
+                    ear, cerrados = np.nan, False
+                    indicadores.actualizar(None, tiempo)
+                    temporizador.reiniciar()
+            elif tipo == FRAME_REPETIDO:
+                indicadores.repetir(tiempo)
+            elif tipo == FRAME_CORTE and not temporizador.alerta_activa:
+                temporizador.inicio_cerrado = None
+            resultado[inicio + desplazamiento] = (tiempo, ear, indicadores.perclos, cerrados,
+                                                  temporizador.alerta_activa)
+    return resultado
+
+
+def resumirReproduccion(resultado):
+    """
+    Cuenta las alertas de una reproducción y devuelve sus intervalos (inicio, fin) en segundos
+    desde el comienzo de la grabación.
+    """
+    if len(resultado) == 0:
+        return []
+    alerta = np.concatenate(([0], resultado["alerta"].astype(np.int8), [0]))
+    cambios = np.diff(alerta)
+    inicios = np.flatnonzero(cambios == 1)
+    fines = np.flatnonzero(cambios == -1) - 1
+    origen = resultado["tiempo"][0]
+    return [(float(resultado["tiempo"][i] - origen), float(resultado["tiempo"][f] - origen))
+            for i, f in zip(inicios, fines)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vuelve a analizar una grabación de puntos faciales sin cámara ni MediaPipe.")
+    parser.add_argument("grabacion", help="Archivo .lmk grabado con GRABAR_LANDMARKS en main.py")
+    parser.add_argument("--umbral-ear", type=float, default=None, help="EAR de ojo cerrado (por defecto el grabado)")
+    parser.add_argument("--umbral-tiempo", type=float, default=None,
+                        help="Segundos con ojos cerrados para alertar (por defecto el grabado)")
+    parser.add_argument("--ventana-perclos", type=float, default=None,
+                        help="Ventana del PERCLOS en segundos (por defecto la grabada)")
+    parser.add_argument("--grafico", default=None, help="Guardar un gráfico de la reproducción en esta imagen")
+    argumentos = parser.parse_args()
+
+    cabecera = leerCabecera(argumentos.grabacion)
+    grabacion = leerGrabacion(argumentos.grabacion)
+    resultado = reproducir(grabacion, umbral_ear=argumentos.umbral_ear, umbral_tiempo=argumentos.umbral_tiempo,
+                           ventana_perclos=argumentos.ventana_perclos, cabecera=cabecera)
+    intervalos = resumirReproduccion(resultado)
+    duracion = float(grabacion["tiempo"][-1] - grabacion["tiempo"][0]) if len(grabacion) else 0.0
+    inferidos = grabacion["tipo"] == FRAME_INFERIDO
+    print(f"Frames: {len(grabacion)} ({duracion / 60:.1f} min), inferidos: {int(inferidos.sum())}, "
+          f"con rostro: {int(grabacion['rostro'][inferidos].sum())}")
+    print(f"Alertas: {len(intervalos)}")
+    for inicio, fin in intervalos:
+        print(f"  {inicio:9.1f} s - {fin:9.1f} s")
+
+    if argumentos.grafico:
+        from registro_sesion import TIPO_REGISTRO, graficarSesion
+        datos = np.zeros(len(resultado), dtype=TIPO_REGISTRO)
+        for campo in TIPO_RESULTADO.names:
+            datos[campo] = resultado[campo]
+        datos["rostro"] = grabacion["rostro"]
+        umbral_ear = argumentos.umbral_ear
+        if umbral_ear is None:
+            umbral_ear = float(cabecera["umbral_ear" if np.isnan(cabecera["umbral_calibrado"]) else "umbral_calibrado"])
+        if graficarSesion(datos, argumentos.grafico, umbral_ear=umbral_ear):
+            print(f"Gráfico guardado en {argumentos.grafico}")
@@ -1,29 +1,169 @@
-import cv2 # Opencv
-import mediapipe as mp # Google
 import time
-import matplotlib.pyplot as plt # Para graficar (opcional al final)
+INICIO_PROGRAMA = time.perf_counter() # Para medir el tiempo hasta el primer frame procesado
+
+import cv2 # Opencv
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 
 # Importaciones de tus módulos
-from captura import Captura
-from malla_facial import MallaFacial
-from analisis_facial import AnalisisFacial
-from conexion_arduino import ArduinoComunicador # Clase para Arduino
+from captura import Captura, CapturaResiliente
+from backends_landmarks import crearBackend # MediaPipe se importa recién al crear la malla
+from analisis_facial import AnalisisFacial, IndicadoresOjos, TemporizadorSomnolencia, NUM_PUNTOS_MALLA
+from calibracion import CalibracionConductor
+from conexion_arduino import DespachadorAlertas # Envío de señales a Arduino en segundo plano
+from vista_previa import VistaPrevia, dibujarEstado, dibujarMalla
+from metricas import REGISTRO, ServidorMetricas, latenciaAlerta, latenciaEtapa
+from planificador import ControladorEscala, ModoReposo, PlanificadorInferencia
+from registro_sesion import RegistroSesion, graficarSesion, rutaSesion
+from grabacion_landmarks import FRAME_CORTE, FRAME_DESCARTADO, FRAME_INFERIDO, FRAME_REPETIDO, GrabadorLandmarks
+from buffers_frames import asegurarBuffer
+from tuberia import TuberiaEtapas
+from calidad_frame import FiltroCalidad
 
 # --- Configuración ---
 # URL de DroidCam (asegúrate que sea la correcta y accesible desde tu PC)
 droidcam_url = "http://192.168.1.7:4747/video"
 # O usa la webcam integrada si DroidCam no está disponible:
 # droidcam_url = 0
+# O una región de la pantalla donde se muestra un video remoto (izq,arriba,ancho,alto@fps, requiere mss):
+# droidcam_url = "pantalla:100,100,640,480@15"
 
 # Puerto serial de Arduino
 puerto_arduino = "COM7"
-
-# Fuente de texto para OpenCV
-fuente = cv2.FONT_ITALIC
+# "tramas": protocolo con checksum, ACK y latidos (sketch actual, 115200 baudios).
+# "ascii": bytes '0'/'1' para sketches anteriores (9600 baudios).
+PROTOCOLO_ARDUINO = "tramas"
+BAUD_ARDUINO = 115200
+
+# Captura en un hilo aparte: el análisis siempre recibe el frame más reciente
+# y los frames que no alcanzó a procesar se descartan en lugar de acumularse.
+CAPTURA_EN_HILO = True
+TAMANO_BUFFER_CAPTURA = 2
+# Con la captura en hilo, reconectar el stream si se corta (lectura fallida o
+# TIMEOUT_LECTURA_CAMARA segundos sin frames) en lugar de terminar el programa.
+RECONECTAR_CAMARA = True
+TIMEOUT_LECTURA_CAMARA = 2.0
+
+# Ejecución en etapas: captura, preproceso e inferencia corren en hilos propios unidos por colas
+# de TAMANO_COLAS_ETAPAS frames y el análisis queda en el hilo principal, así cada etapa trabaja
+# sobre un frame distinto a la vez. Con HILOS_INFERENCIA > 1 se crea un detector por hilo (para
+# CPUs con varios núcleos libres; con FaceMesh cada instancia sigue el rostro por su cuenta).
+EJECUCION_EN_ETAPAS = True
+HILOS_INFERENCIA = 1
+TAMANO_COLAS_ETAPAS = 2
+
+# Modo sin interfaz para equipos instalados: no dibuja, no abre ventanas ni lee el teclado.
+# Se detiene con Ctrl+C o con SIGTERM.
+MODO_HEADLESS = False
+# En modo sin interfaz, ventana opcional de depuración dibujada en otro hilo a una tasa limitada
+VISTA_PREVIA_HEADLESS = False
+FPS_VISTA_PREVIA = 5
+
+# Puerto local donde se publican las métricas en formato Prometheus (None para desactivarlo)
+PUERTO_METRICAS = 9108
+
+# Opciones de la malla facial de MediaPipe. En equipos lentos conviene bajar las confianzas
+# o activar el seguimiento por recorte, que corre la inferencia solo alrededor del rostro.
+OPCIONES_MALLA = {
+    "max_num_faces": 1,
+    "refine_landmarks": False,
+    "static_image_mode": False,
+    "min_detection_confidence": 0.5,
+    "min_tracking_confidence": 0.5,
+}
+SEGUIMIENTO_ROI = True
+MARGEN_ROI = 0.3
+# Detector de puntos faciales: "facemesh" (MediaPipe), "ojos_opencv" (cascadas Haar de
+# OpenCV, mucho más liviano pero menos preciso; conviene calibrar al conductor con él) o
+# "sintetico" (guion de parpadeos para pruebas sin cámara).
+BACKEND_LANDMARKS = "facemesh"
+# Escala de la imagen que recibe la malla facial (1.0 = resolución de la cámara). Con
+# FPS_OBJETIVO la escala se ajusta sola para sostener esos FPS (None para dejarla fija), sin
+# bajar de ESCALA_MINIMA ni dejar el rostro con menos de ANCHO_ROSTRO_MINIMO píxeles.
+ESCALA_INFERENCIA = 1.0
+FPS_OBJETIVO = 15
+ESCALA_MINIMA = 0.35
+ANCHO_ROSTRO_MINIMO = 100
+
+# Inferencia adaptativa: con los ojos bien abiertos y estables se espacian las inferencias.
+# RETARDO_MAXIMO_INFERENCIA acota el retraso agregado a la detección (segundos).
+INFERENCIA_ADAPTATIVA = True
+RETARDO_MAXIMO_INFERENCIA = 0.25
+
+# Filtro de calidad antes de la inferencia: los frames repetidos (DroidCam y cámaras RTSP que
+# reenvían el mismo frame), muy oscuros o movidos no se infieren y reutilizan el último
+# resultado. No descarta nada con el temporizador de ojos cerrados corriendo ni cuando el
+# planificador pide inferir cada frame, y nunca pasan más de MAXIMO_OMITIDO_CALIDAD segundos
+# (acotado a RETARDO_MAXIMO_INFERENCIA) sin inferir. Los repetidos se buscan en la zona de los
+# ojos; el brillo y la nitidez, en una miniatura en grises. somnolencia_brillo_frame y
+# somnolencia_nitidez_frame muestran los valores de la cámara instalada para ajustarlos
+# (None desactiva cada control).
+FILTRO_CALIDAD = True
+UMBRAL_DUPLICADO = 0.5 # Diferencia media (0-255) en la zona de los ojos con el último frame inferido
+UMBRAL_BRILLO = 35.0 # Brillo medio (0-255)
+UMBRAL_NITIDEZ = 10.0 # Varianza del laplaciano
+MAXIMO_OMITIDO_CALIDAD = 0.25
+
+# Modo reposo sin conductor: tras ESPERA_REPOSO segundos sin rostro se analiza un frame cada
+# PERIODO_REPOSO segundos (la captura ni decodifica los demás) con la malla a ESCALA_REPOSO
+# (None para no cambiarla). Con el primer rostro vuelve al ritmo normal, así que despertar demora
+# como mucho PERIODO_REPOSO más una inferencia. None en ESPERA_REPOSO lo desactiva.
+ESPERA_REPOSO = 30.0
+PERIODO_REPOSO = 1.0
+ESCALA_REPOSO = 0.5
 
 # --- Constantes para la detección de somnolencia ---
 # Tiempo en segundos que los ojos deben estar cerrados para activar la alerta
 UMBRAL_TIEMPO_SOMNOLENCIA = 1.0
+# Conductor actual: su umbral de EAR se calibra la primera vez y queda guardado en ARCHIVO_CALIBRACION
+ID_CONDUCTOR = "predeterminado"
+ARCHIVO_CALIBRACION = "calibracion_conductores.json"
+DURACION_CALIBRACION = 10.0
+# Ventana deslizante del PERCLOS (proporción del tiempo con los ojos cerrados), en segundos
+VENTANA_PERCLOS = 60.0
+
+# Historial de la sesión: los últimos frames en memoria y la sesión completa en un archivo
+# por sesión dentro de DIRECTORIO_SESIONES (None para no guardar). Al terminar se guarda
+# un gráfico junto al archivo.
+DIRECTORIO_SESIONES = "sesiones"
+FRAMES_EN_MEMORIA = 18000 # 10 minutos a 30 FPS
+# Guardar también los puntos de la malla de cada frame inferido (.lmk junto a la sesión) para
+# volver a analizarla sin cámara con: python grabacion_landmarks.py sesiones/sesion_....lmk
+GRABAR_LANDMARKS = False
+
+# --- Métricas del bucle de análisis ---
+LATENCIA_CAPTURA = latenciaEtapa("captura")
+LATENCIA_PREPROCESO = latenciaEtapa("preproceso")
+LATENCIA_INFERENCIA = latenciaEtapa("inferencia")
+LATENCIA_ANALISIS = latenciaEtapa("analisis")
+LATENCIA_DIBUJO = latenciaEtapa("dibujo")
+# Tiempo desde la captura de cada frame inferido hasta el fin de su análisis y, para el frame que
+# activa una alerta, hasta la decisión (el resto del recorrido lo mide conexion_arduino)
+LATENCIA_FRAME = REGISTRO.histograma("somnolencia_captura_a_analisis_segundos",
+                                     "Tiempo desde la captura de cada frame inferido hasta el fin de su análisis")
+LATENCIA_ALERTA_DECISION = latenciaAlerta("decision")
+FRAMES_PROCESADOS = REGISTRO.contador("somnolencia_frames_total", "Frames procesados")
+FRAMES_SIN_ROSTRO = REGISTRO.contador("somnolencia_frames_sin_rostro_total", "Frames en los que no se detectó rostro")
+ALERTAS = REGISTRO.contador("somnolencia_alertas_total", "Alertas de somnolencia activadas")
+INFERENCIAS_OMITIDAS = REGISTRO.contador("somnolencia_inferencias_omitidas_total",
+                                         "Frames en los que el planificador omitió la inferencia")
+ARRANQUE_CAPTURA = REGISTRO.medidor("somnolencia_arranque_segundos", "Segundos desde el inicio del programa",
+                                    {"etapa": "captura"})
+ARRANQUE_MALLA = REGISTRO.medidor("somnolencia_arranque_segundos", "Segundos desde el inicio del programa",
+                                  {"etapa": "malla_facial"})
+ARRANQUE_PRIMER_FRAME = REGISTRO.medidor("somnolencia_arranque_segundos", "Segundos desde el inicio del programa",
+                                         {"etapa": "primer_frame"})
+ESCALA_ACTUAL = REGISTRO.medidor("somnolencia_escala_inferencia",
+                                 "Factor de escala de la imagen que recibe la malla facial")
+EAR_ACTUAL = REGISTRO.medidor("somnolencia_ear", "Relación de aspecto de los ojos suavizada")
+CONFIANZA_LANDMARKS = REGISTRO.medidor("somnolencia_confianza_landmarks",
+                                       "Confianza de la última detección de puntos faciales (0 a 1)")
+MODO_REPOSO = REGISTRO.medidor("somnolencia_modo_reposo", "1 mientras el detector está en reposo por falta de rostro")
+ENTRADAS_REPOSO = REGISTRO.contador("somnolencia_entradas_reposo_total", "Veces que el detector entró en reposo")
+PERCLOS_ACTUAL = REGISTRO.medidor("somnolencia_perclos",
+                                  "Proporción del tiempo con los ojos cerrados en la ventana deslizante")
 
 # --- Funciones ---
 
@@ -31,196 +171,483 @@ def main():
     """
     Función principal que inicializa los objetos y comienza el análisis.
     """
-    # Inicializar la captura de video
-    objetoCaptura = Captura(fuente_video=droidcam_url)
-    captura = objetoCaptura.getCaptura()
-
-    if captura is None:
-        print("No se pudo iniciar la captura de video. Saliendo.")
-        return
+    servidorMetricas = None
+    if PUERTO_METRICAS is not None:
+        servidorMetricas = ServidorMetricas(puerto=PUERTO_METRICAS)
+        servidorMetricas.iniciar()
 
-    # Inicializar la comunicación con Arduino
-    arduino_com = ArduinoComunicador(puerto=puerto_arduino)
+    # Inicializar la comunicación con Arduino (se conecta y reconecta en su propio hilo)
+    arduino_com = DespachadorAlertas(puerto=puerto_arduino, baud_rate=BAUD_ARDUINO, protocolo=PROTOCOLO_ARDUINO)
     arduino_com.conectar()
 
-    # Inicializar la malla facial de MediaPipe
-    objetoMallaFacial = MallaFacial()
-    mediapMallaFacial, mallaFacial = objetoMallaFacial.getMallaFacial()
-    mediapDibujoPuntos, dibujoPuntos = objetoMallaFacial.getPuntosMallaFacial()
+    # La cámara y la malla facial (importar MediaPipe, crear el grafo y una primera inferencia)
+    # se inicializan a la vez; cada una tarda del orden de segundos.
+    if CAPTURA_EN_HILO and RECONECTAR_CAMARA:
+        objetoCaptura = CapturaResiliente(fuente_video=droidcam_url, tamano_buffer=TAMANO_BUFFER_CAPTURA,
+                                          timeout_lectura=TIMEOUT_LECTURA_CAMARA)
+    else:
+        objetoCaptura = Captura(fuente_video=droidcam_url, modo_hilo=CAPTURA_EN_HILO,
+                                tamano_buffer=TAMANO_BUFFER_CAPTURA)
+    cantidadMallas = HILOS_INFERENCIA if EJECUCION_EN_ETAPAS else 1
+    with ThreadPoolExecutor(max_workers=1 + cantidadMallas, thread_name_prefix="Arranque") as arranque:
+        futurosMalla = [arranque.submit(crearMallaFacial) for _ in range(cantidadMallas)]
+        futuroCaptura = arranque.submit(abrirCaptura, objetoCaptura)
+        captura = futuroCaptura.result()
+        try:
+            mallasFaciales = [futuro.result() for futuro in futurosMalla]
+            objetoMallaFacial = mallasFaciales[0]
+        except Exception as e:
+            print(f"No se pudo crear la malla facial: {e}")
+            objetoMallaFacial = None
+
+    if captura is None or objetoMallaFacial is None:
+        if captura is None:
+            print("No se pudo iniciar la captura de video. Saliendo.")
+        objetoCaptura.liberar()
+        arduino_com.desconectar()
+        if servidorMetricas is not None:
+            servidorMetricas.detener()
+        return
+
+    # Ctrl+C o SIGTERM terminan el bucle de forma ordenada
+    detener = threading.Event()
+    def solicitarDetencion(signum, _frame):
+        print(f"Señal {signum} recibida. Deteniendo...")
+        detener.set()
+    signal.signal(signal.SIGINT, solicitarDetencion)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, solicitarDetencion)
+
+    vistaPrevia = None
+    if MODO_HEADLESS and VISTA_PREVIA_HEADLESS:
+        vistaPrevia = VistaPrevia(fps_maximo=FPS_VISTA_PREVIA, detener=detener,
+                                  conexiones=objetoMallaFacial.conexiones, rgb=objetoCaptura.rgb)
+        vistaPrevia.iniciar()
+
+    planificador = None
+    if INFERENCIA_ADAPTATIVA:
+        planificador = PlanificadorInferencia(retardo_maximo=RETARDO_MAXIMO_INFERENCIA)
+
+    # Cada backend mide la apertura a su manera: fuera de FaceMesh la calibración se guarda aparte
+    conductor = ID_CONDUCTOR if BACKEND_LANDMARKS == "facemesh" else f"{ID_CONDUCTOR}@{BACKEND_LANDMARKS}"
+    calibracion = CalibracionConductor(conductor, ruta=ARCHIVO_CALIBRACION, duracion=DURACION_CALIBRACION,
+                                       rango_ear_base=objetoMallaFacial.rango_ear_abierto)
+
+    modoReposo = None
+    if ESPERA_REPOSO is not None:
+        modoReposo = ModoReposo(espera=ESPERA_REPOSO, periodo=PERIODO_REPOSO, escala=ESCALA_REPOSO)
+
+    controladorEscala = None
+    if FPS_OBJETIVO:
+        controladorEscala = ControladorEscala(fps_objetivo=FPS_OBJETIVO, escala_inicial=ESCALA_INFERENCIA,
+                                              escala_minima=ESCALA_MINIMA, ancho_rostro_minimo=ANCHO_ROSTRO_MINIMO)
+
+    filtroCalidad = None
+    if FILTRO_CALIDAD:
+        filtroCalidad = FiltroCalidad(umbral_duplicado=UMBRAL_DUPLICADO, umbral_brillo=UMBRAL_BRILLO,
+                                      umbral_nitidez=UMBRAL_NITIDEZ,
+                                      maximo_omitido=min(MAXIMO_OMITIDO_CALIDAD, RETARDO_MAXIMO_INFERENCIA),
+                                      rgb=objetoCaptura.rgb)
+
+    tuberia = None
+    if EJECUCION_EN_ETAPAS:
+        tuberia = TuberiaEtapas(objetoCaptura, mallasFaciales, planificador=planificador,
+                                tamano_cola=TAMANO_COLAS_ETAPAS, filtro_calidad=filtroCalidad)
+        tuberia.iniciar()
 
     try:
-        analisisVideo(captura, mediapDibujoPuntos, dibujoPuntos, mediapMallaFacial, mallaFacial, arduino_com)
+        analisisVideo(objetoCaptura, objetoMallaFacial, arduino_com,
+                      headless=MODO_HEADLESS, vistaPrevia=vistaPrevia, detener=detener,
+                      planificador=planificador, calibracion=calibracion, inicio_arranque=INICIO_PROGRAMA,
+                      controladorEscala=controladorEscala, tuberia=tuberia, modoReposo=modoReposo,
+                      filtroCalidad=filtroCalidad)
     except Exception as e:
         print(f"Ocurrió un error durante la ejecución: {e}")
     finally:
         print("Limpiando recursos...")
+        if tuberia is not None:
+            tuberia.detener()
         objetoCaptura.liberar()
         # Asegurarse de que la señal final a Arduino sea '0' (normal) si estaba conectado
         if arduino_com.conectado:
              arduino_com.enviar_senal('0')
         arduino_com.desconectar()
-        cv2.destroyAllWindows()
+        if vistaPrevia is not None:
+            vistaPrevia.liberar()
+        if not MODO_HEADLESS:
+            cv2.destroyAllWindows()
+        if servidorMetricas is not None:
+            servidorMetricas.detener()
         print("Recursos liberados. Saliendo.")
 
 
-def analisisVideo(captura, mediapDibujoPuntos, dibujoPuntos, mediapMallaFacial, mallaFacial, arduino_com):
+def crearMallaFacial():
+    """
+    Crea el detector de puntos faciales (BACKEND_LANDMARKS) y lo deja listo para el primer
+    frame. Corre en un hilo de arranque.
+    """
+    opciones = {}
+    if BACKEND_LANDMARKS == "facemesh":
+        opciones = dict(OPCIONES_MALLA, seguimiento_roi=SEGUIMIENTO_ROI, margen_roi=MARGEN_ROI)
+    objetoMallaFacial = crearBackend(BACKEND_LANDMARKS, **opciones)
+    objetoMallaFacial.escala = ESCALA_INFERENCIA
+    objetoMallaFacial.calentar()
+    segundos = time.perf_counter() - INICIO_PROGRAMA
+    ARRANQUE_MALLA.fijar(segundos)
+    print(f"Detector de puntos faciales '{objetoMallaFacial.nombre}' listo a los {segundos:.2f} s")
+    return objetoMallaFacial
+
+
+def abrirCaptura(objetoCaptura):
+    """
+    Abre la fuente de video. Corre en un hilo de arranque.
+    """
+    captura = objetoCaptura.getCaptura()
+    if captura is not None:
+        segundos = time.perf_counter() - INICIO_PROGRAMA
+        ARRANQUE_CAPTURA.fijar(segundos)
+        print(f"Cámara lista a los {segundos:.2f} s")
+    return captura
+
+
+def analisisVideo(objetoCaptura, objetoMallaFacial, arduino_com,
+                  headless=False, vistaPrevia=None, detener=None, planificador=None, calibracion=None,
+                  inicio_arranque=None, controladorEscala=None, tuberia=None, modoReposo=None,
+                  filtroCalidad=None):
     """
     Procesa el video frame a frame, detecta somnolencia con umbral de tiempo y envía señales a Arduino.
+    El temporizador de ojos cerrados usa la marca de tiempo de captura de cada frame
+    (time.perf_counter(), monotónica), que también acompaña a la alerta hasta el Arduino para
+    medir el tiempo desde la cámara hasta la alarma.
+    Los ojos se consideran cerrados cuando el EAR promedio de ambos baja del umbral, que la
+    calibración del conductor ajusta si se pasa una.
+
+    Con headless=True no se dibuja nada ni se lee el teclado; el bucle termina cuando se activa
+    `detener`. Si se pasa una vistaPrevia, solo se le publica el frame y ella lo dibuja en su hilo.
+    Si se pasa un planificador, la malla facial solo corre en los frames que él indique.
+    Si se pasa inicio_arranque (time.perf_counter() al iniciar el programa), se informa cuánto
+    tardó en procesarse el primer frame.
+    Si se pasa un controladorEscala, después de cada inferencia ajusta la escala de la malla facial.
+    Si se pasa una tuberia (TuberiaEtapas ya iniciada), los frames llegan de ella ya espejados e
+    inferidos y en este hilo queda solo el análisis.
+    Si se pasa un modoReposo, sin rostro por un rato la captura baja a un frame por periodo (y
+    la malla a la escala de reposo) hasta volver a ver un rostro.
+    Si se pasa un filtroCalidad, los frames repetidos, oscuros o movidos no se infieren.
     """
-    vectorEstado = []
+    if detener is None:
+        detener = threading.Event()
+    registro = RegistroSesion(rutaSesion(DIRECTORIO_SESIONES) if DIRECTORIO_SESIONES else None,
+                              capacidad=FRAMES_EN_MEMORIA)
     verMalla = False
     rotacion = 1 # 1 para efecto espejo
 
     anteriorTiempoFrame = 0
     capturaTiempoFrame = 0
 
-    # --- Variables para control de tiempo de ojos cerrados ---
-    tiempo_ojos_cerrados_inicio = None # Timestamp de cuando se cerraron los ojos por primera vez
-    alerta_activa = False # Estado actual de la alerta de somnolencia
-
-    while True:
-        estado, frame = captura.read()
-        if not estado:
-            print("No se pudo leer el frame. Terminando bucle.")
-            break
-
-        if rotacion != 0:
-            frame = cv2.flip(frame, rotacion)
-
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        resultados = mallaFacial.process(frame_rgb)
-        listaPuntosFaciales = []
-        mensaje_somnolencia_actual = "no" # Estado detectado en ESTE frame
-
-        texto_estado_display = "Conductor Alerta" # Texto a mostrar por defecto
-        color_estado_display = (0, 255, 0) # Verde por defecto
-
-        if resultados.multi_face_landmarks:
-            for rostros in resultados.multi_face_landmarks:
-                if verMalla:
-                    mediapDibujoPuntos.draw_landmarks(
-                        image=frame, landmark_list=rostros,
-                        connections=mediapMallaFacial.FACEMESH_CONTOURS,
-                        landmark_drawing_spec=dibujoPuntos,
-                        connection_drawing_spec=dibujoPuntos)
+    # --- Control de tiempo de ojos cerrados ---
+    temporizador = TemporizadorSomnolencia(umbral_tiempo=UMBRAL_TIEMPO_SOMNOLENCIA)
+    indicadores = IndicadoresOjos(ventana_perclos=VENTANA_PERCLOS)
+    if calibracion is not None:
+        indicadores.umbral_ear = calibracion.umbral_ear
+    if planificador is not None:
+        planificador.umbral_ear = indicadores.umbral_ear # El planificador mira el mismo umbral que la alerta
+    ear = None
+    grabador = None
+    if GRABAR_LANDMARKS and registro.ruta is not None:
+        # Todos los frames analizados y la configuración, para que la reproducción repita esta sesión
+        grabador = GrabadorLandmarks(registro.ruta.rsplit(".", 1)[0] + ".lmk", umbral_ear=indicadores.umbral_ear,
+                                     umbral_tiempo=UMBRAL_TIEMPO_SOMNOLENCIA, ventana_perclos=VENTANA_PERCLOS)
+
+    # Un solo analizador y un solo arreglo de puntos reutilizados en todos los frames, y lo
+    # mismo para el espejo y la conversión a RGB (se reservan de nuevo solo si cambia la resolución)
+    objetoAnalisisFacial = AnalisisFacial()
+    puntosFaciales = np.empty((NUM_PUNTOS_MALLA, 2), dtype=np.float32)
+    frameEspejo = None
+    frameRgb = None
+    frameBgr = None # Solo para mostrar una fuente que entrega RGB
+    puntos = None
+    texto_estado_display = "Conductor Alerta"
+    color_estado_display = (0, 255, 0)
+    ojos_cerrados = False
+    escalaNormal = objetoMallaFacial.escala # Escala a recuperar al salir del reposo
+    ESCALA_ACTUAL.fijar(objetoMallaFacial.escala)
+
+    def fijarEscala(escala):
+        objetoMallaFacial.escala = escala
+        if tuberia is not None:
+            tuberia.fijarEscala(escala)
+        ESCALA_ACTUAL.fijar(escala)
+
+    def atenderTeclado():
+        """
+        Procesa los eventos de la ventana y la tecla presionada.
+
+        Returns:
+            bool: True si se pidió salir (ESC).
+        """
+        nonlocal rotacion, verMalla
+        tecla = cv2.waitKey(1) & 0xFF
+        if tecla == ord('e'):
+            rotacion = 1 if rotacion == 0 else 0
+            if tuberia is not None:
+                tuberia.rotacion = rotacion
+            print(f"Efecto espejo: {'Activado' if rotacion == 1 else 'Desactivado'}")
+        elif tecla == ord('q'):
+            verMalla = not verMalla
+            print(f"Mostrar malla: {'Activado' if verMalla else 'Desactivado'}")
+        elif tecla == 27:
+            print("Tecla ESC presionada. Saliendo...")
+            return True
+        return False
 
-                listaPuntosFaciales.clear()
-                for puntoID, puntos in enumerate(rostros.landmark):
-                    altoVentana, anchoVentana, _ = frame.shape
-                    posx = int(puntos.x * anchoVentana)
-                    posy = int(puntos.y * altoVentana)
-                    listaPuntosFaciales.append([puntoID, posx, posy])
+    fuente = tuberia if tuberia is not None else objetoCaptura
+    formaVideo = (480, 640, 3) # Tamaño del aviso de corte hasta conocer el del video
 
-                if len(listaPuntosFaciales) == 468:
-                    objetoAnalisisFacial = AnalisisFacial(listaPuntosFaciales)
-                    mensaje_somnolencia_actual = objetoAnalisisFacial.getLongitudes() # 'yes' o 'no'
-
-                    # --- Lógica del temporizador de somnolencia ---
-                    if mensaje_somnolencia_actual == 'yes':
-                        # Ojos detectados como cerrados en este frame
-                        if tiempo_ojos_cerrados_inicio is None:
-                            # Si es la primera vez que se detectan cerrados, iniciar temporizador
-                            tiempo_ojos_cerrados_inicio = time.time()
-                            # print("Ojos cerrados detectados, iniciando contador...") # Debug
-                        else:
-                            # Si ya estaban cerrados, calcular cuánto tiempo llevan así
-                            duracion_cerrado = time.time() - tiempo_ojos_cerrados_inicio
-                            # print(f"Ojos cerrados por {duracion_cerrado:.2f} segundos") # Debug
-
-                            if duracion_cerrado >= UMBRAL_TIEMPO_SOMNOLENCIA:
-                                # Si superó el umbral, activar (o mantener) la alerta
-                                if not alerta_activa:
-                                    print(f"¡ALERTA! Ojos cerrados por más de {UMBRAL_TIEMPO_SOMNOLENCIA} seg.")
-                                    arduino_com.enviar_senal('1') # Enviar señal de alerta
-                                    alerta_activa = True
-                                texto_estado_display = "SOMNOLENCIA DETECTADA!"
-                                color_estado_display = (0, 0, 255) # Rojo
-                            else:
-                                # Si están cerrados pero aún no superan el umbral
-                                texto_estado_display = f"Ojos cerrados ({duracion_cerrado:.1f}s)"
-                                color_estado_display = (0, 255, 255) # Amarillo
-                                # No se envía señal '1' todavía
-
-                    else: # mensaje_somnolencia_actual == 'no'
-                        # Ojos detectados como abiertos en este frame
-                        # print("Ojos abiertos detectados.") # Debug
-                        if alerta_activa:
-                            # Si la alerta estaba activa, desactivarla
-                            print("Desactivando alerta.")
-                            arduino_com.enviar_senal('0') # Enviar señal de normalidad
-                            alerta_activa = False
-                        # Reiniciar el temporizador de ojos cerrados
-                        tiempo_ojos_cerrados_inicio = None
-                        texto_estado_display = "Conductor Alerta"
-                        color_estado_display = (0, 255, 0) # Verde
-
-                    # Guardar estado para gráfico final ('cerrado' solo si la alerta está activa)
-                    estado_grafico = "cerrado" if alerta_activa else "abierto"
-                    vectorEstado.append(estado_grafico)
-                    # Salir del bucle de rostros (asumimos un solo conductor)
-                    break
+    while not detener.is_set():
+        inicioEtapa = time.perf_counter()
+        if tuberia is not None:
+            enCurso = tuberia.leer()
+            estado, frame, tiempoCaptura = enCurso.estado, enCurso.frame, enCurso.tiempo_captura
         else:
-            # No se detectó rostro
-            texto_estado_display = "No se detecta rostro"
-            color_estado_display = (0, 255, 255) # Amarillo/Naranja
-            if alerta_activa:
-                # Si no hay rostro y la alerta estaba activa, desactivarla
-                print("No se detecta rostro, desactivando alerta.")
-                arduino_com.enviar_senal('0')
-                alerta_activa = False
-            # Reiniciar temporizador si no hay rostro
-            tiempo_ojos_cerrados_inicio = None
-
-        # Mostrar estado en el frame
-        cv2.putText(frame, text=texto_estado_display, org=(10, 30), fontFace=fuente,
-                    fontScale=0.8, color=color_estado_display, thickness=2, lineType=cv2.LINE_AA)
-
-        # Calcular y mostrar FPS
-        capturaTiempoFrame = time.time()
+            estado, frame, tiempoCaptura = objetoCaptura.leer()
+        if not estado:
+            if fuente.finalizada:
+                print("No se pudo leer el frame. Terminando bucle.")
+                break
+            # Corte del stream: la captura se reconecta sola y el estado se conserva. Sin ver
+            # los ojos no se puede afirmar que siguen cerrados, así que se descarta la cuenta en
+            # curso; una alerta ya activa sigue activa hasta volver a ver los ojos abiertos.
+            if not temporizador.alerta_activa:
+                temporizador.inicio_cerrado = None
+            if grabador is not None:
+                grabador.agregar(time.perf_counter(), None, FRAME_CORTE)
+            # La ventana (o la vista previa) sigue respondiendo y muestra el corte: leer() vuelve
+            # cada segundo sin frame, así que ESC y las demás teclas se atienden también ahora
+            if headless and vistaPrevia is None:
+                continue
+            frameCorte = np.zeros(formaVideo, dtype=np.uint8)
+            if headless:
+                vistaPrevia.publicar(frameCorte, "Sin video: reconectando...", (0, 165, 255), 0)
+                continue
+            dibujarEstado(frameCorte, "Sin video: reconectando...", (0, 165, 255), 0)
+            cv2.imshow("Detector de Somnolencia (ESC para salir)", frameCorte)
+            if atenderTeclado():
+                break
+            continue
+        formaVideo = frame.shape
+        finEtapa = time.perf_counter()
+        if tuberia is None: # En la tubería la captura se mide en su propio hilo
+            LATENCIA_CAPTURA.observar(finEtapa - inicioEtapa)
+        inicioEtapa = finEtapa
+
+        inicioProcesamiento = inicioEtapa
+
+        if tuberia is None and rotacion != 0:
+            frameEspejo = asegurarBuffer(frameEspejo, frame.shape)
+            frame = cv2.flip(frame, rotacion, dst=frameEspejo)
+
+        # Con la inferencia adaptativa o el filtro de calidad, en los frames omitidos se
+        # reutiliza el último resultado (el filtro cuenta sus omisiones por motivo)
+        if tuberia is not None:
+            motivoOmision = enCurso.motivo_omision
+        elif planificador is not None and not planificador.debeInferir(tiempoCaptura):
+            motivoOmision = "planificador"
+        elif filtroCalidad is not None:
+            motivoOmision = filtroCalidad.evaluar(frame, tiempoCaptura,
+                                                  cada_frame=planificador is not None and planificador.cadaFrame())
+        else:
+            motivoOmision = None
+        if motivoOmision is not None:
+            # El frame que omite el planificador cuenta para el PERCLOS con el último estado de
+            # los ojos. Uno descartado por calidad no se cuenta: no se sabe cómo estaban.
+            if motivoOmision == "planificador":
+                INFERENCIAS_OMITIDAS.incrementar()
+                indicadores.repetir(tiempoCaptura)
+            if grabador is not None:
+                grabador.agregar(tiempoCaptura, puntos,
+                                 FRAME_REPETIDO if motivoOmision == "planificador" else FRAME_DESCARTADO)
+        else:
+            if tuberia is not None:
+                puntos, confianza = enCurso.puntos, enCurso.confianza
+                if puntos is not None:
+                    # Los de la tubería vuelven a su pool en la próxima lectura y los frames
+                    # omitidos siguen usando estos
+                    np.copyto(puntosFaciales, puntos)
+                    puntos = puntosFaciales
+            else:
+                if objetoCaptura.rgb:
+                    frame_rgb = frame # La fuente (pantalla) ya entrega RGB
+                else:
+                    frameRgb = asegurarBuffer(frameRgb, frame.shape)
+                    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frameRgb)
+                finEtapa = time.perf_counter()
+                LATENCIA_PREPROCESO.observar(finEtapa - inicioEtapa)
+                inicioEtapa = finEtapa
+
+                puntos, confianza = objetoMallaFacial.detectar(frame_rgb, puntosFaciales)
+                finEtapa = time.perf_counter()
+                LATENCIA_INFERENCIA.observar(finEtapa - inicioEtapa)
+                inicioEtapa = finEtapa
+            CONFIANZA_LANDMARKS.fijar(confianza)
+            FRAMES_PROCESADOS.incrementar()
+            if inicio_arranque is not None:
+                segundos = time.perf_counter() - inicio_arranque
+                ARRANQUE_PRIMER_FRAME.fijar(segundos)
+                print(f"Primer frame procesado a los {segundos:.2f} s del arranque")
+                inicio_arranque = None
+            if grabador is not None:
+                grabador.agregar(tiempoCaptura, puntos, FRAME_INFERIDO)
+
+            texto_estado_display = "Conductor Alerta" # Texto a mostrar por defecto
+            color_estado_display = (0, 255, 0) # Verde por defecto
+            ear = None
+            ojos_cerrados = False
+
+            if puntos is not None:
+                ear_izquierdo, ear_derecho = objetoAnalisisFacial.calcularEAR(puntos)
+                ear = float(ear_izquierdo + ear_derecho) / 2
+                if calibracion is not None and calibracion.agregar(ear, tiempoCaptura):
+                    indicadores.umbral_ear = calibracion.umbral_ear
+                    if grabador is not None:
+                        grabador.fijarUmbral(calibracion.umbral_ear, tiempoCaptura)
+                    if planificador is not None:
+                        planificador.umbral_ear = calibracion.umbral_ear
+                _, ojos_cerrados, perclos = indicadores.actualizar(ear, tiempoCaptura)
+                EAR_ACTUAL.fijar(indicadores.ear)
+                PERCLOS_ACTUAL.fijar(perclos)
+
+                # --- Lógica del temporizador de somnolencia ---
+                cambio, duracion_cerrado = temporizador.actualizar(ojos_cerrados, tiempoCaptura)
+                if cambio == '1':
+                    ALERTAS.incrementar()
+                    LATENCIA_ALERTA_DECISION.observar(time.perf_counter() - tiempoCaptura)
+                    print(f"¡ALERTA! Ojos cerrados por más de {UMBRAL_TIEMPO_SOMNOLENCIA} seg.")
+                    arduino_com.enviar_senal('1', tiempoCaptura) # Enviar señal de alerta
+                elif cambio == '0':
+                    print("Desactivando alerta.")
+                    arduino_com.enviar_senal('0') # Enviar señal de normalidad
+
+                if temporizador.alerta_activa:
+                    texto_estado_display = "SOMNOLENCIA DETECTADA!"
+                    color_estado_display = (0, 0, 255) # Rojo
+                elif ojos_cerrados:
+                    # Si están cerrados pero aún no superan el umbral
+                    texto_estado_display = f"Ojos cerrados ({duracion_cerrado:.1f}s)"
+                    color_estado_display = (0, 255, 255) # Amarillo
+                elif calibracion is not None and not calibracion.completa:
+                    texto_estado_display = f"Calibrando ({calibracion.restante(tiempoCaptura):.0f}s)"
+            else:
+                # No se detectó rostro
+                FRAMES_SIN_ROSTRO.incrementar()
+                indicadores.actualizar(None, tiempoCaptura)
+                texto_estado_display = "No se detecta rostro"
+                color_estado_display = (0, 255, 255) # Amarillo/Naranja
+                # Reiniciar temporizador si no hay rostro
+                if temporizador.reiniciar() == '0':
+                    # Si no hay rostro y la alerta estaba activa, desactivarla
+                    print("No se detecta rostro, desactivando alerta.")
+                    arduino_com.enviar_senal('0')
+
+            if filtroCalidad is not None:
+                # Los repetidos se comparan en la zona de los ojos de esta inferencia y con los
+                # ojos cerrándose no se descarta ningún frame
+                filtroCalidad.actualizar(puntos, temporizador.inicio_cerrado is not None)
+
+            if planificador is not None:
+                planificador.registrar(tiempoCaptura, indicadores.ear if puntos is not None else None,
+                                       temporizador.inicio_cerrado is not None)
+
+            finEtapa = time.perf_counter()
+            LATENCIA_ANALISIS.observar(finEtapa - inicioEtapa)
+            LATENCIA_FRAME.observar(finEtapa - tiempoCaptura)
+            inicioEtapa = finEtapa
+
+            if modoReposo is not None and modoReposo.actualizar(tiempoCaptura, puntos is not None):
+                MODO_REPOSO.fijar(1 if modoReposo.activo else 0)
+                if modoReposo.activo:
+                    ENTRADAS_REPOSO.incrementar()
+                    print(f"Sin rostro por {modoReposo.espera:.0f} s: modo reposo, "
+                          f"un frame cada {modoReposo.periodo:.1f} s.")
+                    objetoCaptura.intervalo_minimo = modoReposo.periodo
+                    escalaNormal = objetoMallaFacial.escala
+                    if modoReposo.escala is not None and modoReposo.escala < escalaNormal:
+                        fijarEscala(modoReposo.escala)
+                else:
+                    print("Rostro detectado: fin del modo reposo.")
+                    objetoCaptura.intervalo_minimo = 0.0
+                    fijarEscala(escalaNormal)
+
+            # En reposo los tiempos no reflejan la carga normal: la escala queda quieta
+            if controladorEscala is not None and not (modoReposo is not None and modoReposo.activo):
+                anchoRostro = float(objetoAnalisisFacial.calcularAnchoRostro(puntos)) if puntos is not None else None
+                tiempoPorFrame = finEtapa - inicioProcesamiento
+                if tuberia is not None:
+                    # En etapas los FPS los limita la etapa más lenta, no la suma de todas
+                    tiempoPorFrame = max(tiempoPorFrame, enCurso.periodo)
+                escala = controladorEscala.actualizar(tiempoPorFrame, anchoRostro)
+                if escala != objetoMallaFacial.escala:
+                    fijarEscala(escala)
+
+        # Guardar el estado del frame para el reporte de la sesión (los omitidos repiten el último)
+        registro.agregar(tiempoCaptura, indicadores.ear if ear is not None else None, indicadores.perclos,
+                         puntos is not None, ojos_cerrados, temporizador.alerta_activa)
+
+        # Calcular FPS
+        capturaTiempoFrame = time.perf_counter()
         fps = 0
         if capturaTiempoFrame > anteriorTiempoFrame:
              fps = 1 / (capturaTiempoFrame - anteriorTiempoFrame)
         anteriorTiempoFrame = capturaTiempoFrame
-        cv2.putText(frame, text=f'FPS: {int(fps)}', org=(frame.shape[1] - 120, 30), fontFace=fuente,
-                    fontScale=0.8, color=(255, 255, 0), thickness=2, lineType=cv2.LINE_AA)
+
+        if headless:
+            if vistaPrevia is not None:
+                # Copia de los puntos porque el arreglo se reutiliza en el siguiente frame
+                vistaPrevia.publicar(frame, texto_estado_display, color_estado_display, fps,
+                                     None if puntos is None else puntos.copy())
+            continue
+
+        # Mostrar malla, estado y FPS en el frame
+        if fuente.rgb:
+            frameBgr = asegurarBuffer(frameBgr, frame.shape)
+            frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR, dst=frameBgr)
+        if verMalla and puntos is not None:
+            dibujarMalla(frame, puntos, objetoMallaFacial.conexiones)
+        dibujarEstado(frame, texto_estado_display, color_estado_display, fps)
 
         cv2.imshow("Detector de Somnolencia (ESC para salir)", frame)
 
-        tecla = cv2.waitKey(1) & 0xFF
-        if tecla == ord('e'):
-            rotacion = 1 if rotacion == 0 else 0
-            print(f"Efecto espejo: {'Activado' if rotacion == 1 else 'Desactivado'}")
-        elif tecla == ord('q'):
-            verMalla = not verMalla
-            print(f"Mostrar malla: {'Activado' if verMalla else 'Desactivado'}")
-        elif tecla == 27:
-            print("Tecla ESC presionada. Saliendo...")
+        salir = atenderTeclado()
+        LATENCIA_DIBUJO.observar(time.perf_counter() - inicioEtapa)
+        if salir:
             break
 
     # --- Fin del bucle ---
-    if vectorEstado:
-        print("Generando gráfico de estados...")
-        analizarDatos(vectorEstado)
-    else:
-        print("No se generaron datos para el gráfico.")
+    if filtroCalidad is not None:
+        print("Frames sin inferir por calidad: "
+              + ", ".join(f"{motivo} {cantidad}" for motivo, cantidad in filtroCalidad.omitidos.items()))
+    registro.cerrar()
+    if grabador is not None:
+        grabador.cerrar()
+        print(f"Puntos faciales grabados en {grabador.ruta}")
+    analizarDatos(registro, indicadores.umbral_ear)
 
 
-def analizarDatos(vectorEstado):
+def analizarDatos(registro, umbral_ear=None):
     """
-    Muestra un gráfico simple del estado de la alerta a lo largo del tiempo.
+    Guarda un gráfico de la sesión en un archivo (sin abrir ventanas, así no demora el apagado).
     """
+    datos = registro.datos()
+    if len(datos) == 0:
+        print("No se generaron datos para el gráfico.")
+        return
+    alertas = int(np.count_nonzero(np.diff(datos["alerta"].astype(np.int8)) == 1) + datos["alerta"][0])
+    print(f"Frames registrados: {len(datos)}, con rostro: {int(datos['rostro'].sum())}, alertas: {alertas}")
+    if registro.ruta is None:
+        return
+    ruta_imagen = registro.ruta.rsplit(".", 1)[0] + ".png"
     try:
-        plt.figure(figsize=(10, 5))
-        # Convertir 'abierto' a 0 y 'cerrado' (alerta activa) a 1
-        estados_num = [1 if estado == "cerrado" else 0 for estado in vectorEstado]
-        plt.plot(estados_num)
-        plt.title('Análisis de Alerta de Somnolencia')
-        plt.xlabel('Tiempo (frames)')
-        plt.ylabel('Estado Alerta (1=Activa, 0=Inactiva)')
-        plt.yticks([0, 1], ['Inactiva', 'Activa'])
-        plt.grid(True)
-        plt.ylim(-0.1, 1.1)
-        plt.show()
+        if graficarSesion(datos, ruta_imagen, umbral_ear=umbral_ear):
+            print(f"Gráfico de la sesión guardado en {ruta_imagen}")
     except Exception as e:
         print(f"No se pudo generar el gráfico: {e}")
         print("Asegúrate de tener matplotlib instalado: pip install matplotlib")
@@ -1,26 +1,184 @@
-import mediapipe as mp
+import cv2 # Opencv
+import numpy as np
 
-class MallaFacial:
+from analisis_facial import NUM_PUNTOS_MALLA
+from backends_landmarks import BackendLandmarks
 
+class MallaFacial(BackendLandmarks):
+
+    nombre="facemesh"
     mallaFacial=None
     puntosMallaFacial=None
+    conexiones=None
+    roi=None # (x0, y0, x1, y1) del recorte donde se buscó el rostro en el último frame
+
+    def __init__(self,max_num_faces=1,refine_landmarks=False,static_image_mode=False,
+                 min_detection_confidence=0.5,min_tracking_confidence=0.5,
+                 seguimiento_roi=False,margen_roi=0.3,escala=1.0):
+        """
+        Crea la malla facial de MediaPipe.
 
-    def __init__(self):    
+        Args:
+            max_num_faces (int): Rostros a buscar (el análisis usa solo el primero).
+            refine_landmarks (bool): Agrega los puntos del iris (más costoso).
+            static_image_mode (bool): Detectar en cada frame en lugar de seguir el rostro.
+            min_detection_confidence (float): Confianza mínima de la detección inicial.
+            min_tracking_confidence (float): Confianza mínima para seguir el rostro entre frames.
+            seguimiento_roi (bool): Si es True, una vez encontrado el rostro la inferencia corre
+                                    solo sobre un recorte alrededor de él.
+            margen_roi (float): Margen agregado al recuadro del rostro, como fracción de su tamaño.
+            escala (float): Factor de reducción de la imagen antes de la inferencia (1.0 = tamaño
+                            original). Los puntos se devuelven igual en píxeles del frame completo,
+                            porque MediaPipe los entrega normalizados. Se puede cambiar en cualquier frame.
+        """
+        # MediaPipe se importa aquí: tarda en cargar y así puede hacerse en un hilo durante el arranque
+        import mediapipe as mp
         #Creamos un objeto donde almacenar la malla facial
         mediapMallaFacial=mp.solutions.face_mesh
         #Creamos el objeto de la malla facial
-        mallaFacial=mediapMallaFacial.FaceMesh()
+        mallaFacial=mediapMallaFacial.FaceMesh(
+            static_image_mode=static_image_mode,
+            max_num_faces=max_num_faces,
+            refine_landmarks=refine_landmarks,
+            min_detection_confidence=min_detection_confidence,
+            min_tracking_confidence=min_tracking_confidence)
         self.mallaFacial=mediapMallaFacial,mallaFacial
-        
+        self.conexiones=mediapMallaFacial.FACEMESH_CONTOURS
+        self.seguimiento_roi=seguimiento_roi
+        self.margen_roi=margen_roi
+        self.roi=None
+        self.escala=escala
+        self._tamano_referencia=1.0
+
         #Creamos un objeto donde almacenar los puntos faciales de mediapipe
         mediapDibujoPuntos=mp.solutions.drawing_utils
-        #Asignamos valores a los puntos 
+        #Asignamos valores a los puntos
         #Color BGR
         puntosMalla=mediapDibujoPuntos.DrawingSpec(thickness=1,circle_radius=0,color=(255,255,0))
         self.puntosMallaFacial=mediapDibujoPuntos,puntosMalla
 
-    def getMallaFacial(self):      
+    def calentar(self,ancho=640,alto=480):
+        """
+        Corre una inferencia sobre un frame negro para que MediaPipe termine de inicializar
+        su grafo antes del primer frame real. No deja estado de seguimiento (no hay rostro).
+        """
+        self.mallaFacial[1].process(np.zeros((alto,ancho,3),dtype=np.uint8))
+        self.roi=None
+
+    def reiniciar(self):
+        """
+        Descarta el rostro seguido: un frame sin rostro hace que MediaPipe vuelva a detectar
+        desde cero en el siguiente, y se olvida el recorte de seguimiento_roi.
+        """
+        self.calentar()
+
+    def getMallaFacial(self):
         return self.mallaFacial
 
     def getPuntosMallaFacial(self):
-        return self.puntosMallaFacial       
\ No newline at end of file
+        return self.puntosMallaFacial
+
+    def detectar(self,frame_rgb,destino=None):
+        """
+        Busca el rostro en el frame y devuelve sus puntos en píxeles del frame completo.
+
+        Con seguimiento_roi la inferencia corre sobre el recorte del frame anterior; si ahí no
+        aparece el rostro, se vuelve a buscar en el frame completo en la misma llamada.
+
+        Args:
+            frame_rgb (np.ndarray): Frame en RGB.
+            destino (np.ndarray, opcional): Arreglo (468, 2) preasignado para los puntos.
+
+        Returns:
+            tuple: (puntos, confianza). Puntos (468, 2) del primer rostro y 1.0, o (None, 0.0) si
+                   no hay rostro. FaceMesh no informa un puntaje por rostro: los que devuelve ya
+                   superaron min_detection_confidence / min_tracking_confidence.
+        """
+        altoVentana,anchoVentana=frame_rgb.shape[:2]
+        if self.seguimiento_roi and self.roi is not None:
+            x0,y0,x1,y1=self.roi
+            puntos=self._inferir(frame_rgb[y0:y1,x0:x1],destino,origen=(x0,y0))
+            if puntos is not None:
+                self._actualizarRoi(puntos,anchoVentana,altoVentana)
+                return puntos,1.0
+            # Se perdió el rostro dentro del recorte: volver a la detección en el frame completo
+            self.roi=None
+
+        puntos=self._inferir(frame_rgb,destino)
+        if puntos is None:
+            return None,0.0
+        if self.seguimiento_roi:
+            self._actualizarRoi(puntos,anchoVentana,altoVentana)
+        return puntos,1.0
+
+    def _inferir(self,imagen_rgb,destino,origen=(0,0)):
+        alto,ancho=imagen_rgb.shape[:2]
+        if self.escala<1.0:
+            entrada=cv2.resize(imagen_rgb,(max(1,round(ancho*self.escala)),max(1,round(alto*self.escala))),
+                               interpolation=cv2.INTER_AREA)
+        else:
+            entrada=np.ascontiguousarray(imagen_rgb)
+        resultados=self.mallaFacial[1].process(entrada)
+        if not resultados.multi_face_landmarks:
+            return None
+        rostro=resultados.multi_face_landmarks[0]
+        if len(rostro.landmark)<NUM_PUNTOS_MALLA:
+            return None
+        # Los landmarks son relativos a la imagen, así que se escalan con el tamaño sin reducir
+        if destino is None:
+            destino=np.empty((NUM_PUNTOS_MALLA,2),dtype=np.float32)
+        return landmarksAArreglo(rostro,ancho,alto,destino,origen)
+
+    def _actualizarRoi(self,puntos,anchoVentana,altoVentana):
+        """
+        Recalcula el recorte a partir del recuadro de los puntos. Se mantiene el recorte anterior
+        mientras el rostro siga dentro y su tamaño no cambie mucho, para que el seguimiento interno
+        de MediaPipe vea una imagen estable.
+        """
+        xmin,ymin=puntos.min(axis=0)
+        xmax,ymax=puntos.max(axis=0)
+        ancho,alto=xmax-xmin,ymax-ymin
+        if self.roi is not None:
+            x0,y0,x1,y1=self.roi
+            margen_x,margen_y=(x1-x0)*0.1,(y1-y0)*0.1
+            dentro=xmin>=x0+margen_x and ymin>=y0+margen_y and xmax<=x1-margen_x and ymax<=y1-margen_y
+            cambio_tamano=max(ancho,alto)/self._tamano_referencia
+            if dentro and 0.75<=cambio_tamano<=1.25:
+                return
+        self._tamano_referencia=max(1.0,max(ancho,alto))
+        lado=self._tamano_referencia*(1+2*self.margen_roi)
+        centro_x,centro_y=(xmin+xmax)/2,(ymin+ymax)/2
+        x0=int(max(0,centro_x-lado/2))
+        y0=int(max(0,centro_y-lado/2))
+        x1=int(min(anchoVentana,centro_x+lado/2))
+        y1=int(min(altoVentana,centro_y+lado/2))
+        # Un recorte demasiado chico o casi del tamaño del frame no vale la pena
+        if x1-x0<32 or y1-y0<32 or (x1-x0)*(y1-y0)>=0.8*anchoVentana*altoVentana:
+            self.roi=None
+        else:
+            self.roi=(x0,y0,x1,y1)
+
+def landmarksAArreglo(rostro,anchoVentana,altoVentana,destino=None,origen=(0,0)):
+    """
+    Copia los landmarks normalizados de un rostro de MediaPipe a un arreglo (N, 2) en píxeles.
+
+    Args:
+        rostro: Elemento de resultados.multi_face_landmarks.
+        anchoVentana (int): Ancho de la imagen procesada en píxeles.
+        altoVentana (int): Alto de la imagen procesada en píxeles.
+        destino (np.ndarray, opcional): Arreglo float32 (N, 2) preasignado que se reutiliza
+                                        entre frames. Si se omite se crea uno nuevo.
+        origen (tuple): Esquina (x, y) de la imagen procesada dentro del frame completo,
+                        para llevar los puntos de un recorte a coordenadas del frame.
+
+    Returns:
+        np.ndarray: El arreglo destino con las coordenadas x, y de cada punto.
+    """
+    landmarks=rostro.landmark
+    if destino is None:
+        destino=np.empty((len(landmarks),2),dtype=np.float32)
+    destino[:]=[(punto.x,punto.y) for punto in landmarks[:len(destino)]]
+    destino*=(anchoVentana,altoVentana)
+    if origen!=(0,0):
+        destino+=origen
+    return destino
@@ -0,0 +1,205 @@
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Límites (en segundos) de los histogramas de latencia por defecto
+LIMITES_LATENCIA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _formatearEtiquetas(etiquetas, extra=None):
+    pares = list(etiquetas)
+    if extra is not None:
+        pares.append(extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{clave}="{valor}"' for clave, valor in pares) + "}"
+
+
+def _formatearValor(valor):
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Contador:
+    """
+    Contador que solo aumenta (frames procesados, alertas, errores...).
+    """
+    def __init__(self):
+        self.valor = 0
+        self._lock = threading.Lock()
+
+    def incrementar(self, cantidad=1):
+        with self._lock:
+            self.valor += cantidad
+
+    def lineas(self, nombre, etiquetas):
+        yield f"{nombre}{_formatearEtiquetas(etiquetas)} {self.valor}"
+
+
+class Medidor:
+    """
+    Valor que puede subir o bajar (profundidad de una cola, escala actual...).
+    """
+    def __init__(self):
+        self.valor = 0.0
+
+    def fijar(self, valor):
+        self.valor = valor
+
+    def lineas(self, nombre, etiquetas):
+        yield f"{nombre}{_formatearEtiquetas(etiquetas)} {_formatearValor(float(self.valor))}"
+
+
+class Histograma:
+    """
+    Histograma acumulativo de cubetas fijas. Registrar una muestra cuesta una búsqueda
+    binaria y dos sumas; el texto solo se arma cuando alguien consulta el endpoint.
+    """
+    def __init__(self, limites=LIMITES_LATENCIA):
+        self.limites = tuple(sorted(limites))
+        self.cubetas = [0] * (len(self.limites) + 1)
+        self.suma = 0.0
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def observar(self, valor):
+        indice = bisect.bisect_left(self.limites, valor)
+        with self._lock:
+            self.cubetas[indice] += 1
+            self.suma += valor
+            self.total += 1
+
+    def lineas(self, nombre, etiquetas):
+        with self._lock:
+            cubetas, suma, total = list(self.cubetas), self.suma, self.total
+        acumulado = 0
+        for limite, cantidad in zip(self.limites + (float("inf"),), cubetas):
+            acumulado += cantidad
+            yield f"{nombre}_bucket{_formatearEtiquetas(etiquetas, ('le', _formatearValor(limite)))} {acumulado}"
+        yield f"{nombre}_sum{_formatearEtiquetas(etiquetas)} {_formatearValor(suma)}"
+        yield f"{nombre}_count{_formatearEtiquetas(etiquetas)} {total}"
+
+
+class RegistroMetricas:
+    """
+    Conjunto de métricas con nombre que se exporta en el formato de texto de Prometheus.
+    """
+    _tipos = {Contador: "counter", Medidor: "gauge", Histograma: "histogram"}
+
+    def __init__(self):
+        self._familias = {} # nombre -> (clase, ayuda, {etiquetas: métrica})
+        self._lock = threading.Lock()
+
+    def _obtener(self, clase, nombre, ayuda, etiquetas, **opciones):
+        clave = tuple(sorted((etiquetas or {}).items()))
+        with self._lock:
+            familia = self._familias.setdefault(nombre, (clase, ayuda, {}))
+            if familia[0] is not clase:
+                raise ValueError(f"La métrica {nombre} ya existe con otro tipo.")
+            metricas = familia[2]
+            if clave not in metricas:
+                metricas[clave] = clase(**opciones)
+            return metricas[clave]
+
+    def contador(self, nombre, ayuda="", etiquetas=None):
+        return self._obtener(Contador, nombre, ayuda, etiquetas)
+
+    def medidor(self, nombre, ayuda="", etiquetas=None):
+        return self._obtener(Medidor, nombre, ayuda, etiquetas)
+
+    def histograma(self, nombre, ayuda="", etiquetas=None, limites=LIMITES_LATENCIA):
+        return self._obtener(Histograma, nombre, ayuda, etiquetas, limites=limites)
+
+    def exponer(self):
+        """
+        Devuelve todas las métricas en formato de texto de Prometheus.
+        """
+        with self._lock:
+            familias = [(nombre, clase, ayuda, list(metricas.items()))
+                        for nombre, (clase, ayuda, metricas) in self._familias.items()]
+        lineas = []
+        for nombre, clase, ayuda, metricas in familias:
+            lineas.append(f"# HELP {nombre} {ayuda}")
+            lineas.append(f"# TYPE {nombre} {self._tipos[clase]}")
+            for etiquetas, metrica in metricas:
+                lineas.extend(metrica.lineas(nombre, etiquetas))
+        return "\n".join(lineas) + "\n"
+
+
+# Registro compartido por todos los módulos del detector
+REGISTRO = RegistroMetricas()
+
+
+class ServidorMetricas:
+    """
+    Servidor HTTP local que publica un registro de métricas en /metrics.
+    """
+    def __init__(self, puerto=9108, host="127.0.0.1", registro=REGISTRO):
+        self.puerto = puerto
+        self.host = host
+        self.registro = registro
+        self._servidor = None
+        self._hilo = None
+
+    def iniciar(self):
+        """
+        Arranca el servidor en un hilo aparte.
+
+        Returns:
+            bool: True si se pudo abrir el puerto.
+        """
+        registro = self.registro
+
+        class Manejador(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                cuerpo = registro.exponer().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def log_message(self, *args):
+                pass # Sin una línea en consola por cada consulta
+
+        try:
+            self._servidor = ThreadingHTTPServer((self.host, self.puerto), Manejador)
+        except OSError as e:
+            print(f"No se pudo iniciar el servidor de métricas en {self.host}:{self.puerto}: {e}")
+            return False
+        self._servidor.daemon_threads = True
+        self._hilo = threading.Thread(target=self._servidor.serve_forever, name="ServidorMetricas", daemon=True)
+        self._hilo.start()
+        print(f"Métricas disponibles en http://{self.host}:{self.puerto}/metrics")
+        return True
+
+    def detener(self):
+        """
+        Cierra el servidor si está corriendo.
+        """
+        if self._servidor is not None:
+            self._servidor.shutdown()
+            self._servidor.server_close()
+            self._servidor = None
+
+
+def latenciaEtapa(etapa, registro=REGISTRO):
+    """
+    Histograma de latencia (segundos) de una etapa del detector, con la etiqueta etapa="...".
+    """
+    return registro.histograma("somnolencia_etapa_segundos", "Latencia de cada etapa del detector en segundos",
+                               {"etapa": etapa})
+
+
+def latenciaAlerta(hasta, registro=REGISTRO):
+    """
+    Histograma del tiempo (segundos) entre la captura del frame que activó una alerta y cada
+    punto de su recorrido hasta el Arduino, con la etiqueta hasta="...".
+    """
+    return registro.histograma("somnolencia_latencia_alerta_segundos",
+                               "Tiempo desde la captura del frame que activó la alerta en segundos",
+                               {"hasta": hasta})
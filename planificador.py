@@ -0,0 +1,219 @@
+import threading
+
+from analisis_facial import UMBRAL_EAR
+
+
+class PlanificadorInferencia:
+    """
+    Decide en qué frames correr la malla facial según el estado de los ojos.
+
+    Mira el mismo valor que dispara la alerta: el EAR suavizado de IndicadoresOjos contra su
+    umbral (`umbral_ear`, que se actualiza si la calibración del conductor lo cambia). Mientras
+    el EAR esté bien por encima del umbral y se mantenga estable, el intervalo entre inferencias
+    se duplica hasta `retardo_maximo`. En cuanto el EAR se acerca al umbral, cambia de golpe o
+    el temporizador de ojos cerrados está corriendo, se vuelve a inferir en cada frame.
+
+    Como nunca pasan más de `retardo_maximo` segundos sin inferir, un cierre de ojos se detecta
+    como mucho con ese retraso (más un frame) y la alerta llega a más tardar en
+    UMBRAL_TIEMPO_SOMNOLENCIA + retardo_maximo. La cota se mantiene con el filtro de calidad de
+    main.py: solo descarta frames mientras este intervalo es mayor que 0 y el temporizador no
+    corre, y su máximo sin inferir se acota a `retardo_maximo`.
+
+    En la tubería (tuberia.py) debeInferir() corre en el hilo de preproceso mientras el análisis
+    llama a registrar(), así que ambos toman un lock. Las decisiones se adelantan a los
+    resultados de los que dependen hasta los frames que esperan en las colas (3 * tamano_cola
+    más uno por hilo de inferencia). La cota sobre las marcas de captura se mantiene, porque
+    el intervalo se mide contra la última inferencia registrada, que solo puede ser más vieja;
+    pero la alerta sale del análisis con ese retraso de las colas agregado, y los frames ya
+    decididos cuando arranca el temporizador pueden omitirse igual (como mucho un intervalo).
+    Con la tubería la cota queda en UMBRAL_TIEMPO_SOMNOLENCIA + 2 * retardo_maximo más la
+    espera en las colas.
+    """
+    intervalo=0.0 # Segundos entre inferencias; 0 es inferir en cada frame
+    inferencias_omitidas=0
+
+    def __init__(self,retardo_maximo=0.25,factor_margen=1.3,variacion_estable=0.03,
+                 frames_estables=5,intervalo_inicial=0.05,umbral_ear=UMBRAL_EAR):
+        """
+        Args:
+            retardo_maximo (float): Máximo retraso agregado a la detección, en segundos.
+            factor_margen (float): El EAR debe superar umbral_ear * factor_margen para
+                                   empezar a espaciar inferencias.
+            variacion_estable (float): Cambio máximo de EAR entre inferencias para
+                                       considerar el valor estable.
+            frames_estables (int): Inferencias estables seguidas antes de espaciar.
+            intervalo_inicial (float): Primer intervalo al empezar a espaciar, en segundos.
+            umbral_ear (float): EAR por debajo del cual los ojos se consideran cerrados.
+        """
+        self.retardo_maximo=retardo_maximo
+        self.factor_margen=factor_margen
+        self.umbral_ear=umbral_ear
+        self.variacion_estable=variacion_estable
+        self.frames_estables=frames_estables
+        self.intervalo_inicial=intervalo_inicial
+        self.intervalo=0.0
+        self.inferencias_omitidas=0
+        self._ultima_inferencia=None
+        self._ultimo_ear=None
+        self._estables=0
+        self._bloqueo=threading.Lock()
+
+    def debeInferir(self,tiempo):
+        """
+        Indica si en el frame con marca de tiempo `tiempo` hay que correr la inferencia.
+        """
+        with self._bloqueo:
+            if self._ultima_inferencia is None or tiempo-self._ultima_inferencia>=self.intervalo:
+                return True
+            self.inferencias_omitidas+=1
+            return False
+
+    def cadaFrame(self):
+        """
+        True si el planificador pide inferir cada frame (intervalo 0).
+        """
+        with self._bloqueo:
+            return self.intervalo==0
+
+    def registrar(self,tiempo,ear,temporizador_activo):
+        """
+        Actualiza el intervalo con el resultado de una inferencia.
+
+        Args:
+            tiempo (float): Marca de tiempo del frame inferido.
+            ear (float or None): EAR suavizado (IndicadoresOjos.ear), o None si no hubo rostro.
+            temporizador_activo (bool): Si el temporizador de ojos cerrados está corriendo.
+        """
+        with self._bloqueo:
+            self._ultima_inferencia=tiempo
+            anterior,self._ultimo_ear=self._ultimo_ear,ear
+
+            if (ear is None or temporizador_activo or ear<=self.umbral_ear*self.factor_margen
+                    or anterior is None or abs(ear-anterior)>self.variacion_estable):
+                self.intervalo=0.0
+                self._estables=0
+                return
+
+            self._estables+=1
+            if self._estables>=self.frames_estables:
+                self.intervalo=min(self.retardo_maximo,max(self.intervalo*2,self.intervalo_inicial))
+
+
+class ControladorEscala:
+    """
+    Ajusta la escala de inferencia de la malla facial para sostener `fps_objetivo`.
+
+    Sigue con una media móvil exponencial el tiempo de procesamiento por frame (sin contar la
+    espera de la cámara). Si supera el periodo objetivo la escala baja y si sobra margen sube,
+    con pasos acotados y unos frames de espera entre cambios para que la media se asiente. El
+    costo de la inferencia crece con el área, así que el paso propuesto es la raíz del cociente
+    entre el tiempo objetivo y el medido.
+
+    Para no perder precisión en la apertura de los ojos, la escala nunca deja el rostro por
+    debajo de `ancho_rostro_minimo` píxeles en la imagen inferida ni baja de `escala_minima`.
+    """
+    escala=1.0
+
+    def __init__(self,fps_objetivo=15.0,escala_inicial=1.0,escala_minima=0.35,escala_maxima=1.0,
+                 ancho_rostro_minimo=100,paso_maximo=0.1,frames_espera=10,suavizado=0.2):
+        """
+        Args:
+            fps_objetivo (float): Frames por segundo a sostener.
+            escala_inicial (float): Escala con la que se empieza.
+            escala_minima (float): Escala más baja permitida.
+            escala_maxima (float): Escala más alta permitida.
+            ancho_rostro_minimo (float): Ancho mínimo del rostro, en píxeles de la imagen inferida.
+            paso_maximo (float): Cambio máximo de escala por ajuste.
+            frames_espera (int): Frames entre dos ajustes.
+            suavizado (float): Peso de cada frame nuevo en la media del tiempo de procesamiento.
+        """
+        self.periodo_objetivo=1.0/fps_objetivo
+        self.escala=escala_inicial
+        self.escala_minima=escala_minima
+        self.escala_maxima=escala_maxima
+        self.ancho_rostro_minimo=ancho_rostro_minimo
+        self.paso_maximo=paso_maximo
+        self.frames_espera=frames_espera
+        self.suavizado=suavizado
+        self.tiempo_medio=None
+        self._frames_desde_ajuste=0
+
+    def limiteInferior(self,ancho_rostro=None):
+        """
+        Escala mínima para el rostro actual (ancho en píxeles del frame completo).
+        """
+        if ancho_rostro is None or ancho_rostro<=0:
+            return self.escala_minima
+        return min(self.escala_maxima,max(self.escala_minima,self.ancho_rostro_minimo/ancho_rostro))
+
+    def actualizar(self,segundos_procesamiento,ancho_rostro=None):
+        """
+        Registra el tiempo de procesamiento de un frame inferido y devuelve la escala a usar.
+        """
+        if self.tiempo_medio is None:
+            self.tiempo_medio=segundos_procesamiento
+        else:
+            self.tiempo_medio+=self.suavizado*(segundos_procesamiento-self.tiempo_medio)
+        minima=self.limiteInferior(ancho_rostro)
+        self._frames_desde_ajuste+=1
+        if self._frames_desde_ajuste<self.frames_espera:
+            self.escala=max(self.escala,minima)
+            return self.escala
+
+        relacion=self.periodo_objetivo/max(self.tiempo_medio,1e-6)
+        # Zona muerta: entre 85% y 100% del periodo objetivo no se toca nada
+        if relacion<1.0 or relacion>1/0.85:
+            propuesta=self.escala*relacion**0.5
+            propuesta=min(self.escala+self.paso_maximo,max(self.escala-self.paso_maximo,propuesta))
+            nueva=min(self.escala_maxima,max(minima,propuesta))
+            if nueva!=self.escala:
+                self.escala=nueva
+                self._frames_desde_ajuste=0
+        self.escala=max(self.escala,minima)
+        return self.escala
+
+
+class ModoReposo:
+    """
+    Baja el consumo mientras no hay conductor (vehículo estacionado, asiento vacío o cámara
+    apuntando a otro lado).
+
+    Tras `espera` segundos seguidos sin rostro entra en reposo: la captura entrega un frame
+    cada `periodo` segundos (los demás ni se decodifican) y la malla facial puede correr a una
+    `escala` menor. Con el primer rostro detectado vuelve al ritmo normal, así que despertar
+    demora como mucho `periodo` más una inferencia.
+    """
+    activo=False
+
+    def __init__(self,espera=30.0,periodo=1.0,escala=None):
+        """
+        Args:
+            espera (float): Segundos sin rostro antes de entrar en reposo.
+            periodo (float): Segundos entre frames analizados durante el reposo.
+            escala (float, opcional): Escala de inferencia durante el reposo (None para no cambiarla).
+        """
+        self.espera=espera
+        self.periodo=periodo
+        self.escala=escala
+        self.activo=False
+        self._sin_rostro_desde=None
+
+    def actualizar(self,tiempo,hay_rostro):
+        """
+        Registra el resultado de una inferencia.
+
+        Returns:
+            bool: True si el modo cambió (entró o salió del reposo); el nuevo está en self.activo.
+        """
+        if hay_rostro:
+            self._sin_rostro_desde=None
+            if self.activo:
+                self.activo=False
+                return True
+            return False
+        if self._sin_rostro_desde is None:
+            self._sin_rostro_desde=tiempo
+        if not self.activo and tiempo-self._sin_rostro_desde>=self.espera:
+            self.activo=True
+            return True
+        return False
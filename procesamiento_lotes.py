@@ -0,0 +1,247 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2 # Opencv
+import numpy as np
+
+from analisis_facial import AnalisisFacial, IndicadoresOjos, TemporizadorSomnolencia, NUM_PUNTOS_MALLA, UMBRAL_EAR
+from backends_landmarks import BACKENDS, crearBackend
+from buffers_frames import asegurarBuffer
+
+# Extensiones de video que se buscan en la carpeta de entrada
+EXTENSIONES_VIDEO = (".mp4", ".avi", ".mkv", ".mov", ".m4v")
+# FPS que se asume si el archivo no lo informa
+FPS_POR_DEFECTO = 30.0
+
+# Estado de cada proceso trabajador: una sola malla facial y un solo analizador por proceso
+_mallaFacial = None
+_analizador = None
+
+
+def _inicializarTrabajador(opciones_malla=None, backend="facemesh"):
+    """
+    Crea la malla facial del proceso trabajador. Se ejecuta una vez por proceso.
+    """
+    global _mallaFacial, _analizador
+    _mallaFacial = crearBackend(backend, **(opciones_malla or {}))
+    _analizador = AnalisisFacial()
+
+
+def buscarVideos(carpeta):
+    """
+    Devuelve las rutas de los videos de una carpeta ordenadas por nombre.
+    """
+    return sorted(os.path.join(carpeta, nombre) for nombre in os.listdir(carpeta)
+                  if nombre.lower().endswith(EXTENSIONES_VIDEO))
+
+
+def dividirSegmentos(total_frames, fps, duracion_segmento, solape):
+    """
+    Divide un video en segmentos de tiempo con solape.
+
+    Cada segmento empieza a leer `solape` segundos antes del primer frame que le toca
+    reportar. Esos frames extra solo sirven para calentar el temporizador de ojos cerrados
+    (y el suavizado del EAR y el seguimiento de la malla), así que con un solape mayor o igual al umbral de tiempo
+    el estado de alerta en cada frame reportado es el mismo que en una lectura continua.
+
+    Returns:
+        list: Tuplas (inicio_lectura, inicio_reporte, fin) en número de frame, fin exclusivo.
+    """
+    frames_segmento = max(1, int(round(duracion_segmento * fps)))
+    frames_solape = int(round(solape * fps))
+    segmentos = []
+    for inicio in range(0, total_frames, frames_segmento):
+        fin = min(inicio + frames_segmento, total_frames)
+        segmentos.append((max(0, inicio - frames_solape), inicio, fin))
+    return segmentos
+
+
+def _procesarSegmento(ruta, inicio_lectura, inicio_reporte, fin, fps, umbral_tiempo, umbral_ear=UMBRAL_EAR):
+    """
+    Corre la malla facial y el análisis de ojos sobre un segmento de un video, con la misma
+    regla que el detector en vivo: EAR promedio de ambos ojos, suavizado por IndicadoresOjos,
+    contra `umbral_ear`.
+
+    La malla del trabajador se reinicia al empezar: cada segmento arranca sin el seguimiento
+    del rostro que dejó el segmento (o el video) anterior de ese proceso, así el resultado no
+    depende de cuántos procesos haya ni de qué segmentos le tocaron a cada uno.
+
+    Returns:
+        dict: Columnas por frame del segmento (desde inicio_reporte) y estadísticas del trabajador.
+    """
+    inicio_proceso = time.perf_counter()
+    _mallaFacial.reiniciar()
+    captura = cv2.VideoCapture(ruta)
+    if inicio_lectura > 0:
+        captura.set(cv2.CAP_PROP_POS_FRAMES, inicio_lectura)
+
+    total = fin - inicio_reporte
+    columnas = {
+        "frame": np.arange(inicio_reporte, fin, dtype=np.int64),
+        "tiempo": np.arange(inicio_reporte, fin, dtype=np.float64) / fps,
+        "rostro": np.zeros(total, dtype=bool),
+        "ear_izquierdo": np.full(total, np.nan, dtype=np.float32),
+        "ear_derecho": np.full(total, np.nan, dtype=np.float32),
+        "ear": np.full(total, np.nan, dtype=np.float32), # Suavizado, el que se compara con el umbral
+        "ojos_cerrados": np.zeros(total, dtype=bool),
+        "alerta": np.zeros(total, dtype=bool),
+    }
+    temporizador = TemporizadorSomnolencia(umbral_tiempo=umbral_tiempo)
+    indicadores = IndicadoresOjos(umbral_ear=umbral_ear)
+    puntosFaciales = np.empty((NUM_PUNTOS_MALLA, 2), dtype=np.float32)
+    frame = frame_rgb = None # Se decodifica y convierte siempre sobre los mismos arreglos
+    frames_leidos = 0
+
+    for numero_frame in range(inicio_lectura, fin):
+        estado, frame = captura.read(frame)
+        if not estado:
+            break
+        frames_leidos += 1
+        tiempo = numero_frame / fps
+
+        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=asegurarBuffer(frame_rgb, frame.shape))
+        puntos = _mallaFacial.procesar(frame_rgb, puntosFaciales)
+        fila = numero_frame - inicio_reporte
+        if puntos is None:
+            indicadores.actualizar(None, tiempo)
+            temporizador.reiniciar()
+            continue
+
+        izquierdo, derecho = _analizador.calcularEAR(puntosFaciales)
+        ear, ojos_cerrados, _ = indicadores.actualizar(float(izquierdo + derecho) / 2, tiempo)
+        temporizador.actualizar(ojos_cerrados, tiempo)
+
+        if fila >= 0:
+            columnas["rostro"][fila] = True
+            columnas["ear_izquierdo"][fila] = izquierdo
+            columnas["ear_derecho"][fila] = derecho
+            columnas["ear"][fila] = ear
+            columnas["ojos_cerrados"][fila] = ojos_cerrados
+            columnas["alerta"][fila] = temporizador.alerta_activa
+
+    captura.release()
+    return {
+        "ruta": ruta,
+        "inicio_reporte": inicio_reporte,
+        "columnas": columnas,
+        "frames_leidos": frames_leidos,
+        "segundos": time.perf_counter() - inicio_proceso,
+        "pid": os.getpid(),
+    }
+
+
+def intervalosAlerta(tiempo, alerta):
+    """
+    Convierte la columna de alerta por frame en intervalos [inicio, fin) en segundos.
+
+    Returns:
+        np.ndarray: Arreglo (K, 2) con el inicio y el fin de cada alerta.
+    """
+    if alerta.size == 0:
+        return np.empty((0, 2), dtype=np.float64)
+    bordes = np.diff(np.concatenate(([0], alerta.astype(np.int8), [0])))
+    inicios = np.flatnonzero(bordes == 1)
+    fines = np.flatnonzero(bordes == -1)
+    # El fin de la alerta es el tiempo del primer frame sin alerta (o el último frame del video)
+    tiempos_fin = np.append(tiempo, tiempo[-1])[fines]
+    return np.column_stack((tiempo[inicios], tiempos_fin))
+
+
+def _unirSegmentos(resultados, ruta_salida):
+    """
+    Junta las columnas de los segmentos de un video y las guarda en un archivo .npz.
+    """
+    resultados = sorted(resultados, key=lambda r: r["inicio_reporte"])
+    columnas = {nombre: np.concatenate([r["columnas"][nombre] for r in resultados])
+                for nombre in resultados[0]["columnas"]}
+    intervalos = intervalosAlerta(columnas["tiempo"], columnas["alerta"])
+    np.savez_compressed(ruta_salida, intervalos_alerta=intervalos, **columnas)
+    return intervalos
+
+
+def procesarCarpeta(carpeta, carpeta_salida, procesos=None, duracion_segmento=60.0,
+                    solape=2.0, umbral_tiempo=1.0, opciones_malla=None, umbral_ear=UMBRAL_EAR,
+                    backend="facemesh"):
+    """
+    Procesa todos los videos de una carpeta en un pool de procesos.
+
+    Args:
+        carpeta (str): Carpeta con los videos grabados.
+        carpeta_salida (str): Carpeta donde se guarda un .npz por video.
+        procesos (int, opcional): Número de procesos. Por defecto, todos los núcleos.
+        duracion_segmento (float): Segundos de video por tarea.
+        solape (float): Segundos extra que cada segmento lee antes de su inicio.
+                        Debe ser al menos el umbral de tiempo de somnolencia.
+        umbral_tiempo (float): Segundos de ojos cerrados para activar la alerta.
+        opciones_malla (dict, opcional): Argumentos del backend en cada trabajador.
+        umbral_ear (float): EAR suavizado por debajo del cual los ojos se consideran cerrados
+                            (el umbral calibrado del conductor para comparar con el detector en vivo).
+        backend (str): Backend de puntos faciales (ver backends_landmarks.crearBackend).
+
+    Returns:
+        dict: Estadísticas de rendimiento por trabajador y totales.
+    """
+    if solape < umbral_tiempo:
+        print(f"Advertencia: el solape ({solape}s) es menor que el umbral ({umbral_tiempo}s); "
+              "las alertas al inicio de cada segmento pueden diferir de una lectura continua.")
+    os.makedirs(carpeta_salida, exist_ok=True)
+    procesos = procesos or os.cpu_count() or 1
+
+    tareas = []
+    for ruta in buscarVideos(carpeta):
+        captura = cv2.VideoCapture(ruta)
+        total_frames = int(captura.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = captura.get(cv2.CAP_PROP_FPS) or FPS_POR_DEFECTO
+        captura.release()
+        if total_frames <= 0:
+            print(f"Advertencia: no se pudo leer la duración de {ruta}. Se omite.")
+            continue
+        for inicio_lectura, inicio_reporte, fin in dividirSegmentos(total_frames, fps, duracion_segmento, solape):
+            tareas.append((ruta, inicio_lectura, inicio_reporte, fin, fps, umbral_tiempo, umbral_ear))
+
+    print(f"Procesando {len(tareas)} segmentos con {procesos} procesos...")
+    inicio = time.perf_counter()
+    por_video = {}
+    por_trabajador = {}
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_inicializarTrabajador,
+                             initargs=(opciones_malla, backend)) as pool:
+        futuros = [pool.submit(_procesarSegmento, *tarea) for tarea in tareas]
+        for futuro in as_completed(futuros):
+            resultado = futuro.result()
+            por_video.setdefault(resultado["ruta"], []).append(resultado)
+            frames, segundos = por_trabajador.get(resultado["pid"], (0, 0.0))
+            por_trabajador[resultado["pid"]] = (frames + resultado["frames_leidos"], segundos + resultado["segundos"])
+    duracion = time.perf_counter() - inicio
+
+    for ruta, resultados in por_video.items():
+        nombre = os.path.splitext(os.path.basename(ruta))[0]
+        intervalos = _unirSegmentos(resultados, os.path.join(carpeta_salida, nombre + ".npz"))
+        print(f"{nombre}: {len(intervalos)} alertas")
+
+    estadisticas = {"trabajadores": {}, "frames": 0, "segundos": duracion}
+    for pid, (frames, segundos) in sorted(por_trabajador.items()):
+        fps_trabajador = frames / segundos if segundos > 0 else 0.0
+        estadisticas["trabajadores"][pid] = {"frames": frames, "segundos": segundos, "fps": fps_trabajador}
+        estadisticas["frames"] += frames
+        print(f"Proceso {pid}: {frames} frames, {fps_trabajador:.1f} FPS")
+    estadisticas["fps"] = estadisticas["frames"] / duracion if duracion > 0 else 0.0
+    print(f"Total: {estadisticas['frames']} frames en {duracion:.1f}s, {estadisticas['fps']:.1f} FPS")
+    return estadisticas
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Procesa videos grabados y detecta somnolencia por lotes.")
+    parser.add_argument("carpeta", help="Carpeta con los videos a procesar")
+    parser.add_argument("--salida", default="resultados_lotes", help="Carpeta de salida (.npz por video)")
+    parser.add_argument("--procesos", type=int, default=None, help="Procesos en paralelo (por defecto todos los núcleos)")
+    parser.add_argument("--segmento", type=float, default=60.0, help="Segundos de video por tarea")
+    parser.add_argument("--solape", type=float, default=2.0, help="Segundos de solape entre segmentos")
+    parser.add_argument("--umbral-tiempo", type=float, default=1.0, help="Segundos de ojos cerrados para alertar")
+    parser.add_argument("--umbral-ear", type=float, default=UMBRAL_EAR, help="EAR suavizado de ojos cerrados")
+    parser.add_argument("--backend", choices=BACKENDS, default="facemesh", help="Backend de puntos faciales")
+    argumentos = parser.parse_args()
+    procesarCarpeta(argumentos.carpeta, argumentos.salida, argumentos.procesos,
+                    argumentos.segmento, argumentos.solape, argumentos.umbral_tiempo,
+                    umbral_ear=argumentos.umbral_ear, backend=argumentos.backend)
@@ -0,0 +1,95 @@
+"""
+Protocolo de tramas entre Python y el sketch de Arduino.
+
+Cada trama tiene 5 bytes:
+
+    [INICIO 0xA5] [tipo] [secuencia] [dato] [crc8 de tipo, secuencia y dato]
+
+Tipos:
+    ALERTA (0x01)  Python -> Arduino. dato = nivel de alerta (NIVEL_*).
+    LATIDO (0x02)  Python -> Arduino. Mantiene vivo el enlace cuando no hay cambios.
+    ACK    (0x81)  Arduino -> Python. secuencia = la de la trama confirmada, dato = nivel actual.
+
+El byte de inicio nunca coincide con los bytes ASCII '0'/'1' del protocolo anterior, así
+que el sketch sigue aceptando ambos.
+"""
+
+INICIO = 0xA5
+LARGO_TRAMA = 5
+
+TIPO_ALERTA = 0x01
+TIPO_LATIDO = 0x02
+TIPO_ACK = 0x81
+
+# Niveles de alerta
+NIVEL_NORMAL = 0
+NIVEL_AVISO = 1 # Ojos cerrados, todavía por debajo del umbral de tiempo
+NIVEL_SOMNOLENCIA = 2
+
+
+def _tablaCrc8(polinomio=0x07):
+    tabla = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ polinomio) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        tabla.append(crc)
+    return bytes(tabla)
+
+
+_TABLA_CRC8 = _tablaCrc8()
+
+
+def crc8(datos):
+    """
+    CRC-8 (polinomio 0x07, valor inicial 0), el mismo que calcula el sketch.
+    """
+    crc = 0
+    for byte in datos:
+        crc = _TABLA_CRC8[crc ^ byte]
+    return crc
+
+
+def codificarTrama(tipo, secuencia, dato=0):
+    """
+    Arma una trama lista para escribir en el puerto serial.
+    """
+    cuerpo = bytes((tipo & 0xFF, secuencia & 0xFF, dato & 0xFF))
+    return bytes((INICIO,)) + cuerpo + bytes((crc8(cuerpo),))
+
+
+class DecodificadorTramas:
+    """
+    Extrae tramas válidas de un flujo de bytes que puede traer basura, texto o tramas cortadas.
+    """
+    def __init__(self):
+        self._buffer = bytearray()
+        self.errores_crc = 0
+
+    def agregar(self, datos):
+        """
+        Agrega bytes recibidos y devuelve las tramas completas encontradas.
+
+        Returns:
+            list: Tuplas (tipo, secuencia, dato).
+        """
+        self._buffer.extend(datos)
+        tramas = []
+        while True:
+            inicio = self._buffer.find(INICIO)
+            if inicio < 0:
+                self._buffer.clear()
+                break
+            if inicio > 0:
+                del self._buffer[:inicio] # Texto o bytes sueltos antes de la trama
+            if len(self._buffer) < LARGO_TRAMA:
+                break
+            cuerpo = bytes(self._buffer[1:4])
+            if crc8(cuerpo) == self._buffer[4]:
+                tramas.append(tuple(cuerpo))
+                del self._buffer[:LARGO_TRAMA]
+            else:
+                # Trama corrupta o falso inicio: descartar solo el byte de inicio y resincronizar
+                self.errores_crc += 1
+                del self._buffer[:1]
+        return tramas
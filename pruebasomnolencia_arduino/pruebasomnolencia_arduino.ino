@@ -3,54 +3,106 @@ const int ledPin = 13;
 // También podrías definir un pin para un zumbador, etc.
 // const int buzzerPin = 8;
 
-// Variable para almacenar el estado actual (opcional)
-bool alertaActivada = false;
+// Protocolo de tramas (ver protocolo_serial.py):
+// [0xA5] [tipo] [secuencia] [dato] [crc8 de tipo, secuencia y dato]
+const byte INICIO = 0xA5;
+const byte TIPO_ALERTA = 0x01;
+const byte TIPO_LATIDO = 0x02;
+const byte TIPO_ACK = 0x81;
+const byte NIVEL_SOMNOLENCIA = 2;
+
+// Si Python deja de enviar tramas por este tiempo, el LED parpadea para avisar que se perdió el enlace
+const unsigned long TIMEOUT_ENLACE_MS = 3000;
+
+// Variable para almacenar el estado actual
+byte nivelAlerta = 0;
+
+// Trama en construcción
+byte trama[4];
+byte posicionTrama = 0; // 0 = esperando byte de inicio
+unsigned long ultimaTrama = 0;
+bool usaTramas = false; // Se activa con la primera trama válida; con '0'/'1' no hay latidos
+
+byte crc8(const byte *datos, byte largo) {
+  // CRC-8, polinomio 0x07, igual que crc8() en protocolo_serial.py
+  byte crc = 0;
+  for (byte i = 0; i < largo; i++) {
+    crc ^= datos[i];
+    for (byte b = 0; b < 8; b++) {
+      crc = (crc & 0x80) ? (crc << 1) ^ 0x07 : (crc << 1);
+    }
+  }
+  return crc;
+}
+
+void aplicarNivel(byte nivel) {
+  nivelAlerta = nivel;
+  digitalWrite(ledPin, nivel >= NIVEL_SOMNOLENCIA ? HIGH : LOW); // Encender o apagar LED
+  // digitalWrite(buzzerPin, nivel >= NIVEL_SOMNOLENCIA ? HIGH : LOW);
+}
+
+void enviarAck(byte secuencia) {
+  byte cuerpo[3] = {TIPO_ACK, secuencia, nivelAlerta};
+  Serial.write(INICIO);
+  Serial.write(cuerpo, 3);
+  Serial.write(crc8(cuerpo, 3));
+}
+
+void procesarTrama() {
+  // trama = tipo, secuencia, dato, crc
+  if (crc8(trama, 3) != trama[3]) {
+    return; // Trama corrupta: sin ACK, Python la reenvía
+  }
+  usaTramas = true;
+  ultimaTrama = millis();
+  if (trama[0] == TIPO_ALERTA) {
+    aplicarNivel(trama[2]);
+  }
+  enviarAck(trama[1]);
+}
 
 void setup() {
-  // Iniciar comunicación serial a 9600 baudios (debe coincidir con Python)
-  Serial.begin(9600);
-  
+  // Iniciar comunicación serial a 115200 baudios (debe coincidir con Python)
+  Serial.begin(115200);
+
   // Configurar el pin del LED como salida
   pinMode(ledPin, OUTPUT);
   // pinMode(buzzerPin, OUTPUT); // Si usas un zumbador
 
   // Asegurarse de que la alerta empiece desactivada
-  digitalWrite(ledPin, LOW);
-  // digitalWrite(buzzerPin, LOW);
+  aplicarNivel(0);
 
-  Serial.println("Arduino listo. Esperando datos..."); // Mensaje de inicio (opcional)
+  Serial.println("Arduino listo. Esperando datos..."); // Mensaje de inicio
 }
 
 void loop() {
-  // Verificar si hay datos disponibles para leer en el puerto serial
-  if (Serial.available() > 0) {
-    // Leer el byte entrante
-    char incomingByte = Serial.read();
-
-    // Procesar el comando recibido
-    if (incomingByte == '1') {
-      // Comando para activar la alerta (somnolencia detectada)
-      if (!alertaActivada) { // Actuar solo si no estaba ya activada (evita parpadeo innecesario)
-         digitalWrite(ledPin, HIGH); // Encender LED
-         // digitalWrite(buzzerPin, HIGH); // Activar zumbador
-         alertaActivada = true;
-         Serial.println("Alerta ACTIVADA (Recibido '1')"); // Mensaje de depuración
+  // Leer todos los bytes disponibles en el puerto serial
+  while (Serial.available() > 0) {
+    byte entrante = Serial.read();
+
+    if (posicionTrama > 0) {
+      trama[posicionTrama - 1] = entrante;
+      posicionTrama++;
+      if (posicionTrama == 5) {
+        procesarTrama();
+        posicionTrama = 0;
       }
-    } else if (incomingByte == '0') {
-      // Comando para desactivar la alerta (conductor alerta o sin detección)
-       if (alertaActivada) { // Actuar solo si estaba activada
-          digitalWrite(ledPin, LOW);  // Apagar LED
-          // digitalWrite(buzzerPin, LOW); // Desactivar zumbador
-          alertaActivada = false;
-          Serial.println("Alerta DESACTIVADA (Recibido '0')"); // Mensaje de depuración
-       }
-    } else {
-      // Byte desconocido recibido (opcional)
-      Serial.print("Byte desconocido recibido: ");
-      Serial.println(incomingByte);
+    } else if (entrante == INICIO) {
+      posicionTrama = 1;
+    } else if (entrante == '1') {
+      // Protocolo anterior: activar la alerta (somnolencia detectada)
+      aplicarNivel(NIVEL_SOMNOLENCIA);
+    } else if (entrante == '0') {
+      // Protocolo anterior: desactivar la alerta
+      aplicarNivel(0);
     }
+    // Otros bytes se ignoran
+  }
+
+  // Sin latidos de Python: parpadear el LED hasta que vuelva a llegar una trama
+  if (usaTramas && millis() - ultimaTrama > TIMEOUT_ENLACE_MS) {
+    digitalWrite(ledPin, (millis() / 250) % 2 ? HIGH : LOW);
+  } else if (usaTramas) {
+    digitalWrite(ledPin, nivelAlerta >= NIVEL_SOMNOLENCIA ? HIGH : LOW);
   }
-  
-  // No es necesario poner delays aquí, el bucle se ejecuta rápidamente
-  // esperando nuevos datos seriales.
 }
@@ -0,0 +1,246 @@
+import os
+import time
+
+import numpy as np
+
+# Un registro por frame analizado. Se guarda tal cual en el archivo de la sesión.
+TIPO_REGISTRO = np.dtype([
+    ("tiempo", "<f8"), # Marca de tiempo de captura (segundos)
+    ("ear", "<f4"), # EAR suavizado, NaN si no hubo rostro
+    ("perclos", "<f4"),
+    ("rostro", "u1"),
+    ("ojos_cerrados", "u1"),
+    ("alerta", "u1"),
+])
+
+
+class BufferCircular:
+    """
+    Últimos `capacidad` registros en un arreglo preasignado. Agregar no reserva memoria y
+    sobrescribe el registro más viejo cuando el buffer está lleno.
+    """
+    def __init__(self, capacidad, tipo=TIPO_REGISTRO):
+        self._datos = np.zeros(capacidad, dtype=tipo)
+        self._posicion = 0
+        self.cantidad = 0
+
+    def agregar(self, registro):
+        self._datos[self._posicion] = registro
+        self._posicion = (self._posicion + 1) % len(self._datos)
+        self.cantidad = min(self.cantidad + 1, len(self._datos))
+
+    def datos(self):
+        """
+        Devuelve una copia de los registros en orden cronológico.
+        """
+        if self.cantidad < len(self._datos):
+            return self._datos[:self.cantidad].copy()
+        return np.concatenate((self._datos[self._posicion:], self._datos[:self._posicion]))
+
+
+class ArchivoMapeado:
+    """
+    Archivo binario de solo agregado con registros de tipo fijo, escrito a través de un mapa
+    en memoria por bloques de `registros_por_bloque`.
+
+    Escribir un registro es asignarlo en el mapa; el sistema operativo lo baja a disco. Al
+    cerrar se recorta el espacio reservado que no se usó. Si el programa se corta, leerArchivo()
+    ignora los registros vacíos del final.
+
+    Si se da una `cabecera` (bytes), se escribe al comienzo del archivo y los registros van
+    después; leerArchivo() la saltea con `inicio=len(cabecera)`.
+    """
+    def __init__(self, ruta, tipo, registros_por_bloque=65536, cabecera=b""):
+        self.ruta = ruta
+        self.tipo = np.dtype(tipo)
+        self.registros_por_bloque = registros_por_bloque
+        self.inicio = len(cabecera)
+        self.escritos = 0
+        self._mapa = None
+        self._posicion = 0
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        with open(ruta, "wb") as archivo:
+            archivo.write(cabecera)
+        self._mapearBloque()
+
+    def _mapearBloque(self):
+        if self._mapa is not None:
+            self._mapa.flush()
+            del self._mapa
+        # memmap agranda el archivo hasta cubrir el bloque pedido
+        self._mapa = np.memmap(self.ruta, dtype=self.tipo, mode="r+",
+                               offset=self.inicio + self.escritos * self.tipo.itemsize,
+                               shape=(self.registros_por_bloque,))
+        self._posicion = 0
+
+    @property
+    def abierto(self):
+        return self._mapa is not None
+
+    def siguiente(self):
+        """
+        Reserva el próximo registro y lo devuelve para llenarlo en el lugar (sin copias intermedias).
+        """
+        if self._posicion == self.registros_por_bloque:
+            self._mapearBloque()
+        registro = self._mapa[self._posicion]
+        self._posicion += 1
+        self.escritos += 1
+        return registro
+
+    def agregar(self, registro):
+        if self._posicion == self.registros_por_bloque:
+            self._mapearBloque()
+        self._mapa[self._posicion] = registro
+        self._posicion += 1
+        self.escritos += 1
+
+    def cerrar(self):
+        """
+        Baja a disco lo pendiente y recorta el archivo a los registros escritos.
+        """
+        if self._mapa is None:
+            return
+        self._mapa.flush()
+        del self._mapa
+        self._mapa = None
+        os.truncate(self.ruta, self.inicio + self.escritos * self.tipo.itemsize)
+
+
+def leerArchivo(ruta, tipo, inicio=0):
+    """
+    Abre un archivo escrito con ArchivoMapeado sin cargarlo en memoria. El primer campo de
+    `tipo` debe ser una marca de tiempo distinta de cero.
+
+    Args:
+        inicio (int): Bytes de cabecera antes del primer registro.
+
+    Returns:
+        np.ndarray: Arreglo de solo lectura con los registros escritos.
+    """
+    tipo = np.dtype(tipo)
+    if os.path.getsize(ruta) - inicio < tipo.itemsize:
+        return np.zeros(0, dtype=tipo)
+    datos = np.memmap(ruta, dtype=tipo, mode="r", offset=inicio)
+    # Una sesión interrumpida deja registros reservados sin escribir (tiempo 0) al final
+    escritos = np.flatnonzero(datos[tipo.names[0]] != 0)
+    return datos[:escritos[-1] + 1] if len(escritos) else datos[:0]
+
+
+class RegistroSesion:
+    """
+    Historial de la sesión: los últimos frames en un buffer circular en memoria y, si se da
+    una ruta, todos los frames en un ArchivoMapeado.
+    """
+    def __init__(self, ruta=None, capacidad=18000, registros_por_bloque=65536):
+        """
+        Args:
+            ruta (str, opcional): Archivo donde guardar el historial completo.
+            capacidad (int): Frames que se mantienen en memoria (18000 = 10 min a 30 FPS).
+            registros_por_bloque (int): Registros que se reservan en el archivo cada vez que se llena.
+        """
+        self.memoria = BufferCircular(capacidad)
+        self.ruta = ruta
+        self._archivo = None
+        if ruta is not None:
+            self._archivo = ArchivoMapeado(ruta, TIPO_REGISTRO, registros_por_bloque)
+
+    def agregar(self, tiempo, ear, perclos, rostro, ojos_cerrados, alerta):
+        """
+        Registra un frame.
+        """
+        registro = (tiempo, np.nan if ear is None else ear, perclos, rostro, ojos_cerrados, alerta)
+        self.memoria.agregar(registro)
+        if self._archivo is not None:
+            self._archivo.agregar(registro)
+
+    def cerrar(self):
+        if self._archivo is not None:
+            self._archivo.cerrar()
+
+    def datos(self):
+        """
+        Historial completo (desde el archivo) o, sin archivo, los últimos frames en memoria.
+        """
+        if self._archivo is not None and not self._archivo.abierto:
+            return leerSesion(self.ruta)
+        return self.memoria.datos()
+
+
+def rutaSesion(directorio):
+    """
+    Nombre de archivo para una sesión nueva, con la fecha y hora de inicio.
+    """
+    return os.path.join(directorio, time.strftime("sesion_%Y%m%d_%H%M%S.bin"))
+
+
+def leerSesion(ruta):
+    """
+    Abre el archivo de una sesión sin cargarlo en memoria.
+
+    Returns:
+        np.ndarray: Arreglo de solo lectura con TIPO_REGISTRO.
+    """
+    return leerArchivo(ruta, TIPO_REGISTRO)
+
+
+def reducir(datos, max_puntos=2000):
+    """
+    Reduce la sesión a lo sumo a `max_puntos` tramos para graficarla.
+
+    Returns:
+        dict: Por tramo, tiempo inicial, EAR medio, PERCLOS medio y alerta (1 si hubo alguna
+              alerta en el tramo, así no desaparecen las alertas cortas).
+    """
+    inicios = np.linspace(0, len(datos), min(max_puntos, len(datos)), endpoint=False).astype(np.intp)
+    largos = np.diff(np.append(inicios, len(datos)))
+    ear = datos["ear"].astype(np.float64)
+    con_ear = ~np.isnan(ear)
+    suma_ear = np.add.reduceat(np.where(con_ear, ear, 0.0), inicios)
+    cuenta_ear = np.add.reduceat(con_ear.astype(np.int64), inicios)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ear_medio = suma_ear / cuenta_ear
+    return {
+        "tiempo": datos["tiempo"][inicios],
+        "ear": ear_medio,
+        "perclos": np.add.reduceat(datos["perclos"].astype(np.float64), inicios) / largos,
+        "alerta": np.maximum.reduceat(datos["alerta"], inicios),
+    }
+
+
+def graficarSesion(datos, ruta_imagen, max_puntos=2000, umbral_ear=None):
+    """
+    Guarda un gráfico de la sesión (EAR, PERCLOS y alertas) en un archivo de imagen,
+    sin abrir ventanas.
+
+    Returns:
+        bool: True si se generó la imagen.
+    """
+    if len(datos) == 0:
+        return False
+    import matplotlib
+    matplotlib.use("Agg") # Sin interfaz gráfica
+    import matplotlib.pyplot as plt
+
+    tramos = reducir(datos, max_puntos)
+    minutos = (tramos["tiempo"] - tramos["tiempo"][0]) / 60
+    figura, (eje_ear, eje_perclos) = plt.subplots(2, 1, figsize=(12, 6), sharex=True)
+    eje_ear.plot(minutos, tramos["ear"], linewidth=0.8, label="EAR")
+    if umbral_ear is not None:
+        eje_ear.axhline(umbral_ear, color="gray", linestyle="--", linewidth=0.8, label="Umbral")
+    eje_ear.fill_between(minutos, 0, 1, where=tramos["alerta"] > 0, color="red", alpha=0.3,
+                         transform=eje_ear.get_xaxis_transform(), label="Alerta activa")
+    eje_ear.set_ylabel("EAR")
+    eje_ear.legend(loc="upper right")
+    eje_ear.grid(True)
+    eje_perclos.plot(minutos, tramos["perclos"] * 100, color="tab:orange", linewidth=0.8)
+    eje_perclos.set_ylabel("PERCLOS (%)")
+    eje_perclos.set_xlabel("Tiempo (minutos)")
+    eje_perclos.grid(True)
+    figura.suptitle("Análisis de Alerta de Somnolencia")
+    figura.tight_layout()
+    figura.savefig(ruta_imagen, dpi=100)
+    plt.close(figura)
+    return True
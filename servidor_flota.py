@@ -0,0 +1,270 @@
+import argparse
+import json
+import os
+import signal
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import cv2 # Opencv
+import numpy as np
+
+from analisis_facial import AnalisisFacial, IndicadoresOjos, TemporizadorSomnolencia, UMBRAL_EAR
+from buffers_frames import RanuraCompartida, abrirRanura
+from calibracion import cargarCalibraciones
+from captura import CapturaResiliente
+from conexion_arduino import DespachadorAlertas
+from metricas import REGISTRO, ServidorMetricas
+
+# Malla facial del proceso trabajador (una por proceso, compartida por todos los streams)
+_mallaFacial = None
+
+
+def _inicializarTrabajador(opciones_malla):
+    """
+    Crea la malla facial del proceso trabajador. Se ejecuta una vez por proceso.
+    """
+    global _mallaFacial
+    from malla_facial import MallaFacial
+    _mallaFacial = MallaFacial(**opciones_malla)
+
+
+def _inferir(ranura, roi):
+    """
+    Corre la malla facial sobre el frame RGB de un stream.
+
+    El frame no viaja con la tarea: el proceso principal lo escribe en la memoria compartida
+    del stream y manda solo su descriptor. El recorte del rostro (roi) es estado de cada
+    stream: llega con la tarea y vuelve con el resultado, así cualquier trabajador puede
+    atender cualquier stream.
+
+    Returns:
+        tuple: (puntos o None, roi actualizado, segundos de inferencia)
+    """
+    inicio = time.perf_counter()
+    _mallaFacial.roi = roi
+    frame_rgb = abrirRanura(ranura)
+    puntos = _mallaFacial.procesar(frame_rgb)
+    return puntos, _mallaFacial.roi, time.perf_counter() - inicio
+
+
+class SalidaConsola:
+    """
+    Salida de alertas que solo las escribe en la consola (para streams sin Arduino).
+    """
+    conectado = True
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+
+    def conectar(self):
+        return True
+
+    def enviar_senal(self, senal, tiempo_captura=None):
+        print(f"[{self.nombre}] Señal de alerta: {senal}")
+
+    def desconectar(self):
+        pass
+
+
+class EstadoStream:
+    """
+    Estado de somnolencia, salida de alertas y estadísticas de un stream de la flota.
+    """
+    def __init__(self, nombre, fuente, salida, umbral_tiempo, umbral_ear=UMBRAL_EAR):
+        self.nombre = nombre
+        self.captura = CapturaResiliente(fuente_video=fuente, nombre=nombre)
+        self.salida = salida
+        self.temporizador = TemporizadorSomnolencia(umbral_tiempo=umbral_tiempo)
+        self.indicadores = IndicadoresOjos(umbral_ear=umbral_ear)
+        self.roi = None
+        self.ranura = None # Memoria compartida donde se deja el frame RGB para el trabajador
+        self.en_proceso = False
+        self.ultimo_despacho = 0.0
+        self.tiempo_pendiente = None
+        self.frames = 0
+        self.inicio = time.monotonic()
+        etiquetas = {"stream": nombre}
+        self.metrica_frames = REGISTRO.contador("somnolencia_flota_frames_total",
+                                                "Frames analizados por stream", etiquetas)
+        self.metrica_alertas = REGISTRO.contador("somnolencia_flota_alertas_total",
+                                                 "Alertas activadas por stream", etiquetas)
+        self.metrica_latencia = REGISTRO.histograma("somnolencia_flota_latencia_segundos",
+                                                    "Tiempo desde la captura hasta el resultado por stream",
+                                                    etiquetas)
+
+    def prepararFrame(self, frame):
+        """
+        Convierte el frame a RGB directo en la memoria compartida del stream (que se crea de
+        nuevo si cambia la resolución). Solo se llama sin un frame del stream en proceso.
+        """
+        if self.ranura is None or self.ranura.arreglo.shape != frame.shape:
+            self.liberarRanura()
+            self.ranura = RanuraCompartida(frame.shape)
+        if self.captura.rgb:
+            np.copyto(self.ranura.arreglo, frame) # La fuente (pantalla) ya entrega RGB
+        else:
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self.ranura.arreglo)
+
+    def liberarRanura(self):
+        if self.ranura is not None:
+            self.ranura.cerrar()
+            self.ranura = None
+
+    def fps(self):
+        transcurrido = time.monotonic() - self.inicio
+        return self.frames / transcurrido if transcurrido > 0 else 0.0
+
+
+def _crearSalida(nombre, configuracion):
+    salida = configuracion.get("alerta", {"tipo": "consola"})
+    if salida.get("tipo") == "serial":
+        return DespachadorAlertas(puerto=salida["puerto"], baud_rate=salida.get("baud_rate", 115200),
+                                  protocolo=salida.get("protocolo", "tramas"))
+    return SalidaConsola(nombre)
+
+
+class ServidorFlota:
+    """
+    Analiza varios streams de cámaras en un solo equipo con un pool de procesos.
+
+    Cada stream tiene su captura en hilo (siempre el frame más reciente), su EAR suavizado y
+    su temporizador de ojos cerrados (la misma regla que main.py) y su salida de alertas. El
+    umbral de EAR de un stream es "umbral_ear" en su configuración o, con "conductor", el que
+    ese conductor tiene calibrado en calibracion_conductores.json. El planificador mantiene como mucho un frame en
+    proceso por stream y, cuando hay un trabajador libre, atiende al stream que lleva más tiempo
+    sin ser despachado. Si la CPU no alcanza, todos los streams bajan su tasa por igual y se
+    descartan frames viejos en lugar de acumular atraso.
+
+    El frame de cada stream pasa a los trabajadores por memoria compartida (ya convertido a
+    RGB) en lugar de serializarse con la tarea.
+    """
+    def __init__(self, configuracion, procesos=None, opciones_malla=None, umbral_tiempo=1.0,
+                 intervalo_reporte=10.0):
+        self.procesos = procesos or configuracion.get("procesos") or os.cpu_count() or 1
+        # static_image_mode porque un mismo trabajador procesa frames de distintos streams;
+        # el seguimiento por recorte mantiene barata la inferencia.
+        self.opciones_malla = {"static_image_mode": True, "seguimiento_roi": True}
+        self.opciones_malla.update(opciones_malla or {})
+        self.intervalo_reporte = intervalo_reporte
+        self.analizador = AnalisisFacial()
+        self.detener = threading.Event()
+        calibraciones = cargarCalibraciones()
+        self.streams = []
+        for stream in configuracion["streams"]:
+            umbral_ear = calibraciones.get(stream.get("conductor"), {}).get("umbral_ear", UMBRAL_EAR)
+            self.streams.append(EstadoStream(stream["nombre"], stream["fuente"], _crearSalida(stream["nombre"], stream),
+                                             stream.get("umbral_tiempo", umbral_tiempo),
+                                             stream.get("umbral_ear", umbral_ear)))
+
+    def _siguienteStream(self):
+        """
+        Elige el stream con un frame nuevo que lleva más tiempo sin despacharse.
+        """
+        candidatos = [stream for stream in self.streams if not stream.en_proceso]
+        for stream in sorted(candidatos, key=lambda s: s.ultimo_despacho):
+            estado, frame, tiempo_captura = stream.captura.leer(timeout=0)
+            if estado:
+                stream.prepararFrame(frame)
+                stream.tiempo_pendiente = tiempo_captura
+                return stream
+        return None
+
+    def _procesarResultado(self, stream, puntos, roi, tiempo_captura):
+        stream.roi = roi
+        stream.frames += 1
+        stream.metrica_frames.incrementar()
+        stream.metrica_latencia.observar(time.perf_counter() - tiempo_captura)
+        if puntos is None:
+            stream.indicadores.actualizar(None, tiempo_captura)
+            cambio = stream.temporizador.reiniciar()
+        else:
+            izquierdo, derecho = self.analizador.calcularEAR(puntos)
+            _, cerrado, _ = stream.indicadores.actualizar(float(izquierdo + derecho) / 2, tiempo_captura)
+            cambio, _ = stream.temporizador.actualizar(cerrado, tiempo_captura)
+        if cambio == '1':
+            stream.metrica_alertas.incrementar()
+            print(f"[{stream.nombre}] ¡ALERTA! Ojos cerrados por más de {stream.temporizador.umbral_tiempo} seg.")
+        if cambio is not None:
+            stream.salida.enviar_senal(cambio, tiempo_captura if cambio == '1' else None)
+
+    def _reportar(self):
+        for stream in self.streams:
+            print(f"[{stream.nombre}] {stream.fps():.1f} FPS, {stream.frames} frames, "
+                  f"{stream.captura.frames_descartados} descartados")
+
+    def ejecutar(self):
+        """
+        Abre los streams y las salidas y procesa hasta que se active `detener`.
+        """
+        for stream in self.streams:
+            stream.captura.getCaptura()
+            stream.salida.conectar()
+
+        en_vuelo = {}
+        proximo_reporte = time.monotonic() + self.intervalo_reporte
+        with ProcessPoolExecutor(max_workers=self.procesos, initializer=_inicializarTrabajador,
+                                 initargs=(self.opciones_malla,)) as pool:
+            while not self.detener.is_set():
+                # Llenar los trabajadores libres, un frame por stream como máximo
+                while len(en_vuelo) < self.procesos:
+                    stream = self._siguienteStream()
+                    if stream is None:
+                        break
+                    stream.en_proceso = True
+                    stream.ultimo_despacho = time.monotonic()
+                    futuro = pool.submit(_inferir, stream.ranura.descriptor, stream.roi)
+                    en_vuelo[futuro] = (stream, stream.tiempo_pendiente)
+
+                if not en_vuelo:
+                    time.sleep(0.005) # Ningún stream tiene frames nuevos
+                    continue
+
+                listos, _ = wait(en_vuelo, timeout=0.05, return_when=FIRST_COMPLETED)
+                for futuro in listos:
+                    stream, tiempo_captura = en_vuelo.pop(futuro)
+                    stream.en_proceso = False
+                    try:
+                        puntos, roi, _ = futuro.result()
+                    except Exception as e:
+                        print(f"[{stream.nombre}] Error en la inferencia: {e}")
+                        continue
+                    self._procesarResultado(stream, puntos, roi, tiempo_captura)
+
+                if time.monotonic() >= proximo_reporte:
+                    self._reportar()
+                    proximo_reporte += self.intervalo_reporte
+
+        self._reportar()
+        for stream in self.streams:
+            stream.captura.liberar()
+            stream.liberarRanura()
+            if stream.salida.conectado:
+                stream.salida.enviar_senal('0')
+            stream.salida.desconectar()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analiza varias cámaras en un solo equipo.")
+    parser.add_argument("configuracion", help="Archivo JSON con los streams y sus salidas de alerta")
+    parser.add_argument("--procesos", type=int, default=None, help="Procesos de inferencia (por defecto todos los núcleos)")
+    parser.add_argument("--puerto-metricas", type=int, default=9108, help="Puerto local de métricas (0 para desactivar)")
+    argumentos = parser.parse_args()
+
+    with open(argumentos.configuracion, encoding="utf-8") as archivo:
+        configuracion = json.load(archivo)
+
+    servidor = ServidorFlota(configuracion, procesos=argumentos.procesos)
+    signal.signal(signal.SIGINT, lambda *_: servidor.detener.set())
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, lambda *_: servidor.detener.set())
+
+    servidorMetricas = None
+    if argumentos.puerto_metricas:
+        servidorMetricas = ServidorMetricas(puerto=argumentos.puerto_metricas)
+        servidorMetricas.iniciar()
+    try:
+        servidor.ejecutar()
+    finally:
+        if servidorMetricas is not None:
+            servidorMetricas.detener()
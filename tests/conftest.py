@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from backends_landmarks import MallaSintetica
+from grabacion_landmarks import GrabadorLandmarks
+
+FPS = 30.0
+DURACION = 30.0
+# Cierres largos, uno corto y cortes de rostro (uno en medio de un cierre)
+CIERRES = ((5.0, 7.5), (15.0, 15.8), (20.0, 23.0))
+SIN_ROSTRO = ((21.0, 21.5), (26.0, 27.0))
+
+
+@pytest.fixture(scope="session")
+def grabacion_sintetica(tmp_path_factory):
+    """
+    Archivo .lmk grabado con MallaSintetica a FPS durante DURACION segundos.
+    """
+    ruta = str(tmp_path_factory.mktemp("grabaciones") / "sintetica.lmk")
+    malla = MallaSintetica(fps=FPS, cierres=CIERRES, sin_rostro=SIN_ROSTRO)
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    grabador = GrabadorLandmarks(ruta)
+    for indice in range(int(DURACION * FPS)):
+        puntos, _ = malla.detectar(frame)
+        grabador.agregar(indice / FPS, puntos)
+    grabador.cerrar()
+    return ruta
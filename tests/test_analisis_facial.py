@@ -0,0 +1,29 @@
+import pytest
+
+from analisis_facial import IndicadoresOjos
+
+
+def test_repetir_cuenta_perclos_sin_tocar_el_suavizado():
+    indicadores = IndicadoresOjos(umbral_ear=0.2, frames_suavizado=3)
+    indicadores.actualizar(0.3, 0.0)
+    indicadores.actualizar(0.3, 0.1)
+    indicadores.actualizar(0.05, 0.2) # Suavizado: (0.3 + 0.3 + 0.05) / 3, todavía abierto
+    for tiempo in (0.3, 0.4, 0.5):
+        indicadores.repetir(tiempo)
+    assert indicadores.ear == pytest.approx(0.65 / 3)
+    assert indicadores.perclos == 0.0
+    # El siguiente frame medido se suaviza con los tres anteriores medidos, no con repetidos
+    ear, cerrados, _ = indicadores.actualizar(0.05, 0.6)
+    assert ear == pytest.approx(0.4 / 3)
+    assert cerrados
+    indicadores.repetir(0.7)
+    assert indicadores.perclos == pytest.approx(2 / 8)
+
+
+def test_repetir_sin_rostro_solo_avanza_la_ventana():
+    indicadores = IndicadoresOjos(umbral_ear=0.2, frames_suavizado=1)
+    indicadores.actualizar(0.05, 0.0)
+    indicadores.actualizar(None, 0.1)
+    indicadores.repetir(0.2)
+    assert indicadores.perclos == 1.0
+    assert indicadores.ojos_cerrados is None
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from analisis_facial import AnalisisFacial
+from backends_landmarks import BackendLandmarks, MallaSintetica, crearBackend
+
+
+def test_backend_sin_detectar_falla_al_crearlo():
+    class BackendIncompleto(BackendLandmarks):
+        nombre = "incompleto"
+
+    with pytest.raises(TypeError):
+        BackendIncompleto()
+
+
+def test_malla_sintetica_respeta_el_ear_del_guion():
+    malla = crearBackend("sintetico", fps=10.0, cierres=((1.0, 2.0),), periodo_parpadeo=0)
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    analizador = AnalisisFacial()
+    ears = []
+    for _ in range(30):
+        puntos, confianza = malla.detectar(frame)
+        assert confianza == 1.0
+        ears.append(float(np.mean(analizador.calcularEAR(puntos))))
+    assert isinstance(malla, MallaSintetica)
+    assert ears[:10] == pytest.approx([0.3] * 10, abs=1e-5)
+    assert ears[10:20] == pytest.approx([0.06] * 10, abs=1e-5)
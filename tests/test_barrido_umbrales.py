@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from barrido_umbrales import barrerUmbrales, metricasGrabacion
+from grabacion_landmarks import reproducir, resumirReproduccion
+
+# Intervalos etiquetados como somnolencia; el cierre de 15 s queda sin etiquetar
+ETIQUETAS = [(5.0, 7.5), (20.0, 23.0)]
+UMBRALES_EAR = (0.15, 0.2, 0.25)
+UMBRALES_TIEMPO = (0.5, 1.0, 2.0)
+TOLERANCIA = 2.0
+
+
+def _metricasReproduccion(ruta, umbral_ear, umbral_tiempo):
+    """
+    Detectados, falsas alarmas y latencias calculados a partir de las alertas de reproducir().
+    """
+    inicios = [inicio for inicio, _ in resumirReproduccion(reproducir(ruta, umbral_ear=umbral_ear,
+                                                                      umbral_tiempo=umbral_tiempo))]
+    latencias, falsas = [], 0
+    for etiqueta_inicio, etiqueta_fin in ETIQUETAS:
+        dentro = [inicio for inicio in inicios if etiqueta_inicio <= inicio <= etiqueta_fin + TOLERANCIA]
+        if dentro:
+            latencias.append(dentro[0] - etiqueta_inicio)
+    for inicio in inicios:
+        if not any(a <= inicio <= b + TOLERANCIA for a, b in ETIQUETAS):
+            falsas += 1
+    return len(latencias), falsas, latencias
+
+
+def test_barrido_coincide_con_reproduccion(grabacion_sintetica):
+    tiempo, ear = metricasGrabacion(grabacion_sintetica)
+    resultado = barrerUmbrales(tiempo, ear, ETIQUETAS, UMBRALES_EAR, UMBRALES_TIEMPO, tolerancia=TOLERANCIA)
+    assert resultado["total_intervalos"] == len(ETIQUETAS)
+
+    for fila, umbral_ear in enumerate(UMBRALES_EAR):
+        for columna, umbral_tiempo in enumerate(UMBRALES_TIEMPO):
+            detectadas, falsas, latencias = _metricasReproduccion(grabacion_sintetica, umbral_ear, umbral_tiempo)
+            combinacion = f"umbral_ear={umbral_ear}, umbral_tiempo={umbral_tiempo}"
+            assert resultado["detectadas"][fila, columna] == detectadas, combinacion
+            assert resultado["falsas_por_hora"][fila, columna] * resultado["horas"] == pytest.approx(falsas), combinacion
+            if latencias:
+                assert resultado["latencia_media"][fila, columna] == pytest.approx(np.mean(latencias)), combinacion
+                assert resultado["latencia_maxima"][fila, columna] == pytest.approx(max(latencias)), combinacion
+            else:
+                assert np.isnan(resultado["latencia_media"][fila, columna]), combinacion
@@ -0,0 +1,38 @@
+import cv2
+import numpy as np
+import pytest
+
+from backends_landmarks import MallaSintetica
+from calibracion import CalibracionConductor
+from detector_ojos import DetectorOjosOpenCV, medirApertura
+
+
+def ojoAbierto():
+    """Recorte en grises de un ojo bien abierto: iris oscuro sobre fondo claro."""
+    ojo = np.full((60, 60), 200, dtype=np.uint8)
+    cv2.ellipse(ojo, (30, 30), (14, 18), 0, 0, 360, 30, -1)
+    return ojo
+
+
+def calibrar(rango, ear, tmp_path, fps=30.0, duracion=10.0):
+    calibracion = CalibracionConductor("conductor", ruta=str(tmp_path / "calibracion.json"),
+                                       duracion=duracion, rango_ear_base=rango)
+    for i in range(int(duracion * fps) + 1):
+        calibracion.agregar(ear, i / fps)
+    return calibracion
+
+
+def test_apertura_del_detector_opencv_supera_el_rango_de_facemesh():
+    ear = medirApertura(ojoAbierto())
+    assert ear > MallaSintetica.rango_ear_abierto[1]
+    assert DetectorOjosOpenCV.rango_ear_abierto[0] <= ear <= DetectorOjosOpenCV.rango_ear_abierto[1]
+
+
+def test_calibracion_usa_el_rango_del_backend(tmp_path):
+    ear = medirApertura(ojoAbierto())
+    assert not calibrar(MallaSintetica.rango_ear_abierto, ear, tmp_path).completa
+
+    calibracion = calibrar(DetectorOjosOpenCV.rango_ear_abierto, ear, tmp_path)
+    assert calibracion.completa
+    assert calibracion.ear_base == pytest.approx(ear, abs=1e-6)
+
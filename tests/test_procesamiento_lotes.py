@@ -0,0 +1,45 @@
+import cv2
+import numpy as np
+import pytest
+
+from procesamiento_lotes import procesarCarpeta
+
+FPS_VIDEO = 10.0
+
+
+def escribirVideo(ruta, segundos, fps=FPS_VIDEO):
+    escritor = cv2.VideoWriter(str(ruta), cv2.VideoWriter_fourcc(*"MJPG"), fps, (160, 120))
+    frame = np.full((120, 160, 3), 128, dtype=np.uint8)
+    for _ in range(int(segundos * fps)):
+        escritor.write(frame)
+    escritor.release()
+
+
+@pytest.fixture
+def carpeta_videos(tmp_path):
+    carpeta = tmp_path / "videos"
+    carpeta.mkdir()
+    escribirVideo(carpeta / "a.avi", 8.0)
+    escribirVideo(carpeta / "b.avi", 5.0)
+    return carpeta
+
+
+def procesar(carpeta, salida, procesos):
+    # El guion del backend sintético cuenta frames desde que se (re)inicia: sin reiniciarlo en
+    # cada segmento, lo que ve cada segmento depende de qué procesó antes ese trabajador
+    procesarCarpeta(str(carpeta), str(salida), procesos=procesos, duracion_segmento=2.0, solape=1.0,
+                    umbral_tiempo=1.0, backend="sintetico",
+                    opciones_malla=dict(fps=FPS_VIDEO, cierres=((0.5, 2.5),), periodo_parpadeo=0))
+    return {ruta.name: dict(np.load(ruta)) for ruta in sorted(salida.glob("*.npz"))}
+
+
+def test_mismo_resultado_con_uno_y_varios_procesos(carpeta_videos, tmp_path):
+    uno = procesar(carpeta_videos, tmp_path / "uno", 1)
+    varios = procesar(carpeta_videos, tmp_path / "varios", 3)
+
+    assert sorted(uno) == sorted(varios) == ["a.npz", "b.npz"]
+    assert uno["a.npz"]["alerta"].any()
+    for nombre in uno:
+        assert uno[nombre].keys() == varios[nombre].keys()
+        for columna in uno[nombre]:
+            np.testing.assert_array_equal(uno[nombre][columna], varios[nombre][columna], err_msg=f"{nombre}: {columna}")
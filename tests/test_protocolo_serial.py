@@ -0,0 +1,46 @@
+from protocolo_serial import (INICIO, LARGO_TRAMA, NIVEL_SOMNOLENCIA, TIPO_ACK, TIPO_ALERTA, TIPO_LATIDO,
+                              DecodificadorTramas, codificarTrama, crc8)
+
+
+def test_crc8_valores_conocidos():
+    # CRC-8/SMBUS (polinomio 0x07, inicial 0): valor de referencia de "123456789"
+    assert crc8(b"123456789") == 0xF4
+    assert crc8(b"") == 0
+
+
+def test_codificar_trama():
+    trama = codificarTrama(TIPO_ALERTA, 7, NIVEL_SOMNOLENCIA)
+    assert len(trama) == LARGO_TRAMA
+    assert trama[0] == INICIO
+    assert trama[1:4] == bytes((TIPO_ALERTA, 7, NIVEL_SOMNOLENCIA))
+    assert trama[4] == crc8(trama[1:4])
+
+
+def test_ida_y_vuelta():
+    enviadas = [(TIPO_ALERTA, secuencia, secuencia % 3) for secuencia in range(256)]
+    enviadas += [(TIPO_LATIDO, 0, 0), (TIPO_ACK, 255, NIVEL_SOMNOLENCIA)]
+    flujo = b"".join(codificarTrama(*trama) for trama in enviadas)
+    decodificador = DecodificadorTramas()
+    assert decodificador.agregar(flujo) == enviadas
+    assert decodificador.errores_crc == 0
+
+
+def test_secuencia_desborda_en_un_byte():
+    assert DecodificadorTramas().agregar(codificarTrama(TIPO_ALERTA, 256 + 5, 1)) == [(TIPO_ALERTA, 5, 1)]
+
+
+def test_tramas_cortadas_y_texto():
+    trama = codificarTrama(TIPO_ACK, 42, NIVEL_SOMNOLENCIA)
+    decodificador = DecodificadorTramas()
+    # Texto del sketch anterior y bytes sueltos antes de una trama que llega en partes
+    assert decodificador.agregar(b"listo\r\n1" + trama[:2]) == []
+    assert decodificador.agregar(trama[2:]) == [(TIPO_ACK, 42, NIVEL_SOMNOLENCIA)]
+
+
+def test_crc_invalido_resincroniza():
+    buena = codificarTrama(TIPO_ALERTA, 3, 1)
+    corrupta = bytearray(codificarTrama(TIPO_ALERTA, 2, 1))
+    corrupta[3] ^= 0xFF
+    decodificador = DecodificadorTramas()
+    assert decodificador.agregar(bytes(corrupta) + buena) == [(TIPO_ALERTA, 3, 1)]
+    assert decodificador.errores_crc == 1
@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+
+from backends_landmarks import MallaSintetica
+from grabacion_landmarks import (FRAME_CORTE, FRAME_DESCARTADO, FRAME_REPETIDO, leerGrabacion, reproducir,
+                                 resumirReproduccion)
+
+from conftest import DURACION, FPS
+
+PERIODO = 1 / FPS
+
+
+def test_grabacion_completa(grabacion_sintetica):
+    grabacion = leerGrabacion(grabacion_sintetica)
+    assert len(grabacion) == int(DURACION * FPS)
+    assert grabacion["rostro"].sum() == len(grabacion) - int(1.5 * FPS)
+
+
+def test_tiempos_de_alerta(grabacion_sintetica):
+    intervalos = resumirReproduccion(reproducir(grabacion_sintetica, umbral_ear=0.2, umbral_tiempo=1.0))
+    # El cierre corto (0.8 s) no alerta y el corte de rostro a los 21 s reinicia la cuenta:
+    # la segunda alerta llega un umbral después de que vuelve el rostro a los 21.5 s.
+    # El suavizado de 3 frames demora el cierre hasta 2 frames.
+    assert len(intervalos) == 2
+    for (inicio, fin), (esperado_inicio, esperado_fin) in zip(intervalos, [(6.0, 7.5), (22.5, 23.0)]):
+        assert esperado_inicio <= inicio <= esperado_inicio + 2 * PERIODO
+        assert esperado_fin - PERIODO <= fin <= esperado_fin + 2 * PERIODO
+
+
+def test_sin_alerta_con_umbral_largo(grabacion_sintetica):
+    intervalos = resumirReproduccion(reproducir(grabacion_sintetica, umbral_ear=0.2, umbral_tiempo=3.0))
+    assert intervalos == []
+
+
+class CapturaGuionada:
+    """
+    Fuente con marcas de tiempo de un reloj fijo a FPS: frames con textura, un tramo oscuro
+    (el filtro de calidad los descarta) y una lectura fallida (corte del stream).
+    """
+    rgb = False
+    intervalo_minimo = 0.0
+
+    def __init__(self, duracion, oscuro=(), cortes=()):
+        azar = np.random.default_rng(0)
+        self._normal = azar.integers(60, 200, (240, 320, 3), dtype=np.uint8)
+        self._oscuro = self._normal // 20
+        self._frames = int(duracion * FPS)
+        self._oscuro_desde, self._oscuro_hasta = oscuro
+        self._cortes = set(cortes)
+        self._indice = 0
+
+    @property
+    def finalizada(self):
+        return self._indice >= self._frames
+
+    def leer(self):
+        indice = self._indice
+        self._indice += 1
+        if indice >= self._frames or indice in self._cortes:
+            return False, None, None
+        tiempo = self.tiempo = 1.0 + indice / FPS
+        oscuro = self._oscuro_desde <= tiempo < self._oscuro_hasta
+        return True, (self._oscuro if oscuro else self._normal).copy(), tiempo
+
+
+class MallaSegunCaptura(MallaSintetica):
+    """
+    MallaSintetica que sigue el guion según la marca del último frame leído de la captura, así
+    los frames que no se infieren no lo atrasan.
+    """
+    def __init__(self, captura, **opciones):
+        super().__init__(**opciones)
+        self.captura = captura
+
+    def detectar(self, frame_rgb, destino=None):
+        self.frame = round((self.captura.tiempo - 1.0) * self.fps)
+        return super().detectar(frame_rgb, destino)
+
+
+class ArduinoNulo:
+    def enviar_senal(self, *argumentos):
+        pass
+
+
+def test_reproduccion_igual_a_la_sesion_en_vivo(tmp_path, monkeypatch):
+    import main
+    from calibracion import CalibracionConductor
+    from calidad_frame import FiltroCalidad
+    from planificador import PlanificadorInferencia
+    from registro_sesion import leerSesion
+
+    monkeypatch.setattr(main, "DIRECTORIO_SESIONES", str(tmp_path))
+    monkeypatch.setattr(main, "GRABAR_LANDMARKS", True)
+    monkeypatch.setattr(main, "graficarSesion", lambda *argumentos, **opciones: False)
+    # Ojos más abiertos que el umbral predeterminado: la calibración lo cambia a mitad de sesión
+    captura = CapturaGuionada(30.0, oscuro=(11.0, 12.0), cortes=(int(19.5 * FPS),))
+    malla = MallaSegunCaptura(captura, fps=FPS, cierres=((6.0, 8.5), (14.0, 14.6), (18.0, 21.0)),
+                              sin_rostro=((24.0, 25.0),), ear_abierto=0.4)
+    calibracion = CalibracionConductor("prueba", ruta=str(tmp_path / "calibracion.json"), duracion=2.0)
+    main.analisisVideo(captura, malla, ArduinoNulo(),
+                       headless=True, planificador=PlanificadorInferencia(retardo_maximo=0.1), calibracion=calibracion,
+                       filtroCalidad=FiltroCalidad())
+
+    (ruta_sesion,) = tmp_path.glob("*.bin")
+    (ruta_grabacion,) = tmp_path.glob("*.lmk")
+    en_vivo = leerSesion(str(ruta_sesion))
+    grabacion = leerGrabacion(str(ruta_grabacion))
+    tipos = np.bincount(grabacion["tipo"], minlength=4)
+    # La sesión tuvo de todo: frames repetidos, descartados por calidad, un corte y calibración
+    assert tipos[FRAME_REPETIDO] > 0 and tipos[FRAME_DESCARTADO] > 0 and tipos[FRAME_CORTE] == 1
+    assert calibracion.completa and calibracion.umbral_ear != pytest.approx(0.2)
+
+    reproduccion = reproducir(str(ruta_grabacion))
+    reproduccion = reproduccion[grabacion["tipo"] != FRAME_CORTE]
+    assert len(reproduccion) == len(en_vivo)
+    np.testing.assert_array_equal(reproduccion["tiempo"], en_vivo["tiempo"])
+    np.testing.assert_array_equal(reproduccion["alerta"], en_vivo["alerta"])
+    np.testing.assert_array_equal(reproduccion["ojos_cerrados"], en_vivo["ojos_cerrados"])
+    np.testing.assert_allclose(reproduccion["ear"], en_vivo["ear"], rtol=1e-6)
+    np.testing.assert_allclose(reproduccion["perclos"], en_vivo["perclos"], rtol=1e-6)
+    assert len(resumirReproduccion(reproduccion)) >= 2
@@ -0,0 +1,48 @@
+import time
+
+import numpy as np
+import pytest
+
+from backends_landmarks import MallaSintetica
+from tuberia import TuberiaEtapas
+
+
+class CapturaFalsa:
+    """
+    Fuente de frames negros que no termina nunca, con la interfaz que usa la tubería.
+    """
+    rgb = False
+    finalizada = False
+
+    def __init__(self):
+        self._frame = np.zeros((120, 160, 3), dtype=np.uint8)
+
+    def leer(self):
+        time.sleep(0.001)
+        return True, self._frame, time.perf_counter()
+
+
+class BackendRoto(MallaSintetica):
+    def detectar(self, frame_rgb, destino=None):
+        raise RuntimeError("backend roto")
+
+
+def test_entrega_frames_en_orden():
+    tuberia = TuberiaEtapas(CapturaFalsa(), [MallaSintetica(), MallaSintetica()])
+    tuberia.iniciar()
+    try:
+        secuencias = [tuberia.leer().secuencia for _ in range(20)]
+    finally:
+        tuberia.detener()
+    assert secuencias == list(range(20))
+
+
+def test_error_de_una_etapa_llega_a_leer():
+    tuberia = TuberiaEtapas(CapturaFalsa(), [BackendRoto()])
+    tuberia.iniciar()
+    try:
+        with pytest.raises(RuntimeError, match="backend roto"):
+            for _ in range(10):
+                tuberia.leer(timeout=0.5)
+    finally:
+        tuberia.detener()
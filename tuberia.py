@@ -0,0 +1,268 @@
+import queue
+import threading
+import time
+
+import cv2 # Opencv
+import numpy as np
+
+from analisis_facial import NUM_PUNTOS_MALLA
+from buffers_frames import PoolBuffers
+from metricas import REGISTRO, latenciaEtapa
+
+LATENCIA_CAPTURA = latenciaEtapa("captura")
+LATENCIA_PREPROCESO = latenciaEtapa("preproceso")
+LATENCIA_INFERENCIA = latenciaEtapa("inferencia")
+
+
+def profundidadCola(cola, registro=REGISTRO):
+    """
+    Medidor de los elementos que esperan en una cola entre etapas, con la etiqueta cola="...".
+    """
+    return registro.medidor("somnolencia_profundidad_cola", "Elementos esperando en cada cola entre etapas",
+                            {"cola": cola})
+
+
+class FrameEnCurso:
+    """
+    Un frame en su recorrido por la tubería, con lo que cada etapa le agrega.
+    """
+    __slots__ = ("secuencia", "estado", "frame", "tiempo_captura", "frame_rgb", "motivo_omision",
+                 "puntos", "confianza", "periodo")
+
+    def __init__(self, secuencia, estado, frame=None, tiempo_captura=None):
+        self.secuencia = secuencia
+        self.estado = estado
+        self.frame = frame # BGR (o RGB si la fuente lo entrega así) ya espejado
+        self.tiempo_captura = tiempo_captura
+        self.frame_rgb = None
+        self.motivo_omision = None # "planificador" o un motivo del filtro de calidad si no se infiere
+        self.puntos = None
+        self.confianza = 0.0
+        self.periodo = 0.0 # Tiempo por frame de la etapa más lenta que recorrió
+
+
+class TuberiaEtapas:
+    """
+    Captura, preproceso e inferencia en hilos propios unidos por colas acotadas, para que cada
+    etapa trabaje sobre un frame distinto a la vez. El análisis, que tiene estado (temporizador,
+    PERCLOS, planificador), queda en el hilo que llama a leer().
+
+    - captura: lee de la Captura y copia el frame (espejado si corresponde) a un buffer propio,
+      porque el de la Captura vale solo hasta la próxima lectura.
+    - preproceso: decide con el planificador y el filtro de calidad si el frame se infiere y lo
+      convierte a RGB. Ambos se actualizan desde el análisis y toman un lock; sus decisiones
+      se adelantan a los resultados hasta lo que esperan las colas (ver PlanificadorInferencia
+      para cómo cambia la cota de retraso).
+    - inferencia: uno o más hilos, cada uno con su propio backend de puntos faciales. OpenCV y
+      MediaPipe sueltan el GIL mientras calculan, así que los hilos corren en núcleos distintos.
+
+    Con más de un hilo de inferencia los resultados llegan desordenados: leer() los devuelve en
+    el orden de captura. Cada cola admite `tamano_cola` frames y, si se llena, la etapa anterior
+    espera; la espera llega hasta la captura, que sigue descartando los frames viejos, así que
+    la latencia agregada queda acotada por el largo de las colas. La profundidad de cada cola se
+    publica en somnolencia_profundidad_cola.
+
+    Con FaceMesh en varios hilos cada instancia sigue el rostro solo en los frames que le tocan;
+    con uno solo el seguimiento es el mismo que sin tubería.
+
+    Si una etapa lanza una excepción, la tubería se detiene y leer() la vuelve a lanzar en el
+    hilo del análisis, en lugar de quedar esperando frames que ya no van a llegar.
+    """
+    def __init__(self, captura, backends, planificador=None, rotacion=1, tamano_cola=2, filtro_calidad=None):
+        """
+        Args:
+            captura (Captura): Fuente de frames ya abierta.
+            backends (list): Un backend de puntos faciales por hilo de inferencia.
+            planificador (PlanificadorInferencia, opcional): Decide qué frames se infieren.
+            rotacion (int): Código de cv2.flip aplicado a cada frame (0 para no espejar).
+            tamano_cola (int): Frames que admite cada cola entre etapas.
+            filtro_calidad (FiltroCalidad, opcional): Omite los frames repetidos, oscuros o movidos.
+        """
+        self.captura = captura
+        self.backends = list(backends)
+        self.planificador = planificador
+        self.filtro_calidad = filtro_calidad
+        self.rotacion = rotacion
+        self._colas = {nombre: queue.Queue(maxsize=tamano_cola) for nombre in ("preproceso", "inferencia", "analisis")}
+        self._profundidades = {nombre: profundidadCola(nombre) for nombre in self._colas}
+        self._profundidades["reorden"] = profundidadCola("reorden")
+        en_vuelo = 3 * tamano_cola + len(self.backends) + 2
+        self._frames = PoolBuffers(maximo_libres=en_vuelo)
+        self._frames_rgb = PoolBuffers(maximo_libres=en_vuelo)
+        self._puntos = PoolBuffers(maximo_libres=en_vuelo)
+        self._pendientes = {} # secuencia -> FrameEnCurso llegado antes de su turno
+        self._siguiente = 0
+        self._entregado = None
+        self._detener = threading.Event()
+        self._hilos = []
+        self._error = None # Primera excepción de una etapa
+
+    @property
+    def rgb(self):
+        return self.captura.rgb
+
+    @property
+    def finalizada(self):
+        return self.captura.finalizada
+
+    def iniciar(self):
+        etapas = [("Captura", self._etapaCaptura), ("Preproceso", self._etapaPreproceso)]
+        etapas += [(f"Inferencia{i}", lambda backend=backend: self._etapaInferencia(backend))
+                   for i, backend in enumerate(self.backends)]
+        for nombre, objetivo in etapas:
+            hilo = threading.Thread(target=self._ejecutarEtapa, args=(objetivo,), name=f"Tuberia{nombre}",
+                                    daemon=True)
+            hilo.start()
+            self._hilos.append(hilo)
+
+    def _ejecutarEtapa(self, etapa):
+        """
+        Corre una etapa; si falla guarda la excepción para leer() y detiene las demás.
+        """
+        try:
+            etapa()
+        except Exception as e:
+            if self._error is None:
+                self._error = e
+            print(f"Error en la etapa {threading.current_thread().name}: {e}")
+            self._detener.set()
+
+    def fijarEscala(self, escala):
+        for backend in self.backends:
+            backend.escala = escala
+
+    def _poner(self, nombre, elemento):
+        """
+        Encola esperando mientras la cola esté llena. Devuelve False si se pidió detener.
+        """
+        cola = self._colas[nombre]
+        while not self._detener.is_set():
+            try:
+                cola.put(elemento, timeout=0.1)
+            except queue.Full:
+                continue
+            self._profundidades[nombre].fijar(cola.qsize())
+            return True
+        return False
+
+    def _sacar(self, nombre, timeout=0.1):
+        cola = self._colas[nombre]
+        try:
+            elemento = cola.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        self._profundidades[nombre].fijar(cola.qsize())
+        return elemento
+
+    def _etapaCaptura(self):
+        secuencia = 0
+        while not self._detener.is_set():
+            inicio = time.perf_counter()
+            estado, frame, tiempo_captura = self.captura.leer()
+            if not estado:
+                # El fallo también recorre la tubería para llegar al análisis en su lugar
+                self._poner("preproceso", FrameEnCurso(secuencia, False))
+                secuencia += 1
+                if self.captura.finalizada:
+                    return
+                continue
+            LATENCIA_CAPTURA.observar(time.perf_counter() - inicio)
+            copia = self._frames.tomar(frame.shape)
+            if self.rotacion != 0:
+                cv2.flip(frame, self.rotacion, dst=copia)
+            else:
+                np.copyto(copia, frame)
+            if not self._poner("preproceso", FrameEnCurso(secuencia, True, copia, tiempo_captura)):
+                return
+            secuencia += 1
+
+    def _etapaPreproceso(self):
+        while not self._detener.is_set():
+            elemento = self._sacar("preproceso")
+            if elemento is None:
+                continue
+            if elemento.estado:
+                inicio = time.perf_counter()
+                if self.planificador is not None and not self.planificador.debeInferir(elemento.tiempo_captura):
+                    elemento.motivo_omision = "planificador"
+                elif self.filtro_calidad is not None:
+                    cada_frame = self.planificador is not None and self.planificador.cadaFrame()
+                    elemento.motivo_omision = self.filtro_calidad.evaluar(elemento.frame, elemento.tiempo_captura,
+                                                                          cada_frame)
+                if elemento.motivo_omision is None:
+                    if self.captura.rgb:
+                        elemento.frame_rgb = elemento.frame # La fuente (pantalla) ya entrega RGB
+                    else:
+                        elemento.frame_rgb = cv2.cvtColor(elemento.frame, cv2.COLOR_BGR2RGB,
+                                                          dst=self._frames_rgb.tomar(elemento.frame.shape))
+                    elemento.periodo = time.perf_counter() - inicio
+                    LATENCIA_PREPROCESO.observar(elemento.periodo)
+            self._poner("inferencia", elemento)
+
+    def _etapaInferencia(self, backend):
+        while not self._detener.is_set():
+            elemento = self._sacar("inferencia")
+            if elemento is None:
+                continue
+            if elemento.estado and elemento.motivo_omision is None:
+                inicio = time.perf_counter()
+                destino = self._puntos.tomar((NUM_PUNTOS_MALLA, 2), np.float32)
+                elemento.puntos, elemento.confianza = backend.detectar(elemento.frame_rgb, destino)
+                if elemento.puntos is None:
+                    self._puntos.devolver(destino)
+                if elemento.frame_rgb is not elemento.frame:
+                    self._frames_rgb.devolver(elemento.frame_rgb)
+                elemento.frame_rgb = None
+                duracion = time.perf_counter() - inicio
+                LATENCIA_INFERENCIA.observar(duracion)
+                # Con varios hilos de inferencia la etapa entrega un frame cada duracion / hilos
+                elemento.periodo = max(elemento.periodo, duracion / len(self.backends))
+            self._poner("analisis", elemento)
+
+    def leer(self, timeout=1.0):
+        """
+        Devuelve el siguiente frame en orden de captura, ya inferido si correspondía.
+
+        Igual que con Captura, el frame y sus puntos son válidos hasta la próxima llamada a
+        leer(): después sus buffers vuelven a los pools.
+
+        Returns:
+            FrameEnCurso: Con estado False si no llegó ningún frame en `timeout` segundos.
+
+        Raises:
+            Exception: La excepción con la que falló una etapa.
+        """
+        if self._error is not None:
+            raise self._error
+        self._reciclar(self._entregado)
+        self._entregado = None
+        limite = time.perf_counter() + timeout
+        while self._siguiente not in self._pendientes:
+            restante = limite - time.perf_counter()
+            elemento = self._sacar("analisis", timeout=max(0.0, restante)) if restante > 0 else None
+            if elemento is None:
+                if self._error is not None:
+                    raise self._error
+                return FrameEnCurso(self._siguiente, False)
+            self._pendientes[elemento.secuencia] = elemento
+        elemento = self._pendientes.pop(self._siguiente)
+        self._profundidades["reorden"].fijar(len(self._pendientes))
+        self._siguiente += 1
+        self._entregado = elemento
+        return elemento
+
+    def _reciclar(self, elemento):
+        if elemento is None or not elemento.estado:
+            return
+        self._frames.devolver(elemento.frame)
+        if elemento.puntos is not None:
+            self._puntos.devolver(elemento.puntos)
+
+    def detener(self):
+        """
+        Detiene las etapas. La captura y los backends los libera quien los creó.
+        """
+        self._detener.set()
+        for hilo in self._hilos:
+            hilo.join(timeout=2)
+        self._hilos = []
@@ -0,0 +1,132 @@
+import threading
+import time
+
+import cv2 # Opencv
+import numpy as np
+
+# Fuente de texto para OpenCV
+fuente = cv2.FONT_ITALIC
+
+
+def dibujarEstado(frame, texto_estado, color_estado, fps):
+    """
+    Dibuja sobre el frame el estado del conductor y los FPS.
+    """
+    cv2.putText(frame, text=texto_estado, org=(10, 30), fontFace=fuente,
+                fontScale=0.8, color=color_estado, thickness=2, lineType=cv2.LINE_AA)
+    cv2.putText(frame, text=f'FPS: {int(fps)}', org=(frame.shape[1] - 120, 30), fontFace=fuente,
+                fontScale=0.8, color=(255, 255, 0), thickness=2, lineType=cv2.LINE_AA)
+
+
+def dibujarMalla(frame, puntos, conexiones, color=(255, 255, 0)):
+    """
+    Dibuja los contornos de la malla facial a partir de los puntos en píxeles.
+
+    Args:
+        frame (np.ndarray): Frame BGR sobre el que se dibuja.
+        puntos (np.ndarray): Arreglo (468, 2) de coordenadas del frame.
+        conexiones: Pares (i, j) de índices a unir, e.g. FACEMESH_CONTOURS.
+    """
+    enteros = puntos.astype(np.int32)
+    lineas = [np.array((enteros[i], enteros[j])) for i, j in conexiones]
+    cv2.polylines(frame, lineas, isClosed=False, color=color, thickness=1, lineType=cv2.LINE_AA)
+
+
+class VistaPrevia:
+    """
+    Ventana de depuración que se dibuja en un hilo aparte a una tasa limitada.
+
+    El bucle de detección publica el frame y su estado; el texto, la malla, imshow y waitKey
+    corren en este hilo, así que el costo del dibujo nunca cae sobre el camino de detección.
+    Como el bucle reutiliza sus buffers, publicar() guarda una copia reducida del frame, pero solo
+    cuando toca refrescar: los frames publicados entre dos refrescos se ignoran sin copiarlos.
+    """
+    nombre_ventana = "Detector de Somnolencia - Vista previa (ESC para salir)"
+
+    def __init__(self, fps_maximo=5, escala=0.5, detener=None, conexiones=None, rgb=False):
+        """
+        Args:
+            fps_maximo (float): Refrescos por segundo como máximo.
+            escala (float): Factor de reducción del frame mostrado.
+            detener (threading.Event, opcional): Evento que se activa al presionar ESC.
+            conexiones: Pares de puntos de la malla a dibujar con la tecla 'q'.
+            rgb (bool): Si los frames publicados vienen en RGB en lugar de BGR.
+        """
+        self.periodo = 1.0 / fps_maximo
+        self.escala = escala
+        self.detener = detener
+        self.conexiones = conexiones
+        self.rgb = rgb
+        self.verMalla = False
+        self._ultimo = None
+        self._lock = threading.Lock()
+        self._esperando = threading.Event() # El hilo espera un frame nuevo
+        self._esperando.set()
+        self._activo = threading.Event()
+        self._hilo = None
+
+    def iniciar(self):
+        """
+        Arranca el hilo de la vista previa.
+        """
+        self._activo.set()
+        self._hilo = threading.Thread(target=self._bucle, name="VistaPrevia", daemon=True)
+        self._hilo.start()
+
+    def publicar(self, frame, texto_estado, color_estado, fps, puntos=None):
+        """
+        Entrega a la vista previa el frame más reciente. Si la vista previa no espera un frame
+        nuevo no hace nada; si lo espera, copia el frame reducido (no dibuja nada).
+        """
+        if not self._esperando.is_set():
+            return
+        if self.escala != 1.0:
+            frame = cv2.resize(frame, None, fx=self.escala, fy=self.escala, interpolation=cv2.INTER_AREA)
+        else:
+            frame = frame.copy()
+        if self.rgb:
+            cv2.cvtColor(frame, cv2.COLOR_RGB2BGR, dst=frame) # Sobre la copia reducida
+        self._esperando.clear()
+        with self._lock:
+            self._ultimo = (frame, texto_estado, color_estado, fps, puntos)
+
+    def _bucle(self):
+        siguiente = time.monotonic()
+        while self._activo.is_set():
+            with self._lock:
+                ultimo, self._ultimo = self._ultimo, None
+
+            if ultimo is not None:
+                # El frame ya es una copia reducida propia: se dibuja directo sobre él
+                frame, texto_estado, color_estado, fps, puntos = ultimo
+                if self.verMalla and puntos is not None and self.conexiones is not None:
+                    dibujarMalla(frame, puntos * self.escala, self.conexiones)
+                dibujarEstado(frame, texto_estado, color_estado, fps)
+                cv2.imshow(self.nombre_ventana, frame)
+
+            tecla = cv2.waitKey(1) & 0xFF
+            if tecla == ord('q'):
+                self.verMalla = not self.verMalla
+                print(f"Mostrar malla: {'Activado' if self.verMalla else 'Desactivado'}")
+            elif tecla == 27 and self.detener is not None:
+                print("Tecla ESC presionada en la vista previa. Saliendo...")
+                self.detener.set()
+
+            siguiente += self.periodo
+            self._esperando.set()
+            espera = siguiente - time.monotonic()
+            if espera > 0:
+                time.sleep(espera)
+            else:
+                siguiente = time.monotonic()
+
+        cv2.destroyWindow(self.nombre_ventana)
+
+    def liberar(self):
+        """
+        Detiene el hilo y cierra la ventana.
+        """
+        self._activo.clear()
+        if self._hilo is not None:
+            self._hilo.join(timeout=2)
+            self._hilo = None